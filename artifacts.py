@@ -0,0 +1,362 @@
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from metrics import Counter, Gauge, METRICS
+from shared_state import connect
+
+# Artifact store configuration (0 disables a limit)
+ARTIFACTS_DIR = os.environ.get("ARTIFACTS_DIR", "generated_ppts")
+ARTIFACTS_MAX_BYTES = int(os.environ.get("ARTIFACTS_MAX_BYTES", str(512 * 1024 * 1024)))
+ARTIFACTS_MAX_AGE = float(os.environ.get("ARTIFACTS_MAX_AGE", str(7 * 24 * 3600)))  # Since last use
+ARTIFACTS_MAX_COUNT = int(os.environ.get("ARTIFACTS_MAX_COUNT", "2000"))
+# Seconds between background cleanup runs
+ARTIFACTS_CLEANUP_INTERVAL = float(os.environ.get("ARTIFACTS_CLEANUP_INTERVAL", "300"))
+# Seconds a started download protects its file from cleanup in every worker
+ARTIFACTS_DOWNLOAD_LEASE = float(os.environ.get("ARTIFACTS_DOWNLOAD_LEASE", "600"))
+# Also persist decks returned directly by /ppt, so they can be downloaded again by ID (jobs always persist their results)
+PPT_PERSIST = os.environ.get("PPT_PERSIST", "true").lower() in ("1", "true", "yes")
+
+ARTIFACT_ID_PATTERN = re.compile(r"[0-9a-f]{64}")
+INDEX_FILENAME = "index.sqlite3"
+# Unfinished writes older than this are left over from a crash
+STALE_TMP_AGE = 3600
+
+ARTIFACTS_STORED = Gauge("artifacts_stored", "Artifacts kept in the artifact store")
+ARTIFACTS_STORED_BYTES = Gauge("artifacts_stored_bytes", "Total size of the artifacts kept in the artifact store")
+ARTIFACTS_EVICTED = Counter("artifacts_evicted_total", "Artifacts removed by the retention limits", ("reason",))
+METRICS.extend([ARTIFACTS_STORED, ARTIFACTS_STORED_BYTES, ARTIFACTS_EVICTED])
+
+class ArtifactStore:
+    """
+    Content-addressed store for generated files with an index and retention limits.
+
+    Files are named by the SHA-256 of their bytes, so identical decks are
+    stored once and concurrent writes never collide. A SQLite index next to
+    the files records each artifact's size, template, creation time and last
+    download. Artifacts unused for max_age are removed, then the least
+    recently used ones until at most max_count are left and they fit in
+    max_bytes; limits are checked on every write and by a background task.
+    An artifact being downloaded is never removed.
+    """
+
+    def __init__(
+        self,
+        directory: str = ARTIFACTS_DIR,
+        max_bytes: int = ARTIFACTS_MAX_BYTES,
+        max_age: float = ARTIFACTS_MAX_AGE,
+        max_count: int = ARTIFACTS_MAX_COUNT,
+        download_lease: float = ARTIFACTS_DOWNLOAD_LEASE
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_count = max_count
+        self.download_lease = download_lease
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._downloading: dict[str, int] = {}  # Downloads in progress in this process, by file name
+        self._task: asyncio.Task | None = None
+
+    def _db(self) -> sqlite3.Connection:
+        """Open the index on first use (call with the lock held)"""
+        if self._conn is None:
+            os.makedirs(self.directory, exist_ok=True)
+            conn = connect(os.path.join(self.directory, INDEX_FILENAME))
+            conn.row_factory = sqlite3.Row
+            with conn:
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS artifacts (
+                        id TEXT NOT NULL,
+                        suffix TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        template TEXT,
+                        created REAL NOT NULL,
+                        last_access REAL NOT NULL,
+                        last_download REAL,
+                        downloads INTEGER NOT NULL DEFAULT 0,
+                        leased_until REAL NOT NULL DEFAULT 0,
+                        render_key TEXT,
+                        PRIMARY KEY (id, suffix)
+                    )"""
+                )
+                columns = {row["name"] for row in conn.execute("PRAGMA table_info(artifacts)")}
+                if "render_key" not in columns:
+                    conn.execute("ALTER TABLE artifacts ADD COLUMN render_key TEXT")
+                conn.execute("CREATE INDEX IF NOT EXISTS artifacts_last_access ON artifacts (last_access)")
+                conn.execute("CREATE INDEX IF NOT EXISTS artifacts_render_key ON artifacts (render_key)")
+            self._conn = conn
+        return self._conn
+
+    def _file(self, artifact_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, artifact_id + suffix)
+
+    def put(
+        self,
+        data: bytes,
+        suffix: str = ".pptx",
+        template: str | None = None,
+        render_key: str | None = None
+    ) -> str:
+        """
+        Store bytes and return their artifact ID.
+
+        Args:
+            data: File contents
+            suffix: File extension
+            template: Template the deck was rendered with, for the index
+            render_key: Identity of the rendered deck (see ppt_renderer.render_key),
+                so find_render can serve it instead of rendering it again
+        """
+        artifact_id = hashlib.sha256(data).hexdigest()
+        path = self._file(artifact_id, suffix)
+        os.makedirs(self.directory, exist_ok=True)
+        if not os.path.exists(path):
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        now = time.time()
+        with self._lock, self._db() as conn:
+            conn.execute(
+                "INSERT INTO artifacts (id, suffix, size, template, created, last_access, render_key) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (id, suffix) DO UPDATE SET last_access = excluded.last_access, "
+                "template = COALESCE(artifacts.template, excluded.template), "
+                "render_key = COALESCE(excluded.render_key, artifacts.render_key)",
+                (artifact_id, suffix, len(data), template, now, now, render_key)
+            )
+        self.evict(keep=(artifact_id, suffix))
+        return artifact_id
+
+    def path(self, artifact_id: str, suffix: str = ".pptx") -> str | None:
+        """Return the file path for an artifact, or None if it is not stored"""
+        if not ARTIFACT_ID_PATTERN.fullmatch(artifact_id):
+            return None
+        with self._lock:
+            row = self._db().execute(
+                "SELECT 1 FROM artifacts WHERE id = ? AND suffix = ?", (artifact_id, suffix)
+            ).fetchone()
+        path = self._file(artifact_id, suffix)
+        return path if row is not None and os.path.exists(path) else None
+
+    def find_render(self, render_key: str, suffix: str = ".pptx") -> tuple[str, bytes] | None:
+        """
+        Look up a stored deck by its render key.
+
+        Returns:
+            (artifact ID, file contents), or None if no identical deck is stored
+        """
+        with self._lock, self._db() as conn:
+            row = conn.execute(
+                "SELECT id FROM artifacts WHERE render_key = ? AND suffix = ? ORDER BY last_access DESC LIMIT 1",
+                (render_key, suffix)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE artifacts SET last_access = ? WHERE id = ? AND suffix = ?",
+                (time.time(), row["id"], suffix)
+            )
+        try:
+            with open(self._file(row["id"], suffix), "rb") as f:
+                return row["id"], f.read()
+        except FileNotFoundError:
+            return None
+
+    def info(self, artifact_id: str, suffix: str = ".pptx") -> dict | None:
+        """Index record of an artifact, or None if it is not stored"""
+        if not ARTIFACT_ID_PATTERN.fullmatch(artifact_id):
+            return None
+        with self._lock:
+            row = self._db().execute(
+                "SELECT * FROM artifacts WHERE id = ? AND suffix = ?", (artifact_id, suffix)
+            ).fetchone()
+        return describe(row) if row is not None else None
+
+    def list(self, limit: int = 100) -> list[dict]:
+        """Index records of the most recently used artifacts"""
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT * FROM artifacts ORDER BY last_access DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [describe(row) for row in rows]
+
+    def open_download(self, artifact_id: str, suffix: str = ".pptx") -> str | None:
+        """
+        Start a download: record it and protect the file from cleanup.
+
+        Call close_download when the response has been sent. The file stays
+        protected in other workers for download_lease seconds.
+
+        Returns:
+            The file path, or None if the artifact is not stored
+        """
+        if not ARTIFACT_ID_PATTERN.fullmatch(artifact_id):
+            return None
+        now = time.time()
+        path = self._file(artifact_id, suffix)
+        with self._lock, self._db() as conn:
+            cursor = conn.execute(
+                "UPDATE artifacts SET last_access = ?, last_download = ?, downloads = downloads + 1, "
+                "leased_until = MAX(leased_until, ?) WHERE id = ? AND suffix = ?",
+                (now, now, now + self.download_lease, artifact_id, suffix)
+            )
+            if cursor.rowcount == 0 or not os.path.exists(path):
+                return None
+            name = artifact_id + suffix
+            self._downloading[name] = self._downloading.get(name, 0) + 1
+        return path
+
+    def close_download(self, artifact_id: str, suffix: str = ".pptx"):
+        """Finish a download started with open_download"""
+        name = artifact_id + suffix
+        with self._lock:
+            if self._downloading.get(name, 0) <= 1:
+                self._downloading.pop(name, None)
+            else:
+                self._downloading[name] -= 1
+
+    def evict(self, keep: tuple[str, str] | None = None) -> int:
+        """
+        Remove artifacts unused for max_age, then least recently used ones until under quota.
+
+        Artifacts being downloaded, and `keep` (an (id, suffix) pair), are skipped.
+
+        Returns:
+            Number of artifacts removed
+        """
+        now = time.time()
+        removed = []
+        with self._lock, self._db() as conn:
+            # Hold the write lock so a download starting in another worker waits for the decision
+            conn.execute("BEGIN IMMEDIATE")
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM artifacts").fetchone()
+            rows = conn.execute(
+                "SELECT id, suffix, size, last_access FROM artifacts WHERE leased_until <= ? ORDER BY last_access",
+                (now,)
+            ).fetchall()
+            for row in rows:
+                name = row["id"] + row["suffix"]
+                if (row["id"], row["suffix"]) == keep or name in self._downloading:
+                    continue
+                if self.max_age > 0 and now - row["last_access"] > self.max_age:
+                    reason = "age"
+                elif self.max_count > 0 and count > self.max_count:
+                    reason = "count"
+                elif self.max_bytes > 0 and total > self.max_bytes:
+                    reason = "bytes"
+                else:
+                    break  # Rows are oldest first, so the rest are newer and within every limit
+                conn.execute("DELETE FROM artifacts WHERE id = ? AND suffix = ?", (row["id"], row["suffix"]))
+                removed.append((name, reason))
+                count -= 1
+                total -= row["size"]
+        for name, reason in removed:
+            self._remove(os.path.join(self.directory, name))
+            ARTIFACTS_EVICTED.inc(reason=reason)
+        ARTIFACTS_STORED.set(count)
+        ARTIFACTS_STORED_BYTES.set(total)
+        return len(removed)
+
+    def reconcile(self):
+        """
+        Bring the index in line with the directory.
+
+        Indexes files it does not know about (e.g. stored before the index
+        existed), drops entries whose file is gone, and removes unfinished
+        writes left by a crash.
+        """
+        if not os.path.isdir(self.directory):
+            return
+        now = time.time()
+        files = {}
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or entry.name.startswith(INDEX_FILENAME):
+                continue
+            stat = entry.stat()
+            if entry.name.endswith(".tmp"):
+                if now - stat.st_mtime > STALE_TMP_AGE:
+                    self._remove(entry.path)
+                continue
+            artifact_id, suffix = os.path.splitext(entry.name)
+            if ARTIFACT_ID_PATTERN.fullmatch(artifact_id):
+                files[(artifact_id, suffix)] = stat
+        with self._lock, self._db() as conn:
+            indexed = {(row["id"], row["suffix"]) for row in conn.execute("SELECT id, suffix FROM artifacts")}
+            conn.executemany(
+                "INSERT OR IGNORE INTO artifacts (id, suffix, size, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (artifact_id, suffix, stat.st_size, stat.st_mtime, stat.st_mtime)
+                    for (artifact_id, suffix), stat in files.items() if (artifact_id, suffix) not in indexed
+                ]
+            )
+            conn.executemany(
+                "DELETE FROM artifacts WHERE id = ? AND suffix = ? AND leased_until <= ?",
+                [(artifact_id, suffix, now) for artifact_id, suffix in indexed - files.keys()]
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = self._db().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM artifacts"
+            ).fetchone()
+        return {
+            "artifacts": count,
+            "bytes": total,
+            "max_count": self.max_count,
+            "max_bytes": self.max_bytes,
+            "max_age": self.max_age
+        }
+
+    def start(self, interval: float = ARTIFACTS_CLEANUP_INTERVAL):
+        """Start the background cleanup task"""
+        if self._task is None and interval > 0:
+            self._task = asyncio.create_task(self._cleanup(interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _cleanup(self, interval: float):
+        first = True
+        while True:
+            try:
+                # The directory is only scanned once; after that the index alone drives cleanup
+                if first:
+                    await asyncio.to_thread(self.reconcile)
+                    first = False
+                removed = await asyncio.to_thread(self.evict)
+                if removed:
+                    print(f"Artifact cleanup removed {removed} artifacts")
+            except (OSError, sqlite3.Error) as e:
+                print(f"Artifact cleanup failed: {e}")
+            await asyncio.sleep(interval)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def describe(row: sqlite3.Row) -> dict:
+    """Public view of an index record"""
+    return {
+        "artifact_id": row["id"],
+        "size": row["size"],
+        "template": row["template"],
+        "created": row["created"],
+        "last_access": row["last_access"],
+        "last_download": row["last_download"],
+        "downloads": row["downloads"],
+        "download_url": f"/artifacts/{row['id']}"
+    }
+
+artifact_store = ArtifactStore()
@@ -0,0 +1,431 @@
+"""
+Benchmark suite: load tests of the API against a local mock OpenAI server,
+plus micro-benchmarks of slide parsing, pptx rendering and the similarity cache, and a
+cold-startup measurement.
+
+    python bench.py                                     # every scenario, saved in bench_results/
+    python bench.py --scenarios blog-post ppt --concurrency 32 --requests 400
+    python bench.py --latency 0.5 --tokens-per-second 100 --error-rate 0.05
+    python bench.py --compare bench_results/<earlier run>.json
+    python bench.py --no-load --no-micro --startup-target 0.5
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+RESULTS_DIR = "bench_results"
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# name: (path, request body); every request bypasses the response cache so it reaches the model
+SCENARIOS = {
+    "blog-post": ("/blog-post", {"prompt": "Benefits of unit testing"}),
+    "blog-post-stream": ("/blog-post/stream", {"prompt": "Benefits of unit testing"}),
+    "facebook-post": ("/facebook-post", {"prompt": "Announce a new product", "context": "Smart fitness tracker"}),
+    "linkedin-post": ("/linkedin-post", {"prompt": "Share a lesson", "context": "Leading remote teams"}),
+    "whitepaper": ("/whitepaper", {"prompt": "Blockchain in supply chains"}),
+    "whitepaper-sectioned": ("/whitepaper", {"prompt": "Blockchain in supply chains", "sectioned": True}),
+    "ppt": ("/ppt", {"prompt": "Intro to ML", "context": "For beginners", "template": "professional_blue"}),
+    "ppt-stream": ("/ppt/stream", {"prompt": "Intro to ML", "context": "For beginners", "template": "professional_blue"}),
+    "campaign": ("/campaign", {"prompt": "Announce a new product", "context": "Smart fitness tracker"})
+}
+
+# Metrics compared across runs, and whether higher values are better
+COMPARED_METRICS = {
+    "rps": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "loop_lag_p99_ms": False,
+    "memory_per_request_kb": False,
+    "mean_ms": False,
+    "import_ms": False,
+    "ready_ms": False,
+    "warm_ms": False
+}
+
+# Run in a fresh interpreter: import the app, run its startup hooks, then warm it via /ready
+STARTUP_SCRIPT = """
+import asyncio, json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def run():
+    async with main.lifespan(main.app):
+        ready = time.perf_counter()
+        await main.ready(main.Response(), warm=True)
+        warmed = time.perf_counter()
+    print(json.dumps({
+        "import_ms": (imported - start) * 1000,
+        "ready_ms": (ready - start) * 1000,
+        "warm_ms": (warmed - ready) * 1000
+    }))
+
+if __name__ == "__main__":
+    asyncio.run(run())
+"""
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_mock_server(args) -> tuple[subprocess.Popen, str]:
+    """Run mock_openai.py in its own process so it doesn't compete with the app for the GIL"""
+    port = free_port()
+    process = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "mock_openai.py"),
+        "--port", str(port),
+        "--latency", str(args.latency),
+        "--tokens-per-second", str(args.tokens_per_second),
+        "--completion-tokens", str(args.completion_tokens),
+        "--error-rate", str(args.error_rate),
+        "--seed", "1"
+    ])
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Mock OpenAI server exited during startup")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return process, f"http://127.0.0.1:{port}/v1"
+        except OSError:
+            time.sleep(0.05)
+    process.terminate()
+    raise RuntimeError("Mock OpenAI server did not start")
+
+def configure_environment(base_url: str, workdir: str):
+    """Point the app at the mock server and keep its state out of the working tree"""
+    for name in ("AI_INTEGRATIONS_OPENAI_API_KEY", "AI_INTEGRATIONS_OPENAI_BASE_URL"):
+        os.environ.pop(name, None)
+    os.environ["OPENAI_API_KEY"] = "mock"
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("CACHE_BACKEND", "none")
+    os.environ.setdefault("JOBS_DB_PATH", os.path.join(workdir, "jobs.sqlite3"))
+    os.environ.setdefault("ARTIFACTS_DIR", os.path.join(workdir, "artifacts"))
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up a task that sleeps at a fixed interval"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: list[float] = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(time.perf_counter() - start - self.interval, 0.0))
+
+    def start(self):
+        self.samples = []
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> dict:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        return {
+            "loop_lag_mean_ms": round(sum(self.samples) / len(self.samples) * 1000, 3) if self.samples else 0.0,
+            "loop_lag_p99_ms": round(percentile(self.samples, 0.99) * 1000, 3),
+            "loop_lag_max_ms": round(max(self.samples, default=0.0) * 1000, 3)
+        }
+
+async def send(client, path: str, body: dict) -> tuple[float, int]:
+    start = time.perf_counter()
+    response = await client.post(path, json={**body, "cache": "bypass"})
+    await response.aread()
+    return time.perf_counter() - start, response.status_code
+
+async def run_scenario(client, name: str, requests: int, concurrency: int, memory: bool) -> dict:
+    """Send `requests` requests with at most `concurrency` in flight and summarize them"""
+    path, body = SCENARIOS[name]
+    latencies = []
+    statuses: dict[int, int] = {}
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            seconds, status = await send(client, path, body)
+            latencies.append(seconds)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    await send(client, path, body)  # Warm up connections, templates and worker processes
+    monitor = LoopLagMonitor()
+    monitor.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - start
+    lag = await monitor.stop()
+
+    result = {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": sum(count for status, count in statuses.items() if status >= 400),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "duration_s": round(duration, 3),
+        "rps": round(requests / duration, 2),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        **lag
+    }
+    if memory:
+        result["memory_per_request_kb"] = await measure_memory(client, path, body, concurrency)
+    return result
+
+async def measure_memory(client, path: str, body: dict, concurrency: int) -> float:
+    """
+    Peak Python heap growth per concurrent request.
+
+    Measured in a separate pass because tracing allocations slows requests
+    down; memory used by rendering worker processes is not included.
+    """
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        await asyncio.gather(*(send(client, path, body) for _ in range(concurrency)))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return round((peak - baseline) / concurrency / 1024, 1)
+
+async def run_load_tests(args) -> dict:
+    import httpx
+    import main
+
+    results = {}
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+            for name in args.scenarios:
+                print(f"Running {name} ({args.requests} requests, concurrency {args.concurrency})...")
+                results[name] = await run_scenario(client, name, args.requests, args.concurrency, args.memory)
+    return results
+
+def time_call(fn, number: int, repeat: int = 5) -> dict:
+    """Best-of-`repeat` mean time of `number` calls"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start) / number)
+    return {"calls": number, "mean_ms": round(best * 1000, 4)}
+
+def run_micro_benchmarks() -> dict:
+    from ppt_generator import parse_ai_slides, parse_slides
+    from ppt_renderer import render_presentation
+
+    slides = [
+        {"title": f"Slide {i + 1}", "content": [f"Bullet point {j + 1} with a few more words" for j in range(5)]}
+        for i in range(8)
+    ]
+    structured = json.dumps({"slides": slides})
+    fenced = f"Here is your deck:\n```json\n{structured}\n```"
+    truncated = structured[:int(len(structured) * 0.7)]
+
+    print("Running micro-benchmarks...")
+    results = {
+        "parse_ai_slides": time_call(lambda: parse_ai_slides(structured), 2000),
+        "parse_ai_slides_fenced": time_call(lambda: parse_ai_slides(fenced), 2000),
+        "parse_slides_truncated": time_call(lambda: parse_slides(truncated), 2000),
+        "render_presentation": time_call(lambda: render_presentation(slides, "professional_blue"), 10, repeat=3)
+    }
+    results.update(run_semantic_benchmarks())
+    return results
+
+def run_semantic_benchmarks(entries: int = 5000) -> dict:
+    """Similarity cache lookup and insert time on a full index, to set against upstream latency"""
+    from semantic_cache import SemanticCache, load_numpy
+    if not load_numpy():
+        print("NumPy is not installed; skipping similarity cache micro-benchmarks")
+        return {}
+
+    words = SCENARIOS["blog-post"][1]["prompt"].split() + "education health remote teams growth data".split()
+    semantic = SemanticCache(tempfile.mkdtemp(prefix="bench-semantic-"), capacity=entries)
+    for i in range(entries):
+        semantic.add("bench", f"{' '.join(words[i % len(words):])} topic {i}", 1, f"content {i}")
+    query = "Benefits of unit testing for remote teams"
+    return {
+        f"semantic_search_{entries}": time_call(lambda: semantic.search("bench", query, 1), 50),
+        "semantic_add": time_call(lambda: semantic.add("bench", query, 1, "content"), 50)
+    }
+
+def measure_startup(runs: int, target: float) -> dict:
+    """
+    Time cold starts of the app in fresh interpreters (best of `runs`).
+
+    import_ms is the time to import main, ready_ms adds the startup hooks
+    (when the worker can take requests) and warm_ms is the extra time to
+    create the OpenAI client and load the renderer via /ready?warm=true.
+    """
+    print(f"Measuring cold startup ({runs} runs)...")
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    startup = {metric: round(min(sample[metric] for sample in samples), 1) for metric in samples[0]}
+    startup["target_ms"] = round(target * 1000, 1)
+    startup["met"] = startup["ready_ms"] <= startup["target_ms"]
+    return {"cold": startup}
+
+def git_commit() -> str:
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True).stdout
+        return output + ("-dirty" if dirty.strip() else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def save_results(results: dict) -> str:
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(RESULTS_DIR, f"{stamp}-{results['commit']}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+def print_results(results: dict):
+    header = f"{'scenario':<22}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'lag p99':>10}{'KB/req':>9}{'errors':>8}"
+    if results["scenarios"]:
+        print("\n" + header)
+        print("-" * len(header))
+    for name, r in results["scenarios"].items():
+        memory = r.get("memory_per_request_kb", "-")
+        print(
+            f"{name:<22}{r['rps']:>9}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}"
+            f"{r['loop_lag_p99_ms']:>10}{memory:>9}{r['errors']:>8}"
+        )
+    if results["micro"]:
+        print(f"\n{'micro-benchmark':<32}{'mean ms':>12}")
+        for name, r in results["micro"].items():
+            print(f"{name:<32}{r['mean_ms']:>12}")
+    if results["startup"]:
+        r = results["startup"]["cold"]
+        print(f"\n{'startup':<12}{'import ms':>12}{'ready ms':>12}{'warm ms':>12}{'target ms':>12}")
+        print(
+            f"{'cold':<12}{r['import_ms']:>12}{r['ready_ms']:>12}{r['warm_ms']:>12}{r['target_ms']:>12}"
+            f"  {'met' if r['met'] else 'MISSED'}"
+        )
+
+def compare_results(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """Print metric changes against a baseline run and return the regressions"""
+    regressions = []
+    print(f"\nCompared with {baseline.get('commit', '?')} ({baseline.get('timestamp', '?')}):")
+    if baseline.get("settings") != current.get("settings"):
+        print("  Note: the runs used different settings, so changes may not be meaningful")
+    for section in ("scenarios", "micro", "startup"):
+        for name, metrics in current.get(section, {}).items():
+            old_metrics = baseline.get(section, {}).get(name)
+            if not old_metrics:
+                continue
+            for metric, higher_is_better in COMPARED_METRICS.items():
+                old, new = old_metrics.get(metric), metrics.get(metric)
+                if not old or new is None:
+                    continue
+                change = (new - old) / old
+                worse = -change if higher_is_better else change
+                flag = "  REGRESSION" if worse > threshold else ""
+                print(f"  {name:<24}{metric:<24}{old:>10} -> {new:<10} ({change:+.1%}){flag}")
+                if flag:
+                    regressions.append(f"{name} {metric}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API against a mock OpenAI server")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=100, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at once")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock time to first token in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=2000.0, help="Mock generation speed")
+    parser.add_argument("--completion-tokens", type=int, default=200, help="Mock tokens per text completion")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of mock requests that fail")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="Skip the memory pass")
+    parser.add_argument("--no-load", dest="load", action="store_false", help="Only run micro-benchmarks")
+    parser.add_argument("--no-micro", dest="micro", action="store_false", help="Skip micro-benchmarks")
+    parser.add_argument("--no-startup", dest="startup", action="store_false", help="Skip the cold-startup measurement")
+    parser.add_argument("--startup-runs", type=int, default=3, help="Cold starts to measure (best is kept)")
+    parser.add_argument("--startup-target", type=float, default=1.0, help="Seconds within which a worker must be ready")
+    parser.add_argument("--compare", help="Earlier results file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative change reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on regressions or a missed startup target")
+    parser.add_argument("--no-save", dest="save", action="store_false", help="Don't write a results file")
+    args = parser.parse_args()
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "latency": args.latency,
+            "tokens_per_second": args.tokens_per_second,
+            "completion_tokens": args.completion_tokens,
+            "error_rate": args.error_rate
+        },
+        "scenarios": {},
+        "micro": {},
+        "startup": {}
+    }
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    mock = None
+    try:
+        if args.load:
+            mock, base_url = start_mock_server(args)
+        else:
+            base_url = "http://127.0.0.1:9/v1"  # Never called by the micro-benchmarks
+        configure_environment(base_url, workdir)
+        if args.load:
+            results["scenarios"] = asyncio.run(run_load_tests(args))
+        if args.micro:
+            results["micro"] = run_micro_benchmarks()
+        if args.startup:
+            results["startup"] = measure_startup(args.startup_runs, args.startup_target)
+    finally:
+        if mock is not None:
+            mock.terminate()
+            mock.wait()
+
+    print_results(results)
+    if args.save:
+        print(f"\nSaved results to {save_results(results)}")
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare_results(json.load(f), results, args.threshold)
+    if results["startup"] and not results["startup"]["cold"]["met"]:
+        regressions.append("startup target")
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
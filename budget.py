@@ -0,0 +1,70 @@
+import os
+from metrics import Counter, METRICS
+from openai_client import DEFAULT_MODEL
+from prompts import MESSAGE_OVERHEAD_TOKENS, count_message_tokens, template_tokens
+from routing import ModelRoute, model_context_window
+
+# What to do with a call that would overflow its model's context window:
+# "compress" summarizes its context until it fits, "reject" fails it with 413
+CONTEXT_OVERFLOW = os.environ.get("CONTEXT_OVERFLOW", "compress")
+# Long context is summarized in pieces of this many tokens, each into at most CONTEXT_SUMMARY_TOKENS
+CONTEXT_CHUNK_TOKENS = int(os.environ.get("CONTEXT_CHUNK_TOKENS", "32000"))
+CONTEXT_SUMMARY_TOKENS = int(os.environ.get("CONTEXT_SUMMARY_TOKENS", "2048"))
+# Summaries that are still too long are summarized again, at most this many rounds in all
+CONTEXT_SUMMARY_ROUNDS = int(os.environ.get("CONTEXT_SUMMARY_ROUNDS", "3"))
+# Shortest summary worth asking for; a context needing shorter ones is rejected instead
+CONTEXT_SUMMARY_MIN_TOKENS = 64
+# Tokens of the window left unused, since counts are estimates without tiktoken
+CONTEXT_WINDOW_MARGIN = int(os.environ.get("CONTEXT_WINDOW_MARGIN", "512"))
+
+CONTEXT_OVERFLOWS = Counter(
+    "context_overflow_total", "Model calls that did not fit the context window", ("endpoint", "outcome")
+)
+METRICS.extend([CONTEXT_OVERFLOWS])
+
+class TokenBudgetExceeded(ValueError):
+    """Raised before a model call whose prompt and completion budget cannot fit the model's context window"""
+
+    status_code = 413
+
+    def __init__(self, tokens: int, limit: int, model: str):
+        super().__init__(
+            f"Request needs about {tokens} tokens including max_completion_tokens, "
+            f"but {model} allows {limit} per call"
+        )
+        self.tokens = tokens
+        self.limit = limit
+        self.model = model
+
+def token_limit(route: ModelRoute | None) -> tuple[int, str]:
+    """Tokens a call on a route may use, and the model whose context window sets the limit"""
+    if route is None:
+        window, model = model_context_window(DEFAULT_MODEL), DEFAULT_MODEL
+    else:
+        window, model = route.context_window()
+    return window - CONTEXT_WINDOW_MARGIN, model
+
+def overflow(
+    prompt: str,
+    system_message: str,
+    max_completion_tokens: int,
+    context: str | None,
+    limit: int
+) -> int:
+    """
+    Tokens by which a call exceeds `limit` (zero or less when it fits).
+
+    Byte-level BPE tokens are at least one byte long, so calls whose UTF-8
+    size fits are let through without tokenizing a possibly long context.
+    """
+    upper_bound = (
+        template_tokens(system_message) + len(prompt.encode()) + len((context or "").encode())
+        + 4 * MESSAGE_OVERHEAD_TOKENS + max_completion_tokens
+    )
+    if upper_bound <= limit:
+        return upper_bound - limit
+    return count_message_tokens(prompt, system_message, context) + max_completion_tokens - limit
+
+def record_overflow(endpoint: str, outcome: str):
+    """Count a call that overflowed its context window, by outcome (compressed or rejected)"""
+    CONTEXT_OVERFLOWS.inc(endpoint=endpoint, outcome=outcome)
@@ -0,0 +1,687 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, NamedTuple
+from openai_client import generate_content_async, stream_content_async, DEFAULT_MODEL
+from singleflight import flights, worker_flight
+from shared_state import WORKERS, connect, get_shared_state
+from metrics import observe_phase, record_cache, record_semantic_lookup
+from scheduler import scheduler, estimate_tokens
+from routing import ModelRoute, get_route
+from prompts import CONTEXT_SUMMARY_SYSTEM_MESSAGE, count_tokens, split_text
+from budget import (
+    CONTEXT_OVERFLOW, CONTEXT_CHUNK_TOKENS, CONTEXT_SUMMARY_TOKENS, CONTEXT_SUMMARY_ROUNDS,
+    CONTEXT_SUMMARY_MIN_TOKENS, TokenBudgetExceeded, token_limit, overflow, record_overflow
+)
+from semantic_cache import (
+    SEMANTIC_CACHE_ENDPOINTS, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_DRAFT_THRESHOLD,
+    SemanticMatch, get_semantic_cache, semantic_text, draft_context
+)
+
+# Cache configuration
+# memory, sqlite or none; sqlite by default with several workers so they share one cache
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "sqlite" if WORKERS > 1 else "memory")
+CACHE_TTL = float(os.environ.get("CACHE_TTL", "3600"))
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "1000"))
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_SQLITE_PATH = os.environ.get("CACHE_SQLITE_PATH", "cache/content_cache.sqlite3")
+
+CACHE_MODES = ("bypass", "prefer", "only")
+
+class CacheMissError(LookupError):
+    """Raised when cache mode is "only" and no cached entry exists"""
+
+class CacheEntry(NamedTuple):
+    """A cached generation and when it was stored"""
+    content: str
+    created: float
+    similarity: float | None = None  # Set when served from a similar earlier request
+
+class GenerationResult(NamedTuple):
+    """Generated content plus how the cache was involved"""
+    content: str
+    cache_status: str  # HIT, SIMILAR, MISS or BYPASS
+    age: float | None = None
+    coalesced: bool = False  # True if shared with an identical in-flight request
+    similarity: float | None = None  # Similarity of the earlier request a SIMILAR result was served from
+
+def make_cache_key(
+    endpoint: str,
+    system_message: str,
+    prompt: str,
+    context: str | None,
+    model: str,
+    max_completion_tokens: int
+) -> str:
+    """Build a stable cache key from everything that affects the generated output"""
+    raw = json.dumps(
+        [endpoint, system_message, prompt, context, model, max_completion_tokens],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def make_request_key(
+    endpoint: str,
+    prompt: str,
+    system_message: str,
+    max_completion_tokens: int,
+    context: str | None = None,
+    model: str = DEFAULT_MODEL
+) -> str:
+    """Build the canonical key for a generation request (by default with the default model)"""
+    return make_cache_key(endpoint, system_message, prompt, context, model, max_completion_tokens)
+
+class CacheBackend:
+    """Base class for cache backends"""
+
+    # Backends doing I/O are run in a thread so they don't block the event loop
+    blocking = False
+
+    def get(self, key: str) -> CacheEntry | None:
+        raise NotImplementedError
+
+    def set(self, key: str, content: str):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+class MemoryCache(CacheBackend):
+    """In-process LRU cache with TTL, entry-count and byte-size eviction"""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES, ttl: float = CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[CacheEntry, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> CacheEntry | None:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            entry, _ = item
+            if time.time() - entry.created > self.ttl:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, content: str):
+        size = len(content.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (CacheEntry(content, time.time()), size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def delete(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "entries": len(self._entries), "bytes": self._bytes}
+
+    def _remove(self, key: str):
+        _, size = self._entries.pop(key)
+        self._bytes -= size
+
+class SQLiteCache(CacheBackend):
+    """On-disk cache backed by SQLite that survives restarts and is shared by worker processes"""
+
+    blocking = True
+
+    def __init__(self, path: str = CACHE_SQLITE_PATH, max_bytes: int = CACHE_MAX_BYTES, ttl: float = CACHE_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = connect(path)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    content TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_last_access ON cache (last_access)")
+
+    def get(self, key: str) -> CacheEntry | None:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT content, created FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (now, key))
+            return CacheEntry(row[0], row[1])
+
+    def set(self, key: str, content: str):
+        size = len(content.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, content, size, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, content, size, now, now)
+            )
+            self._conn.execute("DELETE FROM cache WHERE created < ?", (now - self.ttl,))
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            while total > self.max_bytes:
+                row = self._conn.execute(
+                    "SELECT key, size FROM cache ORDER BY last_access LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    break
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (row[0],))
+                total -= row[1]
+
+    def delete(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache")
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache"
+            ).fetchone()
+        return {"backend": "sqlite", "entries": entries, "bytes": size}
+
+def create_cache_backend(name: str = CACHE_BACKEND) -> CacheBackend | None:
+    """Create the configured cache backend, or None when caching is disabled"""
+    if name == "memory":
+        return MemoryCache()
+    if name == "sqlite":
+        return SQLiteCache()
+    if name == "none":
+        return None
+    raise ValueError(f"Unknown CACHE_BACKEND: {name}")
+
+_cache = create_cache_backend()
+
+def get_cache() -> CacheBackend | None:
+    """Return the active cache backend"""
+    return _cache
+
+def set_cache(backend: CacheBackend | None):
+    """Replace the active cache backend (None disables caching)"""
+    global _cache
+    _cache = backend
+
+async def cache_get(key: str) -> CacheEntry | None:
+    """Look up a key in the active cache backend"""
+    cache = get_cache()
+    if cache is None:
+        return None
+    if cache.blocking:
+        return await asyncio.to_thread(cache.get, key)
+    return cache.get(key)
+
+async def cache_set(key: str, content: str):
+    """Store a value in the active cache backend"""
+    cache = get_cache()
+    if cache is None:
+        return
+    if cache.blocking:
+        await asyncio.to_thread(cache.set, key, content)
+    else:
+        cache.set(key, content)
+
+def request_variant(
+    endpoint: str,
+    system_message: str,
+    max_completion_tokens: int,
+    model: str = DEFAULT_MODEL
+) -> int:
+    """Requests are only matched by similarity with others sharing the same instructions, model and budget"""
+    return int(make_cache_key(endpoint, system_message, "", None, model, max_completion_tokens)[:15], 16)
+
+async def find_similar(
+    endpoint: str,
+    prompt: str,
+    context: str | None,
+    variant: int,
+    allow_draft: bool = True
+) -> SemanticMatch | None:
+    """
+    Look up the most similar earlier generation in the similarity cache.
+
+    Returns:
+        The match if it is similar enough to serve, or to seed as a draft
+        when allow_draft is set; otherwise None
+    """
+    semantic = get_semantic_cache()
+    if semantic is None or endpoint not in SEMANTIC_CACHE_ENDPOINTS:
+        return None
+    start = time.perf_counter()
+    try:
+        match = await asyncio.to_thread(semantic.search, endpoint, semantic_text(prompt, context), variant)
+    except Exception as e:
+        print(f"Similarity cache lookup failed: {e}")
+        return None
+    observe_phase("semantic", time.perf_counter() - start, endpoint)
+
+    outcome = "miss"
+    if match is not None and match.similarity >= SEMANTIC_CACHE_THRESHOLD:
+        outcome = "served"
+    elif match is not None and allow_draft and 0 < SEMANTIC_CACHE_DRAFT_THRESHOLD <= match.similarity:
+        outcome = "draft"
+    record_semantic_lookup(endpoint, outcome, match.similarity if match else None)
+    return match if outcome != "miss" else None
+
+async def remember_generation(
+    endpoint: str,
+    prompt: str,
+    system_message: str,
+    max_completion_tokens: int,
+    context: str | None,
+    model: str,
+    content: str
+):
+    """Index a new generation in the similarity cache"""
+    semantic = get_semantic_cache()
+    if semantic is None or endpoint not in SEMANTIC_CACHE_ENDPOINTS:
+        return
+    variant = request_variant(endpoint, system_message, max_completion_tokens, model)
+    try:
+        await asyncio.to_thread(semantic.add, endpoint, semantic_text(prompt, context), variant, content)
+    except Exception as e:
+        print(f"Similarity cache update failed: {e}")
+
+async def lookup_cached(
+    endpoint: str,
+    prompt: str,
+    system_message: str,
+    max_completion_tokens: int,
+    context: str | None = None,
+    cache_mode: str = "prefer",
+    model: str = DEFAULT_MODEL
+) -> tuple[str | None, CacheEntry | None, SemanticMatch | None]:
+    """
+    Resolve the cache key for a request and look it up.
+
+    On an exact miss the similarity cache is consulted: a close enough
+    earlier generation is returned as the entry (with its similarity set),
+    a less close one as a draft for the model to adapt.
+
+    Returns:
+        (key, entry, draft) where key is None if the cache should not be
+        used, entry is None on a miss and draft is None unless a similar
+        earlier generation should seed the new one
+
+    Raises:
+        CacheMissError: If cache_mode is "only" and nothing is cached
+    """
+    if cache_mode not in CACHE_MODES:
+        raise ValueError(f"Invalid cache mode: {cache_mode}")
+
+    if cache_mode == "bypass" or (get_cache() is None and get_semantic_cache() is None):
+        if cache_mode == "only":
+            raise CacheMissError("Caching is disabled")
+        return None, None, None
+
+    key = make_request_key(endpoint, prompt, system_message, max_completion_tokens, context, model)
+    entry = await cache_get(key)
+    draft = None
+    if entry is None:
+        variant = request_variant(endpoint, system_message, max_completion_tokens, model)
+        match = await find_similar(endpoint, prompt, context, variant, allow_draft=cache_mode != "only")
+        if match is not None and match.similarity >= SEMANTIC_CACHE_THRESHOLD:
+            entry = CacheEntry(match.content, match.created, match.similarity)
+        else:
+            draft = match
+    if entry is None and cache_mode == "only":
+        raise CacheMissError("No cached content for this request")
+    return key, entry, draft
+
+def combined_cache_status(results: list[GenerationResult]) -> str:
+    """Cache status of a response built from several generations: HIT if all were, BYPASS if any was"""
+    statuses = {result.cache_status for result in results}
+    if statuses == {"HIT"}:
+        return "HIT"
+    if statuses <= {"HIT", "SIMILAR"}:
+        return "SIMILAR"
+    if "BYPASS" in statuses:
+        return "BYPASS"
+    return "MISS"
+
+def request_model(route: ModelRoute | None) -> str:
+    """Model a request is keyed by: its route's primary model, even while the fallback serves it"""
+    return route.model if route is not None else DEFAULT_MODEL
+
+CONTEXT_SUMMARY_ENDPOINT = "context-summary"
+
+def summary_budget(tokens: int, pieces: int, max_tokens: int, last: bool) -> int | None:
+    """
+    Completion tokens for each of `pieces` summaries of a `tokens`-long text in a compression round.
+
+    Each summary gets an equal share of max_tokens, within CONTEXT_SUMMARY_TOKENS.
+    Before the last round a share too small to be useful is raised, and the joined
+    summaries are condensed again. None if the round cannot work: a share under
+    CONTEXT_SUMMARY_MIN_TOKENS on the last round, or summaries that could come
+    out as long as the text.
+    """
+    summary_tokens = min(CONTEXT_SUMMARY_TOKENS, max_tokens // pieces)
+    if summary_tokens < CONTEXT_SUMMARY_MIN_TOKENS:
+        if last:
+            return None
+        summary_tokens = CONTEXT_SUMMARY_MIN_TOKENS
+    if pieces * summary_tokens >= tokens:
+        return None
+    return summary_tokens
+
+def compression_fits(tokens: int, max_tokens: int, chunk_tokens: int) -> bool:
+    """Whether CONTEXT_SUMMARY_ROUNDS rounds fit a text into max_tokens even if every summary uses its whole budget"""
+    for round_ in range(CONTEXT_SUMMARY_ROUNDS):
+        pieces = -(-tokens // chunk_tokens)
+        summary_tokens = summary_budget(tokens, pieces, max_tokens, round_ == CONTEXT_SUMMARY_ROUNDS - 1)
+        if summary_tokens is None:
+            return False
+        tokens = pieces * summary_tokens
+        if tokens <= max_tokens:
+            return True
+    return False
+
+async def compress_context(
+    prompt: str,
+    context: str,
+    max_tokens: int,
+    cache_mode: str,
+    priority: str,
+    route: ModelRoute | None
+) -> str | None:
+    """
+    Summarize a long context into about max_tokens tokens for the task in `prompt`.
+
+    The context is split into pieces of up to CONTEXT_CHUNK_TOKENS that are
+    summarized in parallel; if the joined summaries are still too long they
+    are summarized again, for at most CONTEXT_SUMMARY_ROUNDS rounds. Nothing
+    is summarized unless the rounds would fit the context even with summaries
+    of full length, and compression stops when a round does not shrink the
+    text. Summaries go through the cache, so the same context is only
+    condensed once per task.
+
+    Returns:
+        The summary, or None if the context cannot be condensed to fit
+    """
+    instruction = f"Condense the context for this task:\n{prompt}"
+    # Pieces must leave room in the window for the instruction and the summary;
+    # split_text sizes them from an average, so some slack is kept
+    limit, _ = token_limit(route)
+    room = -overflow(instruction, CONTEXT_SUMMARY_SYSTEM_MESSAGE, CONTEXT_SUMMARY_TOKENS, None, limit)
+    chunk_tokens = min(CONTEXT_CHUNK_TOKENS, room * 9 // 10)
+    text = context
+    tokens = count_tokens(text)
+    if chunk_tokens <= 0 or not compression_fits(tokens, max_tokens, chunk_tokens):
+        return None
+    for round_ in range(CONTEXT_SUMMARY_ROUNDS):
+        pieces = split_text(text, chunk_tokens)
+        summary_tokens = summary_budget(tokens, len(pieces), max_tokens, round_ == CONTEXT_SUMMARY_ROUNDS - 1)
+        if summary_tokens is None:
+            return None
+        results = await asyncio.gather(*(
+            generate_cached(
+                endpoint=CONTEXT_SUMMARY_ENDPOINT,
+                prompt=f"{instruction}\nUse at most {summary_tokens * 3 // 4} words.",
+                system_message=CONTEXT_SUMMARY_SYSTEM_MESSAGE,
+                max_completion_tokens=summary_tokens,
+                context=piece,
+                cache_mode="bypass" if cache_mode == "bypass" else "prefer",
+                priority=priority,
+                route=route.name if route is not None else None
+            )
+            for piece in pieces
+        ))
+        text = "\n\n".join(result.content for result in results)
+        summarized = count_tokens(text)
+        if summarized <= max_tokens:
+            return text
+        if summarized >= tokens:
+            return None
+        tokens = summarized
+    return None
+
+async def fit_context(
+    endpoint: str,
+    prompt: str,
+    system_message: str,
+    max_completion_tokens: int,
+    context: str | None,
+    draft: str | None,
+    cache_mode: str,
+    priority: str,
+    route: ModelRoute | None
+) -> str | None:
+    """
+    Check a call against its model's context window before it is made.
+
+    An earlier generation to adapt (see semantic_cache.py) is added to the
+    context only if it fits. Context that is too long is summarized when
+    CONTEXT_OVERFLOW is "compress".
+
+    Returns:
+        The context to send to the model
+
+    Raises:
+        TokenBudgetExceeded: If the call cannot be made to fit
+    """
+    limit, model = token_limit(route)
+    if draft is not None:
+        with_draft = draft_context(context, draft)
+        if overflow(prompt, system_message, max_completion_tokens, with_draft, limit) <= 0:
+            return with_draft
+    excess = overflow(prompt, system_message, max_completion_tokens, context, limit)
+    if excess <= 0:
+        return context
+
+    # Tokens left for the context once the prompt and completion budget are accounted for
+    room = -overflow(prompt, system_message, max_completion_tokens, None, limit)
+    if CONTEXT_OVERFLOW == "compress" and context and room > 0 and endpoint != CONTEXT_SUMMARY_ENDPOINT:
+        print(f"{endpoint}: context is {excess} tokens over the {model} limit, summarizing it")
+        summary = await compress_context(prompt, context, room, cache_mode, priority, route)
+        if summary is not None:
+            if overflow(prompt, system_message, max_completion_tokens, summary, limit) <= 0:
+                record_overflow(endpoint, "compressed")
+                return summary
+            excess = overflow(prompt, system_message, max_completion_tokens, summary, limit)
+    record_overflow(endpoint, "rejected")
+    raise TokenBudgetExceeded(limit + excess, limit, model)
+
+async def generate_cached(
+    endpoint: str,
+    prompt: str,
+    system_message: str,
+    max_completion_tokens: int = 8192,
+    context: str | None = None,
+    cache_mode: str = "prefer",
+    response_format: dict | None = None,
+    priority: str = "standard",
+    route: str | None = None
+) -> GenerationResult:
+    """
+    Generate content, serving repeated requests from the cache.
+
+    Args:
+        endpoint: Name of the calling endpoint, part of the cache key
+        prompt: Full prompt sent to the model
+        system_message: System instruction for the AI
+        max_completion_tokens: Maximum tokens in the completion
+        context: Request context, kept separate in the cache key
+        cache_mode: "bypass" skips the cache, "prefer" uses it when possible,
+            "only" never calls the model and raises CacheMissError on a miss
+        response_format: Optional structured output format passed to the model
+        priority: Upstream scheduler lane for the model call
+        route: Content type whose model route serves the call (see routing.py);
+            without one the default model is used
+
+    Returns:
+        GenerationResult with the content and cache status (SIMILAR when
+        served from a similar earlier request, see semantic_cache.py)
+
+    Raises:
+        TokenBudgetExceeded: If the call cannot fit the model's context
+            window, even with its context summarized (see fit_context)
+    """
+    model_route = get_route(route) if route else None
+    model = request_model(model_route)
+    key, entry, draft = await lookup_cached(
+        endpoint, prompt, system_message, max_completion_tokens, context, cache_mode, model
+    )
+    if entry is not None:
+        cache_status = "HIT" if entry.similarity is None else "SIMILAR"
+        record_cache(endpoint, cache_status)
+        return GenerationResult(entry.content, cache_status, time.time() - entry.created, similarity=entry.similarity)
+    model_context = await fit_context(
+        endpoint, prompt, system_message, max_completion_tokens, context,
+        draft.content if draft else None, cache_mode, priority, model_route
+    )
+
+    async def generate_and_store() -> str:
+        content = await generate_content_async(
+            prompt=prompt,
+            system_message=system_message,
+            max_completion_tokens=max_completion_tokens,
+            context=model_context,
+            response_format=response_format,
+            endpoint=endpoint,
+            priority=priority,
+            route=model_route
+        )
+        if key is not None:
+            await cache_set(key, content)
+            await remember_generation(endpoint, prompt, system_message, max_completion_tokens, context, model, content)
+        return content
+
+    if cache_mode == "bypass":
+        record_cache(endpoint, "BYPASS")
+        return GenerationResult(await generate_and_store(), "BYPASS")
+
+    async def generate_once() -> tuple[str, bool]:
+        state = get_shared_state()
+        if key is None or state is None or not isinstance(get_cache(), SQLiteCache):
+            return await generate_and_store(), False
+
+        # Other workers on the node wait for this call's entry in the shared cache
+        async def lookup() -> str | None:
+            entry = await cache_get(key)
+            return entry.content if entry is not None else None
+        return await worker_flight(state, key, generate_and_store, lookup)
+
+    # Identical requests already in flight share one upstream call
+    flight_key = key or make_request_key(endpoint, prompt, system_message, max_completion_tokens, context, model)
+    (content, elsewhere), shared = await flights.do(flight_key, generate_once)
+    shared = shared or elsewhere
+    cache_status = "MISS" if key else "BYPASS"
+    record_cache(endpoint, cache_status, shared)
+    return GenerationResult(content, cache_status, coalesced=shared)
+
+async def stream_cached(
+    endpoint: str,
+    prompt: str,
+    system_message: str,
+    max_completion_tokens: int = 8192,
+    context: str | None = None,
+    cache_mode: str = "prefer",
+    response_format: dict | None = None,
+    priority: str = "standard",
+    route: str | None = None
+) -> tuple[AsyncIterator[dict], str]:
+    """
+    Stream content, replaying cache hits and sharing identical in-flight streams.
+
+    Takes the same arguments as generate_cached. A completed upstream stream
+    is stored in the cache once, even if the caller disconnects.
+
+    Returns:
+        (chunks, cache_status) where chunks yields the same {"delta": ...}
+        and {"usage": ...} dicts as stream_content_async
+
+    Raises:
+        SchedulerRejected: If a new upstream stream would not be admitted, so
+            callers can refuse the request before any event is sent
+        TokenBudgetExceeded: If the call cannot fit the model's context window
+    """
+    model_route = get_route(route) if route else None
+    model = request_model(model_route)
+    key, entry, draft = await lookup_cached(
+        endpoint, prompt, system_message, max_completion_tokens, context, cache_mode, model
+    )
+    if entry is not None:
+        cache_status = "HIT" if entry.similarity is None else "SIMILAR"
+        record_cache(endpoint, cache_status)
+        async def replay():
+            yield {"delta": entry.content}
+        return replay(), cache_status
+    model_context = await fit_context(
+        endpoint, prompt, system_message, max_completion_tokens, context,
+        draft.content if draft else None, cache_mode, priority, model_route
+    )
+
+    def upstream():
+        return stream_content_async(
+            prompt=prompt,
+            system_message=system_message,
+            max_completion_tokens=max_completion_tokens,
+            context=model_context,
+            response_format=response_format,
+            endpoint=endpoint,
+            priority=priority,
+            route=model_route
+        )
+
+    flight_key = key or make_request_key(endpoint, prompt, system_message, max_completion_tokens, context, model)
+    if cache_mode == "bypass" or not flights.is_streaming(flight_key):
+        scheduler.check(estimate_tokens(prompt, system_message, max_completion_tokens, model_context), priority)
+
+    if cache_mode == "bypass":
+        record_cache(endpoint, "BYPASS")
+        return upstream(), "BYPASS"
+
+    async def store(chunks: list):
+        content = "".join(chunk["delta"] for chunk in chunks if "delta" in chunk)
+        if content:
+            await cache_set(key, content)
+            await remember_generation(endpoint, prompt, system_message, max_completion_tokens, context, model, content)
+
+    chunks, shared = flights.stream(flight_key, upstream, on_complete=store if key else None)
+    cache_status = "MISS" if key else "BYPASS"
+    record_cache(endpoint, cache_status, shared)
+    return chunks, cache_status
@@ -0,0 +1,117 @@
+import asyncio
+import os
+from typing import NamedTuple
+from cache import generate_cached, combined_cache_status, GenerationResult
+from ppt_generator import create_presentation
+from prompts import CAMPAIGN_DRAFT_SYSTEM_MESSAGE, get_content_type
+from routing import get_route
+
+# Completion token budget for the shared key-points draft
+CAMPAIGN_DRAFT_TOKENS = int(os.environ.get("CAMPAIGN_DRAFT_TOKENS", "1024"))
+
+class Campaign(NamedTuple):
+    """Channel variants derived from one shared draft"""
+    key_points: str
+    content: dict[str, str]
+    presentation: bytes | None
+    cache_status: str
+
+def variant_prompt(prompt: str, key_points: str, label: str) -> str:
+    """Instruction asking for one channel variant of the shared draft"""
+    return (
+        f"{prompt}\n\n"
+        f"Key points:\n{key_points}\n\n"
+        f"Write the {label} from these key points."
+    )
+
+async def generate_variant(
+    content_type: str,
+    prompt: str,
+    key_points: str,
+    cache_mode: str = "prefer"
+) -> GenerationResult:
+    """
+    Adapt the shared draft for one channel, using that channel's system message.
+
+    The draft already carries what matters from the context, so the context
+    is not sent again; variants run on the light "campaign-variant" route
+    with its small completion budget (ROUTE_CAMPAIGN_VARIANT_MAX_TOKENS).
+    They are cached and counted as "campaign-<content type>", apart from the
+    channel's own endpoint.
+    """
+    settings = get_content_type(content_type)
+    return await generate_cached(
+        endpoint=f"campaign-{content_type}",
+        prompt=variant_prompt(prompt, key_points, settings["label"]),
+        system_message=settings["system_message"],
+        max_completion_tokens=get_route("campaign-variant").max_completion_tokens,
+        cache_mode=cache_mode,
+        priority=settings["priority"],
+        route="campaign-variant"
+    )
+
+async def generate_campaign(
+    prompt: str,
+    context: str,
+    channels: list[str],
+    include_ppt: bool = False,
+    template_name: str | None = None,
+    cache_mode: str = "prefer"
+) -> Campaign:
+    """
+    Generate several channel variants of the same campaign.
+
+    The topic and context are summarized into key points once; every channel
+    variant (and optionally a deck) is then built from the prompt and key
+    points alone, concurrently, so neither the context nor the ideas are
+    processed again for each channel.
+
+    Args:
+        prompt: User's prompt for the campaign
+        context: Additional context
+        channels: Content types to generate (blog-post, linkedin-post, facebook-post)
+        include_ppt: Also build a PowerPoint deck from the key points
+        template_name: Optional template name for the deck
+        cache_mode: Response cache control for every generation
+
+    Returns:
+        Campaign with the key points, content per channel, the deck if
+        requested and the combined cache status
+    """
+    draft = await generate_cached(
+        endpoint="campaign-draft",
+        prompt=prompt,
+        system_message=CAMPAIGN_DRAFT_SYSTEM_MESSAGE,
+        max_completion_tokens=CAMPAIGN_DRAFT_TOKENS,
+        context=context,
+        cache_mode=cache_mode,
+        route="blog-post"
+    )
+
+    channels = list(dict.fromkeys(channels))
+    tasks = [
+        asyncio.create_task(generate_variant(channel, prompt, draft.content, cache_mode))
+        for channel in channels
+    ]
+    if include_ppt:
+        tasks.append(asyncio.create_task(create_presentation(
+            prompt=prompt,
+            context=f"Key points:\n{draft.content}",
+            template_name=template_name,
+            cache_mode=cache_mode
+        )))
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        # One failed variant fails the campaign, so stop the others
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+    presentation = results.pop() if include_ppt else None
+    return Campaign(
+        key_points=draft.content,
+        content={channel: result.content for channel, result in zip(channels, results)},
+        presentation=presentation,
+        cache_status=combined_cache_status([draft, *results])
+    )
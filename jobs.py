@@ -0,0 +1,269 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable
+from shared_state import WORKERS, connect
+
+# Job queue configuration
+JOBS_DB_PATH = os.environ.get("JOBS_DB_PATH", "jobs/jobs.sqlite3")
+JOBS_CONCURRENCY = int(os.environ.get("JOBS_CONCURRENCY", "4"))
+# Seconds a running job may go without a heartbeat before another worker takes it over
+JOBS_LEASE = float(os.environ.get("JOBS_LEASE", "30"))
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed")
+
+class JobStore:
+    """Durable job table backed by SQLite so queued work survives a restart and is shared by worker processes"""
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = connect(path)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    content_type TEXT NOT NULL,
+                    request TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL DEFAULT 0,
+                    message TEXT,
+                    result_content TEXT,
+                    result_path TEXT,
+                    error TEXT,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+
+    def create(self, content_type: str, request: dict) -> dict:
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, content_type, request, status, message, created, updated) "
+                "VALUES (?, ?, ?, 'queued', 'Queued', ?, ?)",
+                (job_id, content_type, json.dumps(request), now, now)
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["request"] = json.loads(job["request"])
+        return job
+
+    def update(self, job_id: str, **fields):
+        fields["updated"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE jobs SET {columns} WHERE id = ?",
+                (*fields.values(), job_id)
+            )
+
+    def pending_ids(self, stale_before: float | None = None) -> list[str]:
+        """
+        IDs of jobs that were queued or interrupted mid-run, oldest first.
+
+        With `stale_before`, only jobs not updated since then, i.e. ones whose
+        worker has stopped sending heartbeats.
+        """
+        query = "SELECT id FROM jobs WHERE status IN ('queued', 'running')"
+        params = ()
+        if stale_before is not None:
+            query += " AND updated < ?"
+            params = (stale_before,)
+        with self._lock:
+            rows = self._conn.execute(f"{query} ORDER BY created", params).fetchall()
+        return [row["id"] for row in rows]
+
+    def claim(self, job_id: str, stale_before: float) -> bool:
+        """
+        Mark a job as running if it is queued, or running without a heartbeat since `stale_before`.
+
+        Returns:
+            True if this caller got the job, False if it is finished or another worker runs it
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'running', progress = 0, message = 'Running', updated = ? "
+                "WHERE id = ? AND (status = 'queued' OR (status = 'running' AND updated < ?))",
+                (now, job_id, stale_before)
+            )
+        return cursor.rowcount == 1
+
+# Runs a job's request and returns {"content": ...} or {"path": ...}.
+# The second argument reports progress as (fraction, message).
+JobRunner = Callable[[dict, Callable[[float, str], None]], Awaitable[dict]]
+
+class JobManager:
+    """
+    Local worker pool executing queued jobs under a concurrency limit.
+
+    Every worker process runs its own manager over the shared job table. A
+    job is claimed atomically before it runs and its row is touched every
+    lease/3 seconds while it runs; with several workers, each one also sweeps
+    for jobs left untouched for a whole lease (their worker died) and takes
+    them over.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        runner: JobRunner,
+        concurrency: int = JOBS_CONCURRENCY,
+        lease: float = JOBS_LEASE,
+        workers: int = WORKERS
+    ):
+        self.store = store
+        self.runner = runner
+        self.concurrency = concurrency
+        self.lease = lease
+        self.workers = workers
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+        self._queued: set[str] = set()
+        self._workers: list[asyncio.Task] = []
+
+    async def start(self):
+        """Queue unfinished jobs from the store and start the workers"""
+        if self.workers <= 1:
+            # The only worker owns every job, so running ones were interrupted by a restart
+            for job_id in await asyncio.to_thread(self.store.pending_ids):
+                await asyncio.to_thread(self.store.update, job_id, status="queued", message="Queued")
+                self._enqueue(job_id)
+        else:
+            await self._sweep_once()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        if self.workers > 1:
+            self._workers.append(asyncio.create_task(self._sweep()))
+
+    async def stop(self):
+        """Stop the workers; interrupted jobs are picked up again on the next start, or by another worker after the lease"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, content_type: str, request: dict) -> dict:
+        """Persist a new job and queue it for execution"""
+        job = await asyncio.to_thread(self.store.create, content_type, request)
+        self._enqueue(job["id"])
+        return job
+
+    async def get(self, job_id: str) -> dict | None:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    def queue_size(self) -> int:
+        return self._queue.qsize()
+
+    def _enqueue(self, job_id: str):
+        if job_id not in self._queued:
+            self._queued.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    async def _sweep_once(self):
+        """Queue jobs that no worker has touched for a whole lease"""
+        for job_id in await asyncio.to_thread(self.store.pending_ids, time.time() - self.lease):
+            self._enqueue(job_id)
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(self.lease)
+            try:
+                await self._sweep_once()
+            except sqlite3.Error as e:
+                print(f"Job sweep failed: {e}")
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                # e.g. the database was locked; keep the worker for the next job
+                print(f"Job {job_id} could not be run: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _heartbeat(self, job_id: str):
+        """Keep a running job's lease while it makes no progress reports"""
+        delay = self.lease / 3
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await asyncio.to_thread(self.store.update, job_id)
+                delay = self.lease / 3
+            except sqlite3.Error as e:
+                # Retry well before the lease runs out and another worker takes the job
+                print(f"Job {job_id} heartbeat failed, retrying: {e}")
+                delay = min(1.0, self.lease / 10)
+
+    async def _run(self, job_id: str):
+        if not await asyncio.to_thread(self.store.claim, job_id, time.time() - self.lease):
+            return
+        job = await asyncio.to_thread(self.store.get, job_id)
+
+        # Progress is written off the event loop; reports arriving while a write
+        # is under way are coalesced so only the latest one is written next
+        latest: dict[str, tuple[float, str]] = {}
+        writer: asyncio.Task | None = None
+
+        async def write_progress():
+            while latest:
+                progress, message = latest.pop("progress")
+                try:
+                    await asyncio.to_thread(self.store.update, job_id, progress=progress, message=message)
+                except sqlite3.Error as e:
+                    print(f"Job {job_id} progress update failed: {e}")
+
+        def report_progress(progress: float, message: str):
+            nonlocal writer
+            latest["progress"] = (progress, message)
+            if writer is None or writer.done():
+                writer = asyncio.create_task(write_progress())
+
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        error = None
+        try:
+            result = await self.runner(job, report_progress)
+        except asyncio.CancelledError:
+            if writer is not None:
+                writer.cancel()
+            raise
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            error = e
+        finally:
+            heartbeat.cancel()
+
+        # Let the last progress write land before the final status, so it cannot overwrite it
+        if writer is not None:
+            await asyncio.wait([writer])
+        if error is not None:
+            await asyncio.to_thread(self.store.update, job_id, status="failed", message="Failed", error=str(error))
+            return
+
+        await asyncio.to_thread(
+            self.store.update,
+            job_id,
+            status="succeeded",
+            progress=1.0,
+            message="Completed",
+            result_content=result.get("content"),
+            result_path=result.get("path")
+        )
@@ -1,17 +1,133 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from models import PromptRequest, PromptContextRequest, PPTRequest, ContentResponse
-from openai_client import generate_content
-from ppt_generator import create_presentation
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from models import (
+    PromptRequest, PromptContextRequest, WhitepaperRequest, PPTRequest, ContentResponse,
+    CampaignRequest, CampaignResponse,
+    BatchRequest, BatchJob, JobRequest, JobStatusResponse, MAX_REQUEST_BYTES
+)
+from openai_client import close_async_client, get_async_client, has_credentials, async_client_ready
+from cache import generate_cached, stream_cached, CacheMissError, GenerationResult
+from whitepaper_generator import WHITEPAPER_SECTIONED, generate_sectioned_whitepaper, stream_sectioned_whitepaper
+from campaign_generator import generate_campaign
+from ppt_generator import (
+    create_presentation, stream_presentation, presentation_filename, resolve_template_name, template_seed
+)
+from ppt_renderer import warm_renderer, describe_renderer, shutdown_render_pool
+from artifacts import artifact_store, PPT_PERSIST
+from prompts import get_content_type, describe_prompts
+from jobs import JobStore, JobManager
+from metrics import MetricsMiddleware, COALESCED_IN_FLIGHT, JOBS_QUEUED, observe_phase, render_metrics
+from singleflight import flights
+from scheduler import SchedulerRejected, retry_after_header, scheduler
+from resilience import DeadlineExceeded, deadline_scope
+from budget import TokenBudgetExceeded
+from routing import ROUTES, get_route, update_failover_gauges
+from shared_state import resolve_workers
+import asyncio
+import base64
+import json
 import os
+import time
+
+# Max concurrent jobs per /batch request
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+# Create the OpenAI client and load the renderer at startup instead of on first use
+WARM_ON_STARTUP = os.environ.get("WARM_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+
+# Longest rejected value a 422 response repeats back to the client
+ECHO_INPUT_CHARS = 1000
+
+PPTX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+
+async def run_queued_job(job: dict, progress_callback) -> dict:
+    """Execute a job from the durable job queue, persisting decks in the artifact store"""
+    observe_phase("queue", max(time.time() - job["created"], 0.0), job["content_type"])
+    while True:
+        try:
+            result = await run_job_request(JobRequest(**job["request"]), progress_callback)
+            break
+        except SchedulerRejected as e:
+            # Queued jobs wait for model capacity instead of failing
+            progress_callback(0.0, "Waiting for model capacity")
+            await asyncio.sleep(e.retry_after)
+    if "data" in result:
+        artifact_id = await asyncio.to_thread(artifact_store.put, result.pop("data"), template=result.pop("template"))
+        result["path"] = await asyncio.to_thread(artifact_store.path, artifact_id)
+    return result
+
+job_manager = JobManager(JobStore(), run_queued_job)
+
+class RequestSizeLimitMiddleware:
+    """
+    ASGI middleware rejecting request bodies over MAX_REQUEST_BYTES with 413.
+
+    A declared Content-Length is checked before anything is read; chunked
+    bodies are counted as they arrive, so neither is buffered in full.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_REQUEST_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.max_bytes:
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Request body exceeds {self.max_bytes} bytes"
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def receive_limited():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, receive_limited, send)
+
+async def warm_up():
+    """Create the OpenAI client and load the pptx renderer ahead of the first request"""
+    if has_credentials():
+        get_async_client()
+    await asyncio.to_thread(warm_renderer)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application startup and shutdown hooks"""
+    if WARM_ON_STARTUP:
+        await warm_up()
+    await job_manager.start()
+    artifact_store.start()
+    yield
+    await artifact_store.stop()
+    await job_manager.stop()
+    await scheduler.stop()
+    shutdown_render_pool()
+    await close_async_client()
 
 app = FastAPI(
     title="AI Content Generator API",
     description="API for generating various types of content using GenAI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Refuse oversized bodies before they are read into memory
+app.add_middleware(RequestSizeLimitMiddleware)
+
 # Add CORS middleware to allow cross-origin requests
 app.add_middleware(
     CORSMiddleware,
@@ -19,8 +135,131 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"]
 )
 
+# Request latency histograms and Server-Timing headers
+app.add_middleware(MetricsMiddleware)
+
+@app.exception_handler(RequestValidationError)
+async def validation_error_handler(request: Request, exc: RequestValidationError) -> JSONResponse:
+    """
+    FastAPI's 422 response, without echoing back long values.
+    
+    A string rejected for its length, or an input (such as the whole body for a
+    missing field) longer than ECHO_INPUT_CHARS, is reported without its value.
+    """
+    errors = [
+        {key: value for key, value in error.items() if key != "input"}
+        if error.get("type") == "string_too_long" or len(str(error.get("input", ""))) > ECHO_INPUT_CHARS
+        else error
+        for error in exc.errors()
+    ]
+    return JSONResponse({"detail": jsonable_encoder(errors)}, status_code=422)
+
+def sse_event(event: str, data: dict) -> str:
+    """Format a single Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def rejection_error(error: SchedulerRejected) -> HTTPException:
+    """Turn scheduler backpressure into a 429/503 response with a Retry-After header"""
+    return HTTPException(
+        status_code=error.status_code,
+        detail=str(error),
+        headers={"Retry-After": retry_after_header(error.retry_after)}
+    )
+
+def set_cache_headers(response: Response, result: GenerationResult):
+    """Report how the response cache was used"""
+    response.headers["X-Cache"] = result.cache_status
+    if result.age is not None:
+        response.headers["Age"] = str(int(result.age))
+    if result.coalesced:
+        response.headers["X-Coalesced"] = "true"
+    if result.similarity is not None:
+        response.headers["X-Cache-Similarity"] = f"{result.similarity:.3f}"
+
+async def stream_events(chunks, cache_status: str, timeout: float | None = None):
+    """
+    Forward model deltas as Server-Sent Events.
+    
+    Emits a "delta" event per content fragment and a final "done" event with
+    token usage, cache status and timing, or an "error" event if generation fails.
+    """
+    start = time.perf_counter()
+    first_token_at = None
+    usage = None
+    
+    try:
+        with deadline_scope(timeout):
+            async for chunk in chunks:
+                if "delta" in chunk:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    yield sse_event("delta", {"content": chunk["delta"]})
+                elif "usage" in chunk:
+                    usage = chunk["usage"]
+    except Exception as e:
+        yield sse_event("error", {"detail": f"Error generating content: {str(e)}"})
+        return
+    
+    end = time.perf_counter()
+    yield sse_event("done", {
+        "usage": usage,
+        "cache": cache_status,
+        "timing": {
+            "time_to_first_token_ms": round((first_token_at - start) * 1000, 1) if first_token_at else None,
+            "total_ms": round((end - start) * 1000, 1)
+        }
+    })
+
+async def generate_text(
+    content_type: str,
+    prompt: str,
+    context: str | None = None,
+    cache_mode: str = "prefer",
+    priority: str | None = None
+) -> GenerationResult:
+    """Generate text content for a registered content type, by default in its own scheduler lane"""
+    settings = get_content_type(content_type)
+    return await generate_cached(
+        endpoint=content_type,
+        prompt=prompt,
+        system_message=settings["system_message"],
+        max_completion_tokens=get_route(content_type).max_completion_tokens,
+        context=context,
+        cache_mode=cache_mode,
+        priority=priority or settings["priority"],
+        route=content_type
+    )
+
+async def sse_response(
+    content_type: str,
+    prompt: str,
+    context: str | None = None,
+    cache_mode: str = "prefer",
+    timeout: float | None = None
+) -> StreamingResponse:
+    """Build a text/event-stream response for a streamed generation, optionally under a deadline"""
+    settings = get_content_type(content_type)
+    with deadline_scope(timeout):
+        chunks, cache_status = await stream_cached(
+            endpoint=content_type,
+            prompt=prompt,
+            system_message=settings["system_message"],
+            max_completion_tokens=get_route(content_type).max_completion_tokens,
+            context=context,
+            cache_mode=cache_mode,
+            priority=settings["priority"],
+            route=content_type
+        )
+    
+    return StreamingResponse(
+        stream_events(chunks, cache_status, timeout),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Cache": cache_status}
+    )
+
 @app.get("/")
 async def root():
     """Root endpoint with API information"""
@@ -32,55 +271,136 @@ async def root():
             "/whitepaper",
             "/ppt",
             "/facebook-post",
-            "/linkedin-post"
+            "/linkedin-post",
+            "/blog-post/stream",
+            "/whitepaper/stream",
+            "/ppt/stream",
+            "/facebook-post/stream",
+            "/linkedin-post/stream",
+            "/campaign",
+            "/batch",
+            "/jobs",
+            "/artifacts",
+            "/artifacts/{artifact_id}",
+            "/metrics",
+            "/routes",
+            "/prompts",
+            "/ready"
         ]
     }
 
 @app.post("/blog-post", response_model=ContentResponse)
-async def create_blog_post(request: PromptRequest):
+async def create_blog_post(request: PromptRequest, response: Response):
     """
     Generate a blog post from a prompt.
     
     Takes a prompt and creates engaging blog content using AI.
     """
     try:
-        system_message = """You are an expert blog writer. Create engaging, well-structured blog posts 
-        with clear headings, compelling introductions, informative body content, and strong conclusions. 
-        Use a conversational yet professional tone. Include relevant examples and insights."""
+        with deadline_scope(request.timeout):
+            result = await generate_text("blog-post", request.prompt, cache_mode=request.cache)
         
-        content = generate_content(
-            prompt=request.prompt,
-            system_message=system_message,
-            max_completion_tokens=8192
-        )
-        
-        return ContentResponse(content=content)
+        set_cache_headers(response, result)
+        return ContentResponse(content=result.content)
+    except TokenBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (CacheMissError, DeadlineExceeded) as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except SchedulerRejected as e:
+        raise rejection_error(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating blog post: {str(e)}")
 
+@app.post("/blog-post/stream")
+async def stream_blog_post(request: PromptRequest):
+    """
+    Stream a blog post as Server-Sent Events.
+    
+    Emits "delta" events as content is generated and a final "done" event with usage and timing.
+    """
+    try:
+        return await sse_response("blog-post", request.prompt, cache_mode=request.cache, timeout=request.timeout)
+    except TokenBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (CacheMissError, DeadlineExceeded) as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except SchedulerRejected as e:
+        raise rejection_error(e)
+
 @app.post("/whitepaper", response_model=ContentResponse)
-async def create_whitepaper(request: PromptRequest):
+async def create_whitepaper(request: WhitepaperRequest, response: Response):
     """
     Generate a whitepaper from a prompt.
     
     Takes a prompt and creates a professional, research-focused whitepaper.
+    With `sectioned`, an outline is generated first and its sections are
+    written in parallel, then stitched together in order.
     """
     try:
-        system_message = """You are an expert technical writer specializing in whitepapers. 
-        Create comprehensive, well-researched whitepapers with executive summaries, problem statements, 
-        methodology, analysis, conclusions, and recommendations. Use formal, authoritative language 
-        with proper citations and data-driven insights. Structure the content with clear sections."""
-        
-        content = generate_content(
-            prompt=request.prompt,
-            system_message=system_message,
-            max_completion_tokens=8192
-        )
+        with deadline_scope(request.timeout):
+            if is_sectioned(request):
+                result = await generate_sectioned_whitepaper(request.prompt, cache_mode=request.cache)
+            else:
+                result = await generate_text("whitepaper", request.prompt, cache_mode=request.cache)
         
-        return ContentResponse(content=content)
+        set_cache_headers(response, result)
+        return ContentResponse(content=result.content)
+    except TokenBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (CacheMissError, DeadlineExceeded) as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except SchedulerRejected as e:
+        raise rejection_error(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating whitepaper: {str(e)}")
 
+@app.post("/whitepaper/stream")
+async def stream_whitepaper(request: WhitepaperRequest):
+    """
+    Stream a whitepaper as Server-Sent Events.
+    
+    Emits "delta" events as content is generated and a final "done" event with usage and timing.
+    With `sectioned`, emits an "outline" event, a "section" event as each section completes
+    (possibly out of order) and a final "done" event with the stitched document.
+    """
+    try:
+        if is_sectioned(request):
+            with deadline_scope(request.timeout):
+                events = await stream_sectioned_whitepaper(request.prompt, cache_mode=request.cache)
+            return StreamingResponse(
+                whitepaper_sse(events, request.timeout),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+        return await sse_response("whitepaper", request.prompt, cache_mode=request.cache, timeout=request.timeout)
+    except TokenBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (CacheMissError, DeadlineExceeded) as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except SchedulerRejected as e:
+        raise rejection_error(e)
+
+def is_sectioned(request: WhitepaperRequest) -> bool:
+    return WHITEPAPER_SECTIONED if request.sectioned is None else request.sectioned
+
+async def whitepaper_sse(events, timeout: float | None = None):
+    """
+    Forward sectioned whitepaper events as Server-Sent Events.
+    
+    Emits "outline", then "section" events as sections complete, and a final
+    "done" event with the stitched document, or an "error" event if generation fails.
+    """
+    start = time.perf_counter()
+    try:
+        with deadline_scope(timeout):
+            async for event in events:
+                name = event.pop("event")
+                if name == "done":
+                    event["timing"] = {"total_ms": round((time.perf_counter() - start) * 1000, 1)}
+                yield sse_event(name, event)
+    except Exception as e:
+        yield sse_event("error", {"detail": f"Error generating content: {str(e)}"})
+
 @app.post("/ppt")
 async def create_ppt(request: PPTRequest):
     """
@@ -95,80 +415,471 @@ async def create_ppt(request: PPTRequest):
     - elegant_purple
     - corporate_gray
     
-    If no template is specified, a random template will be used.
+    If no template is specified, one is chosen from the prompt and context (the
+    same request always gets the same template; see PPT_TEMPLATE_SELECTION).
+    
+    The deck is also kept in the artifact store (unless PPT_PERSIST is off): its
+    ID is returned in the `X-Artifact-Id` header and it can be downloaded again
+    from `/artifacts/{artifact_id}` without regenerating it.
     """
     try:
-        filename = create_presentation(
-            prompt=request.prompt,
-            context=request.context,
-            template_name=request.template
-        )
+        template_name = resolve_template_name(request.template, template_seed(request.prompt, request.context))
+        with deadline_scope(request.timeout):
+            data = await create_presentation(
+                prompt=request.prompt,
+                context=request.context,
+                template_name=template_name,
+                cache_mode=request.cache
+            )
         
-        if not os.path.exists(filename):
-            raise HTTPException(status_code=500, detail="Failed to generate presentation file")
+        filename = presentation_filename()
+        headers = {"Content-Disposition": f"attachment; filename={filename}"}
+        if PPT_PERSIST:
+            headers["X-Artifact-Id"] = await asyncio.to_thread(artifact_store.put, data, template=template_name)
         
-        return FileResponse(
-            path=filename,
-            media_type="application/vnd.openxmlformats-officedocument.presentationml.presentation",
-            filename=os.path.basename(filename),
-            headers={
-                "Content-Disposition": f"attachment; filename={os.path.basename(filename)}"
-            }
-        )
+        return Response(content=data, media_type=PPTX_MEDIA_TYPE, headers=headers)
+    except TokenBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (CacheMissError, DeadlineExceeded) as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except SchedulerRejected as e:
+        raise rejection_error(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating PowerPoint: {str(e)}")
 
+async def presentation_sse(events, template_name: str, timeout: float | None = None):
+    """
+    Forward progressive rendering events as Server-Sent Events.
+    
+    Emits a "slide" event as each slide is rendered and a final "done" event
+    with the artifact ID and download URL of the stored deck.
+    """
+    start = time.perf_counter()
+    try:
+        with deadline_scope(timeout):
+            async for event in events:
+                if event["event"] == "slide":
+                    yield sse_event("slide", {"index": event["index"], "title": event["title"]})
+                elif event["event"] == "done":
+                    artifact_id = await asyncio.to_thread(artifact_store.put, event["data"], template=template_name)
+                    yield sse_event("done", {
+                        "slides": event["slides"],
+                        "fallback": event["fallback"],
+                        "artifact_id": artifact_id,
+                        "download_url": f"/artifacts/{artifact_id}",
+                        "filename": presentation_filename(),
+                        "timing": {"total_ms": round((time.perf_counter() - start) * 1000, 1)}
+                    })
+    except Exception as e:
+        yield sse_event("error", {"detail": f"Error generating PowerPoint: {str(e)}"})
+
+@app.post("/ppt/stream")
+async def stream_ppt(request: PPTRequest):
+    """
+    Generate a PowerPoint file, reporting each slide as Server-Sent Events.
+    
+    Slides are rendered while later ones are still being generated. Emits a "slide"
+    event per rendered slide and a final "done" event whose `download_url` serves the .pptx.
+    """
+    template_name = resolve_template_name(request.template, template_seed(request.prompt, request.context))
+    try:
+        with deadline_scope(request.timeout):
+            events = await stream_presentation(
+                prompt=request.prompt,
+                context=request.context,
+                template_name=template_name,
+                cache_mode=request.cache
+            )
+    except TokenBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (CacheMissError, DeadlineExceeded) as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except SchedulerRejected as e:
+        raise rejection_error(e)
+    
+    return StreamingResponse(
+        presentation_sse(events, template_name, request.timeout),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/artifacts")
+async def list_artifacts(limit: int = 100):
+    """
+    List stored decks, most recently used first.
+    
+    Each entry has the artifact ID, size, template, creation time, last
+    download and download count, plus the store's totals and retention limits.
+    """
+    artifacts = await asyncio.to_thread(artifact_store.list, max(1, min(limit, 1000)))
+    stats = await asyncio.to_thread(artifact_store.stats)
+    return {**stats, "recent": artifacts}
+
+@app.get("/artifacts/{artifact_id}")
+async def get_artifact(artifact_id: str):
+    """Download a stored .pptx file by its artifact ID"""
+    path = await asyncio.to_thread(artifact_store.open_download, artifact_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    filename = f"presentation_{artifact_id[:12]}.pptx"
+    return FileResponse(
+        path=path,
+        media_type=PPTX_MEDIA_TYPE,
+        filename=filename,
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}"
+        },
+        # Cleanup leaves the file alone until it has been sent
+        background=BackgroundTask(artifact_store.close_download, artifact_id)
+    )
+
 @app.post("/facebook-post", response_model=ContentResponse)
-async def create_facebook_post(request: PromptContextRequest):
+async def create_facebook_post(request: PromptContextRequest, response: Response):
     """
     Generate a Facebook post from prompt and context.
     
     Takes a prompt and context to create engaging social media content for Facebook.
     """
     try:
-        system_message = """You are a social media expert specializing in Facebook content. 
-        Create engaging, friendly Facebook posts that encourage interaction. Use emojis appropriately, 
-        include a hook to grab attention, tell a story or share value, and include a clear call-to-action. 
-        Keep it conversational and relatable. Suggest relevant hashtags at the end."""
-        
-        full_prompt = f"{request.prompt}\n\nContext: {request.context}"
+        with deadline_scope(request.timeout):
+            result = await generate_text("facebook-post", request.prompt, request.context, cache_mode=request.cache)
         
-        content = generate_content(
-            prompt=full_prompt,
-            system_message=system_message,
-            max_completion_tokens=2048
-        )
-        
-        return ContentResponse(content=content)
+        set_cache_headers(response, result)
+        return ContentResponse(content=result.content)
+    except TokenBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (CacheMissError, DeadlineExceeded) as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except SchedulerRejected as e:
+        raise rejection_error(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating Facebook post: {str(e)}")
 
+@app.post("/facebook-post/stream")
+async def stream_facebook_post(request: PromptContextRequest):
+    """
+    Stream a Facebook post as Server-Sent Events.
+    
+    Emits "delta" events as content is generated and a final "done" event with usage and timing.
+    """
+    try:
+        return await sse_response("facebook-post", request.prompt, request.context, cache_mode=request.cache, timeout=request.timeout)
+    except TokenBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (CacheMissError, DeadlineExceeded) as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except SchedulerRejected as e:
+        raise rejection_error(e)
+
 @app.post("/linkedin-post", response_model=ContentResponse)
-async def create_linkedin_post(request: PromptContextRequest):
+async def create_linkedin_post(request: PromptContextRequest, response: Response):
     """
     Generate a LinkedIn post from prompt and context.
     
     Takes a prompt and context to create professional content for LinkedIn.
     """
     try:
-        system_message = """You are a professional content creator specializing in LinkedIn posts. 
-        Create engaging, professional LinkedIn content that provides value to a business audience. 
-        Use a professional yet personable tone, share insights or lessons, include relevant industry 
-        knowledge, and end with a thought-provoking question or call-to-action to encourage engagement. 
-        Use minimal emojis. Suggest relevant professional hashtags at the end."""
-        
-        full_prompt = f"{request.prompt}\n\nContext: {request.context}"
+        with deadline_scope(request.timeout):
+            result = await generate_text("linkedin-post", request.prompt, request.context, cache_mode=request.cache)
         
-        content = generate_content(
-            prompt=full_prompt,
-            system_message=system_message,
-            max_completion_tokens=2048
+        set_cache_headers(response, result)
+        return ContentResponse(content=result.content)
+    except TokenBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (CacheMissError, DeadlineExceeded) as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except SchedulerRejected as e:
+        raise rejection_error(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating LinkedIn post: {str(e)}")
+
+@app.post("/linkedin-post/stream")
+async def stream_linkedin_post(request: PromptContextRequest):
+    """
+    Stream a LinkedIn post as Server-Sent Events.
+    
+    Emits "delta" events as content is generated and a final "done" event with usage and timing.
+    """
+    try:
+        return await sse_response("linkedin-post", request.prompt, request.context, cache_mode=request.cache, timeout=request.timeout)
+    except TokenBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (CacheMissError, DeadlineExceeded) as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except SchedulerRejected as e:
+        raise rejection_error(e)
+
+@app.post("/campaign", response_model=CampaignResponse)
+async def create_campaign(request: CampaignRequest, response: Response):
+    """
+    Generate blog, LinkedIn and Facebook variants of one campaign.
+
+    Summarizes the prompt and context into key points once, then derives every
+    requested channel variant (and optionally a .pptx deck) from them in parallel.
+    """
+    template_name = resolve_template_name(request.template, template_seed(request.prompt, request.context))
+    try:
+        with deadline_scope(request.timeout):
+            campaign = await generate_campaign(
+                prompt=request.prompt,
+                context=request.context,
+                channels=request.channels,
+                include_ppt=request.include_ppt,
+                template_name=template_name,
+                cache_mode=request.cache
+            )
+
+        response.headers["X-Cache"] = campaign.cache_status
+        artifact_id = None
+        if campaign.presentation is not None:
+            artifact_id = await asyncio.to_thread(
+                artifact_store.put, campaign.presentation, template=template_name
+            )
+        return CampaignResponse(
+            key_points=campaign.key_points,
+            content=campaign.content,
+            artifact_id=artifact_id,
+            download_url=f"/artifacts/{artifact_id}" if artifact_id else None
         )
+    except TokenBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (CacheMissError, DeadlineExceeded) as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except SchedulerRejected as e:
+        raise rejection_error(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating campaign: {str(e)}")
+
+async def run_job_request(job: JobRequest, progress_callback=None) -> dict:
+    """
+    Generate content for a job of any content type.
+    
+    Jobs come from /batch and /jobs, so they run in the scheduler's bulk lane
+    behind interactive requests. The job's timeout starts when it starts running.
+    
+    Returns:
+        {"data": bytes, "template": name} for ppt jobs, otherwise {"content": ..., "cache": ...}
+    """
+    if get_content_type(job.content_type)["requires_context"] and not job.context:
+        raise ValueError(f"context is required for {job.content_type}")
+    
+    with deadline_scope(job.timeout):
+        if job.content_type == "ppt":
+            template_name = resolve_template_name(job.template, template_seed(job.prompt, job.context))
+            data = await create_presentation(
+                prompt=job.prompt,
+                context=job.context,
+                template_name=template_name,
+                cache_mode=job.cache,
+                progress_callback=progress_callback,
+                priority="bulk"
+            )
+            return {"data": data, "template": template_name}
         
-        return ContentResponse(content=content)
+        if progress_callback is not None:
+            progress_callback(0.1, "Generating content")
+        generated = await generate_text(job.content_type, job.prompt, job.context, cache_mode=job.cache, priority="bulk")
+        return {"content": generated.content, "cache": generated.cache_status}
+
+async def run_batch_job(index: int, job: BatchJob) -> dict:
+    """Run a single /batch job, reporting errors in the result instead of raising"""
+    result = {"index": index, "id": job.id, "content_type": job.content_type}
+    try:
+        generated = await run_job_request(job)
+        if "data" in generated:
+            result.update({
+                "status": "ok",
+                "filename": presentation_filename(),
+                "content_base64": base64.b64encode(generated["data"]).decode("ascii")
+            })
+        else:
+            result.update({"status": "ok", **generated})
+    except SchedulerRejected as e:
+        result.update({"status": "error", "error": str(e), "retry_after": e.retry_after})
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generating LinkedIn post: {str(e)}")
+        result.update({"status": "error", "error": str(e)})
+    return result
 
-if __name__ == "__main__":
+async def batch_results(jobs: list[BatchJob], concurrency: int):
+    """Run batch jobs concurrently and yield NDJSON lines as each one finishes"""
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def run(index: int, job: BatchJob) -> dict:
+        async with semaphore:
+            return await run_batch_job(index, job)
+    
+    tasks = [asyncio.create_task(run(index, job)) for index, job in enumerate(jobs)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield json.dumps(await next_done) + "\n"
+    finally:
+        # Stop outstanding jobs if the client goes away
+        for task in tasks:
+            task.cancel()
+
+@app.post("/batch")
+async def create_batch(request: BatchRequest):
+    """
+    Generate content for many jobs in one request.
+    
+    Jobs run concurrently (bounded by `concurrency`) and results are streamed back as
+    newline-delimited JSON in completion order, one line per job. Each line carries the
+    job's `index` and `id`; a failing job reports `"status": "error"` without failing the batch.
+    """
+    concurrency = min(request.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY)
+    return StreamingResponse(
+        batch_results(request.jobs, concurrency),
+        media_type="application/x-ndjson"
+    )
+
+def job_status(job: dict) -> JobStatusResponse:
+    """Build the public status view of a stored job"""
+    return JobStatusResponse(
+        id=job["id"],
+        content_type=job["content_type"],
+        status=job["status"],
+        progress=job["progress"],
+        message=job["message"],
+        error=job["error"],
+        created_at=job["created"],
+        updated_at=job["updated"]
+    )
+
+@app.post("/jobs", response_model=JobStatusResponse, status_code=202)
+async def submit_job(request: JobRequest):
+    """
+    Submit a long-running generation job.
+    
+    Returns immediately with a job ID. Poll `GET /jobs/{id}` for status and progress,
+    then fetch the content or .pptx file from `GET /jobs/{id}/result`.
+    """
+    if get_content_type(request.content_type)["requires_context"] and not request.context:
+        raise HTTPException(status_code=422, detail=f"context is required for {request.content_type}")
+    
+    job = await job_manager.submit(request.content_type, request.model_dump())
+    return job_status(job)
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: str):
+    """Report the status and progress of a job"""
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_status(job)
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """
+    Fetch the result of a finished job.
+    
+    Returns a ContentResponse for text jobs or the .pptx file for ppt jobs.
+    Responds with 409 while the job is still queued or running.
+    """
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Job failed: {job['error']}")
+    if job["status"] != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    
+    if job["result_path"]:
+        artifact_id = os.path.splitext(os.path.basename(job["result_path"]))[0]
+        path = await asyncio.to_thread(artifact_store.open_download, artifact_id)
+        if path is None:
+            raise HTTPException(status_code=410, detail="Job result file is no longer available")
+        filename = f"presentation_{job['id']}.pptx"
+        return FileResponse(
+            path=path,
+            media_type=PPTX_MEDIA_TYPE,
+            filename=filename,
+            headers={
+                "Content-Disposition": f"attachment; filename={filename}"
+            },
+            background=BackgroundTask(artifact_store.close_download, artifact_id)
+        )
+    return ContentResponse(content=job["result_content"])
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Expose metrics in the Prometheus text format.
+    
+    Includes per-endpoint request latency, per-phase generation timings (upstream, time to
+    first token, queue wait, parse, render, save), token counts, cache hit ratio, fallback
+    deck rate, per-route model calls, latency and cost, and in-flight gauges.
+    """
+    COALESCED_IN_FLIGHT.set(flights.in_flight())
+    JOBS_QUEUED.set(job_manager.queue_size())
+    update_failover_gauges()
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/routes")
+async def get_routes():
+    """
+    Show which model serves each content type.
+    
+    Lists each route's model, fallback model, token budget and whether it is
+    currently failing over, with per-model calls, errors, latency and estimated cost.
+    """
+    return {name: route.describe() for name, route in ROUTES.items()}
+
+@app.get("/prompts")
+async def get_prompts():
+    """
+    List the registered system prompts.
+    
+    Shows each prompt's version, a fingerprint of its normalized text and its
+    token count (exact when tiktoken is installed, otherwise estimated).
+    """
+    return describe_prompts()
+
+@app.get("/ready")
+async def ready(response: Response, warm: bool = False):
+    """
+    Readiness check.
+    
+    Reports whether an OpenAI API key is configured and whether the OpenAI
+    client and the pptx renderer have been initialized (both are created on
+    first use). With `warm=true` they are initialized before answering, so a
+    new worker can be warmed before it takes traffic. Returns 503 when no API
+    key is configured.
+    """
+    if warm:
+        await warm_up()
+    if not has_credentials():
+        response.status_code = 503
+    return {
+        "ready": has_credentials(),
+        "openai_client": async_client_ready(),
+        "renderer": describe_renderer()
+    }
+
+def serve():
+    """
+    Run the API server, with several worker processes when asked to.
+    
+    Workers share the response cache, rate limit budgets, in-flight
+    generations and jobs through SQLite files on this node (see shared_state.py).
+    """
+    import argparse
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=5000)
+    parser = argparse.ArgumentParser(description="Run the AI Content Generator API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument(
+        "--workers",
+        default=os.environ.get("WEB_CONCURRENCY", "1"),
+        help='Worker processes, or "auto" for one per CPU core (default: WEB_CONCURRENCY or 1)'
+    )
+    args = parser.parse_args()
+    workers = resolve_workers(args.workers)
+    if workers == 1:
+        uvicorn.run(app, host=args.host, port=args.port)
+        return
+    # Each worker imports the app itself and reads its worker count from the environment
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=workers)
+
+if __name__ == "__main__":
+    serve()
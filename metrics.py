@@ -0,0 +1,293 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Histogram buckets in seconds, spanning fast cache hits to multi-minute generations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIMILARITY_BUCKETS = (0.3, 0.5, 0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95, 0.98, 1)
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Metric:
+    """Base class for labelled metrics rendered in the Prometheus text format"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values: dict[tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def label_values(self) -> list[tuple[str, ...]]:
+        """Label value combinations that have been recorded"""
+        with self._lock:
+            return list(self._values)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key: tuple[str, ...], value) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"]
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+class Gauge(Metric):
+    """Value that can go up and down"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts[0][bisect_left(self.buckets, value)] += 1
+            counts[1] += value
+            counts[2] += 1
+
+    def _render_value(self, key: tuple[str, ...], value) -> list[str]:
+        bucket_counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, bucket_counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labels, key, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labels, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Total request latency, from receiving the request to the last byte of the response",
+    ("endpoint", "method", "status")
+)
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being handled")
+PHASE_DURATION = Histogram(
+    "request_phase_duration_seconds",
+    "Time spent in each phase of a generation: upstream model call, time to first token, "
+    "job queue wait, slide parsing, slide rendering and pptx serialization",
+    ("endpoint", "phase")
+)
+UPSTREAM_IN_FLIGHT = Gauge("upstream_requests_in_flight", "Model API calls currently in progress")
+UPSTREAM_ERRORS = Counter("upstream_errors_total", "Failed model API calls", ("endpoint",))
+TOKENS = Counter(
+    "tokens_total",
+    "Tokens reported by the model API: prompt, completion, and cached (prompt tokens served from the prompt cache)",
+    ("endpoint", "type")
+)
+PROMPT_CACHE_RATIO = Gauge("prompt_cache_hit_ratio", "Share of prompt tokens served from the model API's prompt cache", ("endpoint",))
+CACHE_REQUESTS = Counter("cache_requests_total", "Generation requests by cache status", ("endpoint", "status"))
+CACHE_HIT_RATIO = Gauge("cache_hit_ratio", "Share of cacheable requests served from the cache", ("endpoint",))
+COALESCED_REQUESTS = Counter("coalesced_requests_total", "Requests that shared an identical in-flight generation", ("endpoint",))
+COALESCED_IN_FLIGHT = Gauge("coalesced_flights_in_flight", "Distinct generations currently shared by coalesced requests")
+SEMANTIC_LOOKUPS = Counter(
+    "semantic_cache_lookups_total",
+    "Similarity cache lookups by outcome (served, draft or miss)",
+    ("endpoint", "outcome")
+)
+SEMANTIC_HIT_RATIO = Gauge("semantic_cache_hit_ratio", "Share of similarity cache lookups served from an earlier generation", ("endpoint",))
+SEMANTIC_SIMILARITY = Histogram(
+    "semantic_cache_similarity",
+    "Similarity of the closest earlier generation found by each lookup",
+    ("endpoint",),
+    SIMILARITY_BUCKETS
+)
+PPT_DECKS = Counter("ppt_decks_total", "Generated decks, by whether fallback slides were used", ("fallback",))
+PPT_FALLBACK_RATIO = Gauge("ppt_fallback_ratio", "Share of generated decks that fell back to placeholder slides")
+PPT_RENDERS = Counter("ppt_renders_total", "Deck renders, by whether an identical stored deck was reused", ("outcome",))
+JOBS_QUEUED = Gauge("jobs_queued", "Jobs waiting for a worker")
+
+METRICS: list[Metric] = [
+    REQUEST_DURATION, REQUESTS_IN_FLIGHT, PHASE_DURATION, UPSTREAM_IN_FLIGHT, UPSTREAM_ERRORS,
+    TOKENS, PROMPT_CACHE_RATIO, CACHE_REQUESTS, CACHE_HIT_RATIO, COALESCED_REQUESTS, COALESCED_IN_FLIGHT,
+    SEMANTIC_LOOKUPS, SEMANTIC_HIT_RATIO, SEMANTIC_SIMILARITY, PPT_DECKS, PPT_FALLBACK_RATIO, PPT_RENDERS,
+    JOBS_QUEUED
+]
+
+# Phase timings of the request being handled, reported in its Server-Timing header
+_request_timings: ContextVar[dict | None] = ContextVar("request_timings", default=None)
+
+def observe_phase(phase: str, seconds: float, endpoint: str = ""):
+    """Record time spent in a phase, both in the histogram and the current request's Server-Timing"""
+    PHASE_DURATION.observe(seconds, endpoint=endpoint, phase=phase)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[phase] = timings.get(phase, 0.0) + seconds
+
+@contextmanager
+def timed(phase: str, endpoint: str = ""):
+    """Time the enclosed block as a phase (see observe_phase)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_phase(phase, time.perf_counter() - start, endpoint)
+
+def record_usage(endpoint: str, usage: dict | None):
+    """Count prompt, completion and prompt-cache-hit tokens from a usage dict"""
+    if not usage:
+        return
+    for kind in ("prompt", "completion", "cached"):
+        tokens = usage.get(f"{kind}_tokens")
+        if tokens:
+            TOKENS.inc(tokens, endpoint=endpoint, type=kind)
+
+def record_cache(endpoint: str, status: str, coalesced: bool = False):
+    """Count a generation request by cache status (HIT, SIMILAR, MISS or BYPASS)"""
+    CACHE_REQUESTS.inc(endpoint=endpoint, status=status)
+    if coalesced:
+        COALESCED_REQUESTS.inc(endpoint=endpoint)
+
+def record_semantic_lookup(endpoint: str, outcome: str, similarity: float | None):
+    """Count a similarity cache lookup and the similarity of its closest match"""
+    SEMANTIC_LOOKUPS.inc(endpoint=endpoint, outcome=outcome)
+    if similarity is not None:
+        SEMANTIC_SIMILARITY.observe(similarity, endpoint=endpoint)
+
+def record_deck(fallback: bool):
+    """Count a generated deck"""
+    PPT_DECKS.inc(fallback="true" if fallback else "false")
+
+def record_render(reused: bool):
+    """Count a deck as rendered, or served from an identical stored render"""
+    PPT_RENDERS.inc(outcome="reused" if reused else "rendered")
+
+def _update_ratios():
+    endpoints = {key[0] for key in CACHE_REQUESTS.label_values()}
+    for endpoint in endpoints:
+        hits = CACHE_REQUESTS.value(endpoint=endpoint, status="HIT")
+        cacheable = hits + sum(CACHE_REQUESTS.value(endpoint=endpoint, status=status) for status in ("SIMILAR", "MISS"))
+        if cacheable:
+            CACHE_HIT_RATIO.set(hits / cacheable, endpoint=endpoint)
+    for endpoint in {key[0] for key in SEMANTIC_LOOKUPS.label_values()}:
+        lookups = sum(SEMANTIC_LOOKUPS.value(endpoint=endpoint, outcome=outcome) for outcome in ("served", "draft", "miss"))
+        if lookups:
+            SEMANTIC_HIT_RATIO.set(SEMANTIC_LOOKUPS.value(endpoint=endpoint, outcome="served") / lookups, endpoint=endpoint)
+    for endpoint in {key[0] for key in TOKENS.label_values()}:
+        prompt_tokens = TOKENS.value(endpoint=endpoint, type="prompt")
+        if prompt_tokens:
+            PROMPT_CACHE_RATIO.set(TOKENS.value(endpoint=endpoint, type="cached") / prompt_tokens, endpoint=endpoint)
+    fallbacks = PPT_DECKS.value(fallback="true")
+    total = fallbacks + PPT_DECKS.value(fallback="false")
+    if total:
+        PPT_FALLBACK_RATIO.set(fallbacks / total)
+
+def render_metrics() -> str:
+    """Render every metric in the Prometheus text exposition format"""
+    _update_ratios()
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+def server_timing(timings: dict[str, float], total: float) -> str:
+    """Format phase timings (in seconds) as a Server-Timing header value"""
+    entries = [f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in timings.items()]
+    entries.append(f"app;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request latency and in-flight requests.
+
+    Adds a Server-Timing header listing the phases recorded while handling
+    the request (upstream, parse, render, ...). Streaming responses only
+    include phases finished before the headers were sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        timings = {}
+        token = _request_timings.set(timings)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                value = server_timing(timings, time.perf_counter() - start)
+                headers.append((b"server-timing", value.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            _request_timings.reset(token)
+            route = scope.get("route")
+            REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                endpoint=getattr(route, "path", "unmatched"),
+                method=scope["method"],
+                status=str(status)
+            )
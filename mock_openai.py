@@ -0,0 +1,172 @@
+"""
+Local OpenAI-compatible server for benchmarks and offline development.
+
+Serves POST /v1/chat/completions (plain and streaming) with configurable
+latency, token rate and error rate, so the API can be exercised without a
+real key. Point the app at it with:
+
+    python mock_openai.py --port 8100 --latency 0.2 --tokens-per-second 500
+    OPENAI_API_KEY=mock OPENAI_BASE_URL=http://127.0.0.1:8100/v1 uvicorn main:app
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = (
+    "scalable platform customers insight growth strategy data team value market product "
+    "innovation results process quality impact future technology research adoption"
+).split()
+
+class MockSettings:
+    """Behaviour of the mock model"""
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        tokens_per_second: float = 2000.0,
+        completion_tokens: int = 200,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        seed: int | None = None
+    ):
+        self.latency = latency  # Seconds before the first token
+        self.tokens_per_second = tokens_per_second  # Generation speed after the first token (0 is instant)
+        self.completion_tokens = completion_tokens  # Tokens per text completion, capped by max_completion_tokens
+        self.error_rate = error_rate  # Share of requests failing with error_status
+        self.error_status = error_status
+        self.random = random.Random(seed)
+
+def count_prompt_tokens(messages: list[dict]) -> int:
+    return sum(len(str(message.get("content", ""))) // 4 + 4 for message in messages)
+
+def schema_name(body: dict) -> str | None:
+    response_format = body.get("response_format") or {}
+    return (response_format.get("json_schema") or {}).get("name")
+
+def mock_content(body: dict, settings: MockSettings) -> str:
+    """Plausible output for the request: slides or outline JSON when asked for, otherwise text"""
+    messages = body.get("messages", [])
+    system = str(messages[0].get("content", "")) if messages else ""
+    name = schema_name(body)
+    if name == "slide_deck" or "presentation designer" in system:
+        slides = [
+            {"title": f"Slide {i + 1}", "content": [f"Point {j + 1} about {settings.random.choice(WORDS)}" for j in range(4)]}
+            for i in range(6)
+        ]
+        return json.dumps({"slides": slides})
+    if name == "whitepaper_outline":
+        headings = ["Executive Summary", "Problem Statement", "Methodology", "Analysis", "Recommendations"]
+        return json.dumps({
+            "title": "Mock Whitepaper",
+            "sections": [{"heading": heading, "key_points": ["First point", "Second point"]} for heading in headings]
+        })
+    limit = body.get("max_completion_tokens") or body.get("max_tokens") or settings.completion_tokens
+    count = max(1, min(settings.completion_tokens, limit))
+    return " ".join(settings.random.choice(WORDS) for _ in range(count))
+
+def split_tokens(content: str) -> list[str]:
+    """Split content into ~4-character pieces standing in for tokens"""
+    return [content[i:i + 4] for i in range(0, len(content), 4)] or [""]
+
+def usage(prompt_tokens: int, completion_tokens: int) -> dict:
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": 0}
+    }
+
+def create_app(settings: MockSettings | None = None) -> FastAPI:
+    """Build the mock server application"""
+    settings = settings or MockSettings()
+    app = FastAPI(title="Mock OpenAI API")
+    app.state.settings = settings
+    app.state.requests = 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        await asyncio.sleep(settings.latency)
+        if settings.random.random() < settings.error_rate:
+            return JSONResponse(
+                {"error": {"message": "Mock upstream error", "type": "server_error", "code": None}},
+                status_code=settings.error_status,
+                headers={"retry-after": "1"} if settings.error_status == 429 else None
+            )
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        model = body.get("model", "mock")
+        content = mock_content(body, settings)
+        tokens = split_tokens(content)
+        prompt_tokens = count_prompt_tokens(body.get("messages", []))
+        delay = 1 / settings.tokens_per_second if settings.tokens_per_second > 0 else 0
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay * len(tokens))
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage(prompt_tokens, len(tokens))
+            }
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        async def events():
+            def chunk(choices: list, **extra) -> str:
+                data = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                        "model": model, "choices": choices, **extra}
+                return f"data: {json.dumps(data)}\n\n"
+
+            # Send a few tokens per chunk, like the real API
+            for i in range(0, len(tokens), 4):
+                if delay:
+                    await asyncio.sleep(delay * len(tokens[i:i + 4]))
+                yield chunk([{"index": 0, "delta": {"content": "".join(tokens[i:i + 4])}, "finish_reason": None}])
+            yield chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if include_usage:
+                yield chunk([], usage=usage(prompt_tokens, len(tokens)))
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a mock OpenAI-compatible API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=2000.0, help="Generation speed (0 is instant)")
+    parser.add_argument("--completion-tokens", type=int, default=200, help="Tokens per text completion")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests that fail")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status of failed requests")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    import uvicorn
+    settings = MockSettings(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed
+    )
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,139 @@
-from pydantic import BaseModel, Field
+import os
+from typing import Literal
+from pydantic import BaseModel, Field, field_validator
+
+CacheMode = Literal["bypass", "prefer", "only"]
+
+ContentType = Literal["blog-post", "whitepaper", "ppt", "facebook-post", "linkedin-post"]
+
+BATCH_MAX_JOBS = int(os.environ.get("BATCH_MAX_JOBS", "500"))
+# Request size limits, so oversized requests fail validation before any work is done
+MAX_PROMPT_CHARS = int(os.environ.get("MAX_PROMPT_CHARS", "20000"))
+MAX_CONTEXT_CHARS = int(os.environ.get("MAX_CONTEXT_CHARS", "1000000"))
+# Largest request body read at all (0 disables the limit), checked before the body is parsed
+MAX_REQUEST_BYTES = int(os.environ.get("MAX_REQUEST_BYTES", str(16 * 1024 * 1024)))
+
+CACHE_FIELD_DESCRIPTION = (
+    "Response cache control: 'prefer' serves a cached result when available (default), "
+    "'bypass' always generates fresh content, 'only' returns a cached result or fails with 504"
+)
+
+TIMEOUT_FIELD_DESCRIPTION = (
+    "Optional deadline in seconds for generating the response; failed model calls are retried "
+    "only within it and the request fails with 504 once it passes"
+)
 
 class PromptRequest(BaseModel):
     """Request model for endpoints that only need a prompt"""
-    prompt: str = Field(..., description="The prompt for content generation", min_length=1)
+    prompt: str = Field(..., description="The prompt for content generation", min_length=1, max_length=MAX_PROMPT_CHARS)
+    cache: CacheMode = Field("prefer", description=CACHE_FIELD_DESCRIPTION)
+    timeout: float | None = Field(None, description=TIMEOUT_FIELD_DESCRIPTION, gt=0)
+
+class WhitepaperRequest(PromptRequest):
+    """Request model for whitepaper generation"""
+    sectioned: bool | None = Field(
+        None,
+        description="Generate an outline first and then write its sections in parallel "
+        "(defaults to the server's WHITEPAPER_SECTIONED setting)"
+    )
 
 class PromptContextRequest(BaseModel):
     """Request model for endpoints that need both prompt and context"""
-    prompt: str = Field(..., description="The prompt for content generation", min_length=1)
-    context: str = Field(..., description="Additional context for content generation", min_length=1)
+    prompt: str = Field(..., description="The prompt for content generation", min_length=1, max_length=MAX_PROMPT_CHARS)
+    context: str = Field(..., description="Additional context for content generation", min_length=1, max_length=MAX_CONTEXT_CHARS)
+    cache: CacheMode = Field("prefer", description=CACHE_FIELD_DESCRIPTION)
+    timeout: float | None = Field(None, description=TIMEOUT_FIELD_DESCRIPTION, gt=0)
 
 class PPTRequest(BaseModel):
     """Request model for PowerPoint generation"""
-    prompt: str = Field(..., description="The prompt for presentation content", min_length=1)
-    context: str = Field(..., description="Additional context for the presentation", min_length=1)
+    prompt: str = Field(..., description="The prompt for presentation content", min_length=1, max_length=MAX_PROMPT_CHARS)
+    context: str = Field(..., description="Additional context for the presentation", min_length=1, max_length=MAX_CONTEXT_CHARS)
     template: str | None = Field(
         None, 
-        description="Optional template name (professional_blue, modern_green, vibrant_orange, elegant_purple, corporate_gray). If not provided, a random template will be used."
+        description="Optional template name (professional_blue, modern_green, vibrant_orange, elegant_purple, corporate_gray). If not provided, one is chosen from the prompt and context."
+    )
+    cache: CacheMode = Field("prefer", description=CACHE_FIELD_DESCRIPTION)
+    timeout: float | None = Field(None, description=TIMEOUT_FIELD_DESCRIPTION, gt=0)
+
+CampaignChannel = Literal["blog-post", "linkedin-post", "facebook-post"]
+
+class CampaignRequest(BaseModel):
+    """Request model for generating several channel variants from one shared draft"""
+    prompt: str = Field(..., description="The prompt for the campaign", min_length=1, max_length=MAX_PROMPT_CHARS)
+    context: str = Field(..., description="Additional context for the campaign", min_length=1, max_length=MAX_CONTEXT_CHARS)
+    channels: list[CampaignChannel] = Field(
+        ["blog-post", "linkedin-post", "facebook-post"],
+        description="Channel variants to generate",
+        min_length=1
     )
+    include_ppt: bool = Field(False, description="Also build a PowerPoint deck from the same key points")
+    template: str | None = Field(None, description="Optional template name for the deck")
+    cache: CacheMode = Field("prefer", description=CACHE_FIELD_DESCRIPTION)
+    timeout: float | None = Field(None, description=TIMEOUT_FIELD_DESCRIPTION, gt=0)
 
 class ContentResponse(BaseModel):
     """Response model for all content generation endpoints"""
     content: str = Field(..., description="The generated content")
     message: str = Field(default="Content generated successfully", description="Status message")
+
+class CampaignResponse(BaseModel):
+    """Response model for a campaign"""
+    key_points: str = Field(..., description="The shared draft every variant was derived from")
+    content: dict[str, str] = Field(..., description="Generated content per channel")
+    artifact_id: str | None = Field(None, description="Artifact ID of the deck, if one was requested")
+    download_url: str | None = Field(None, description="Where to download the deck, if one was requested")
+
+class JobRequest(BaseModel):
+    """Request model for a single generation job of any content type"""
+    content_type: ContentType = Field(..., description="Type of content to generate")
+    prompt: str = Field(..., description="The prompt for content generation", min_length=1, max_length=MAX_PROMPT_CHARS)
+    context: str | None = Field(
+        None,
+        description="Additional context (required for ppt, facebook-post and linkedin-post)",
+        max_length=MAX_CONTEXT_CHARS
+    )
+    template: str | None = Field(None, description="Optional template name for ppt jobs")
+    cache: CacheMode = Field("prefer", description=CACHE_FIELD_DESCRIPTION)
+    timeout: float | None = Field(None, description=TIMEOUT_FIELD_DESCRIPTION, gt=0)
+
+class BatchJob(JobRequest):
+    """A single job within a batch request"""
+    id: str | None = Field(None, description="Optional client-supplied identifier echoed back in the result")
+
+class BatchRequest(BaseModel):
+    """Request model for batch generation"""
+    jobs: list[BatchJob] = Field(..., description="Jobs to run", min_length=1, max_length=BATCH_MAX_JOBS)
+    concurrency: int | None = Field(
+        None,
+        description="Max jobs to run at once (capped by the server's BATCH_CONCURRENCY)",
+        ge=1
+    )
+
+class JobStatusResponse(BaseModel):
+    """Status of a queued generation job"""
+    id: str = Field(..., description="Job ID")
+    content_type: ContentType = Field(..., description="Type of content being generated")
+    status: Literal["queued", "running", "succeeded", "failed"] = Field(..., description="Job status")
+    progress: float = Field(..., description="Progress from 0.0 to 1.0")
+    message: str | None = Field(None, description="Current stage of the job")
+    error: str | None = Field(None, description="Error message if the job failed")
+    created_at: float = Field(..., description="Submission time (Unix timestamp)")
+    updated_at: float = Field(..., description="Last update time (Unix timestamp)")
+
+class Slide(BaseModel):
+    """A single slide produced by the model"""
+    title: str = Field(..., description="Slide title", min_length=1)
+    content: list[str] = Field(..., description="Bullet points")
+
+    @field_validator("content", mode="before")
+    @classmethod
+    def split_content(cls, value):
+        """Accept bullets as a single newline-separated string"""
+        if isinstance(value, str):
+            return [line.strip().lstrip("-•").strip() for line in value.splitlines() if line.strip()]
+        return value
+
+class WhitepaperSection(BaseModel):
+    """A section of a whitepaper outline produced by the model"""
+    heading: str = Field(..., description="Section heading", min_length=1)
+    key_points: list[str] = Field(default_factory=list, description="Points the section must cover")
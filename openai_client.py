@@ -1,5 +1,11 @@
 import os
-from openai import OpenAI
+import time
+from contextlib import AsyncExitStack
+from typing import AsyncIterator, Callable, NamedTuple
+from metrics import UPSTREAM_ERRORS, UPSTREAM_IN_FLIGHT, observe_phase, record_usage
+from resilience import hedged, latencies, retry_async, time_remaining, with_deadline
+from scheduler import scheduler, estimate_tokens
+from prompts import build_messages
 
 # Load .env file for local development
 try:
@@ -13,27 +19,108 @@ AI_INTEGRATIONS_OPENAI_API_KEY = os.environ.get("AI_INTEGRATIONS_OPENAI_API_KEY"
 AI_INTEGRATIONS_OPENAI_BASE_URL = os.environ.get("AI_INTEGRATIONS_OPENAI_BASE_URL")
 STANDARD_OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 
+# Connection pool limits for the shared async HTTP client
+OPENAI_MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", "600"))
+
 # Determine which environment we're in
 if AI_INTEGRATIONS_OPENAI_API_KEY and AI_INTEGRATIONS_OPENAI_BASE_URL:
     # Running on Replit with AI Integrations
-    client = OpenAI(
-        api_key=AI_INTEGRATIONS_OPENAI_API_KEY,
-        base_url=AI_INTEGRATIONS_OPENAI_BASE_URL
-    )
+    API_KEY = AI_INTEGRATIONS_OPENAI_API_KEY
+    BASE_URL = AI_INTEGRATIONS_OPENAI_BASE_URL
     DEFAULT_MODEL = "gpt-5"  # Replit AI Integrations supports gpt-5
+    LIGHT_MODEL = "gpt-5-mini"  # Cheaper, faster model for short-form content
     print("Using Replit AI Integrations")
 elif STANDARD_OPENAI_API_KEY:
     # Running locally with standard OpenAI
-    client = OpenAI(api_key=STANDARD_OPENAI_API_KEY)
+    API_KEY = STANDARD_OPENAI_API_KEY
+    BASE_URL = None
     DEFAULT_MODEL = "gpt-4o"  # Standard OpenAI - use gpt-4o, gpt-4, or gpt-3.5-turbo
+    LIGHT_MODEL = "gpt-4o-mini"
     print("Using standard OpenAI API")
 else:
-    raise ValueError(
-        "No OpenAI API key found. Please set OPENAI_API_KEY in your .env file "
-        "or environment variables."
-    )
+    # The app still starts (health checks, docs, cached responses); model calls fail until a key is set
+    API_KEY = None
+    BASE_URL = None
+    DEFAULT_MODEL = "gpt-4o"
+    LIGHT_MODEL = "gpt-4o-mini"
+    print("No OpenAI API key found; generation is unavailable until OPENAI_API_KEY is set")
+
+def has_credentials() -> bool:
+    """Whether an API key is configured"""
+    return API_KEY is not None
+
+def require_credentials():
+    """Raise if no API key is configured"""
+    if API_KEY is None:
+        raise ValueError(
+            "No OpenAI API key found. Please set OPENAI_API_KEY in your .env file "
+            "or environment variables."
+        )
+
+# The OpenAI SDK is imported and its clients built on first use, so starting
+# a worker (or importing the app without credentials) does not pay for them.
+_client = None
+_async_client = None
+
+def get_client():
+    """
+    Return the synchronous OpenAI client, creating it on first use.
+    
+    Raises:
+        ValueError: If no API key is configured
+    """
+    global _client
+    if _client is None:
+        require_credentials()
+        from openai import OpenAI
+        _client = OpenAI(api_key=API_KEY, base_url=BASE_URL)
+    return _client
+
+def get_async_client():
+    """
+    Return the shared async OpenAI client, creating it on first use.
+    
+    One pooled HTTP client is reused by every request so concurrent
+    generations share keep-alive connections instead of reconnecting.
+    Retries are handled by generate_content_async so they respect request
+    deadlines.
+    
+    Raises:
+        ValueError: If no API key is configured
+    """
+    global _async_client
+    if _async_client is None:
+        require_credentials()
+        import httpx
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient, Timeout
+        _async_client = AsyncOpenAI(
+            api_key=API_KEY,
+            base_url=BASE_URL,
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS
+                ),
+                # The SDK's own Timeout type, which matches the HTTP library it was built against
+                timeout=Timeout(OPENAI_TIMEOUT, connect=10.0)
+            )
+        )
+    return _async_client
+
+def async_client_ready() -> bool:
+    """Whether the shared async client has been created"""
+    return _async_client is not None
 
-def generate_content(prompt: str, system_message: str, max_completion_tokens: int = 8192) -> str:
+def generate_content(
+    prompt: str,
+    system_message: str,
+    max_completion_tokens: int = 8192,
+    endpoint: str = "",
+    context: str | None = None
+) -> str:
     """
     Generate content using OpenAI's language model.
     
@@ -43,20 +130,281 @@ def generate_content(prompt: str, system_message: str, max_completion_tokens: in
         prompt: User's prompt/request
         system_message: System instruction for the AI
         max_completion_tokens: Maximum tokens in the completion
+        endpoint: Endpoint label for metrics
+        context: Optional context, sent as its own message before the prompt
         
     Returns:
         Generated content as string
     """
-    response = client.chat.completions.create(
+    response = get_client().chat.completions.create(
         model=DEFAULT_MODEL,
-        messages=[
-            {"role": "system", "content": system_message},
-            {"role": "user", "content": prompt}
-        ],
+        messages=build_messages(prompt, system_message, context),
         max_completion_tokens=max_completion_tokens
     )
+    record_usage(endpoint, usage_to_dict(response.usage))
     
     content = response.choices[0].message.content
     if content is None:
         raise ValueError("No content generated from the API")
     return content
+
+async def generate_content_async(
+    prompt: str,
+    system_message: str,
+    max_completion_tokens: int = 8192,
+    context: str | None = None,
+    response_format: dict | None = None,
+    endpoint: str = "",
+    priority: str = "standard",
+    route=None
+) -> str:
+    """
+    Generate content using OpenAI's language model without blocking the event loop.
+    
+    Uses the shared pooled AsyncOpenAI client, so many generations can be
+    in flight on a single worker. Transient failures are retried with
+    jittered backoff within the current request deadline, and interactive
+    calls slower than usual are hedged with a second request. With a
+    route (see routing.py), its model serves the call and its fallback
+    model serves retries and hedges.
+    
+    Args:
+        prompt: User's prompt/request
+        system_message: System instruction for the AI
+        max_completion_tokens: Maximum tokens in the completion
+        context: Optional context, sent as its own message before the prompt
+        response_format: Optional structured output format (e.g. a JSON schema)
+        endpoint: Endpoint label for metrics
+        priority: Scheduler lane ("interactive", "standard" or "bulk")
+        route: Optional ModelRoute choosing the model and tracking its health
+        
+    Returns:
+        Generated content as string
+        
+    Raises:
+        SchedulerRejected: If the upstream scheduler refuses the call
+        DeadlineExceeded: If the request deadline passes first
+    """
+    tokens = estimate_tokens(prompt, system_message, max_completion_tokens, context)
+    attempts = 0
+    
+    async def attempt():
+        nonlocal attempts
+        model = route.select_model(attempts) if route else DEFAULT_MODEL
+        attempts += 1
+        async with scheduler.slot(tokens, priority, endpoint) as settle:
+            start = time.perf_counter()
+            UPSTREAM_IN_FLIGHT.inc()
+            try:
+                response = await get_async_client().chat.completions.create(
+                    model=model,
+                    messages=build_messages(prompt, system_message, context),
+                    max_completion_tokens=max_completion_tokens,
+                    **request_options(response_format)
+                )
+            except Exception as e:
+                UPSTREAM_ERRORS.inc(endpoint=endpoint)
+                if route:
+                    route.record_failure(model)
+                pause_on_rate_limit(e)
+                raise
+            finally:
+                UPSTREAM_IN_FLIGHT.dec()
+                elapsed = time.perf_counter() - start
+                observe_phase("upstream", elapsed, endpoint)
+            latencies.record(endpoint, elapsed)
+            usage = usage_to_dict(response.usage)
+            record_usage(endpoint, usage)
+            if route:
+                route.record_success(model, elapsed, usage)
+            settle(usage and usage["total_tokens"])
+        
+        content = response.choices[0].message.content
+        if content is None:
+            raise ValueError("No content generated from the API")
+        return content
+    
+    hedge_delay = latencies.hedge_delay(endpoint) if priority == "interactive" else None
+    return await retry_async(
+        lambda: with_deadline(hedged(attempt, hedge_delay, endpoint), endpoint),
+        retry_delay,
+        endpoint
+    )
+
+def retry_after_seconds(error: Exception) -> float | None:
+    """Read the Retry-After header of an API error, if any"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def retry_delay(error: Exception) -> float | None:
+    """Minimum wait before retrying a failed call, or None if the error is not transient"""
+    from openai import APIConnectionError, InternalServerError, RateLimitError
+    if isinstance(error, RateLimitError):
+        return retry_after_seconds(error) or 0.0
+    if isinstance(error, (APIConnectionError, InternalServerError)):
+        return 0.0
+    return None
+
+def pause_on_rate_limit(error: Exception):
+    """Hold back queued calls when the API itself reports a rate limit"""
+    from openai import RateLimitError
+    if isinstance(error, RateLimitError):
+        scheduler.pause(retry_after_seconds(error) or 1.0)
+
+def request_options(response_format: dict | None) -> dict:
+    """Optional create() arguments: the response format and the per-attempt HTTP timeout"""
+    options = {}
+    if response_format:
+        options["response_format"] = response_format
+    # What is left of the request deadline, else the client default
+    remaining = time_remaining()
+    if remaining is not None:
+        options["timeout"] = max(remaining, 0.001)
+    return options
+
+def usage_to_dict(usage) -> dict | None:
+    """Convert an API usage object into a plain dict of token counts"""
+    if usage is None:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+        "total_tokens": getattr(usage, "total_tokens", None),
+        # Prompt tokens served from the API's prompt cache
+        "cached_tokens": getattr(details, "cached_tokens", None)
+    }
+
+class OpenStream(NamedTuple):
+    """A model stream that has produced its first content, with the chunks read so far"""
+    chunks: AsyncIterator
+    buffered: list
+    resources: AsyncExitStack
+    settle: Callable[[int | None], None]
+    model: str
+    start: float
+
+async def stream_content_async(
+    prompt: str,
+    system_message: str,
+    max_completion_tokens: int = 8192,
+    context: str | None = None,
+    response_format: dict | None = None,
+    endpoint: str = "",
+    priority: str = "standard",
+    route=None
+):
+    """
+    Stream content from OpenAI's language model as it is generated.
+    
+    Opening the stream is retried like generate_content_async until the first
+    token arrives; interactive streams with no first token by the usual time
+    are hedged. Failures after content has been sent are not retried.
+    Models are chosen from the route as in generate_content_async.
+    
+    Args:
+        prompt: User's prompt/request
+        system_message: System instruction for the AI
+        max_completion_tokens: Maximum tokens in the completion
+        context: Optional context, sent as its own message before the prompt
+        response_format: Optional structured output format (e.g. a JSON schema)
+        endpoint: Endpoint label for metrics
+        priority: Scheduler lane ("interactive", "standard" or "bulk")
+        route: Optional ModelRoute choosing the model and tracking its health
+        
+    Yields:
+        {"delta": text} for each content fragment, then a final
+        {"usage": {...}} with token counts when the API reports them
+    """
+    tokens = estimate_tokens(prompt, system_message, max_completion_tokens, context)
+    ttft_key = f"{endpoint}:ttft"
+    attempts = 0
+    
+    async def open_stream() -> OpenStream:
+        nonlocal attempts
+        model = route.select_model(attempts) if route else DEFAULT_MODEL
+        attempts += 1
+        resources = AsyncExitStack()
+        try:
+            settle = await resources.enter_async_context(scheduler.slot(tokens, priority, endpoint))
+            start = time.perf_counter()
+            UPSTREAM_IN_FLIGHT.inc()
+            resources.callback(UPSTREAM_IN_FLIGHT.dec)
+            resources.callback(lambda: observe_phase("upstream", time.perf_counter() - start, endpoint))
+            stream = await get_async_client().chat.completions.create(
+                model=model,
+                messages=build_messages(prompt, system_message, context),
+                max_completion_tokens=max_completion_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
+                **request_options(response_format)
+            )
+            resources.push_async_callback(stream.close)
+            
+            # Read up to the first content so a stalled stream can be retried or hedged
+            chunks = aiter(stream)
+            buffered = []
+            async for chunk in chunks:
+                buffered.append(chunk)
+                if any(choice.delta.content for choice in chunk.choices) or chunk.usage is not None:
+                    break
+            elapsed = time.perf_counter() - start
+            observe_phase("ttft", elapsed, endpoint)
+            latencies.record(ttft_key, elapsed)
+            return OpenStream(chunks, buffered, resources, settle, model, start)
+        except BaseException as e:
+            if isinstance(e, Exception):
+                UPSTREAM_ERRORS.inc(endpoint=endpoint)
+                if route:
+                    route.record_failure(model)
+                pause_on_rate_limit(e)
+            await resources.aclose()
+            raise
+    
+    async def discard(opened: OpenStream):
+        await opened.resources.aclose()
+    
+    hedge_delay = latencies.hedge_delay(ttft_key) if priority == "interactive" else None
+    opened = await retry_async(
+        lambda: with_deadline(hedged(open_stream, hedge_delay, endpoint, discard), endpoint),
+        retry_delay,
+        endpoint
+    )
+    
+    async def remaining_chunks():
+        for chunk in opened.buffered:
+            yield chunk
+        async for chunk in opened.chunks:
+            yield chunk
+    
+    usage = None
+    try:
+        async with opened.resources:
+            async for chunk in remaining_chunks():
+                for choice in chunk.choices:
+                    if choice.delta.content:
+                        yield {"delta": choice.delta.content}
+                if chunk.usage is not None:
+                    usage = usage_to_dict(chunk.usage)
+                    record_usage(endpoint, usage)
+                    opened.settle(usage["total_tokens"])
+                    yield {"usage": usage}
+    except Exception:
+        UPSTREAM_ERRORS.inc(endpoint=endpoint)
+        if route:
+            route.record_failure(opened.model)
+        raise
+    if route:
+        route.record_success(opened.model, time.perf_counter() - opened.start, usage)
+
+async def close_async_client():
+    """Close the shared async client and its connection pool, if it was created"""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
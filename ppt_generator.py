@@ -1,57 +1,86 @@
+import asyncio
+import hashlib
 import os
 import random
+import re
+import time
 from datetime import datetime
-from pptx import Presentation
-from pptx.util import Inches, Pt
-from pptx.enum.text import PP_ALIGN
-from pptx.dml.color import RGBColor
-from openai_client import generate_content
+from typing import AsyncIterator, Callable, NamedTuple
+from pydantic import ValidationError
+from cache import generate_cached, stream_cached, CacheMissError
+from metrics import observe_phase, record_deck, record_render, timed
+from models import Slide
+from resilience import DeadlineExceeded
+from budget import TokenBudgetExceeded
+from scheduler import SchedulerRejected
+from routing import get_route
+from prompts import PPT_SYSTEM_MESSAGE
+from ppt_renderer import TEMPLATES, DeckBuilder, render_key, render_presentation_async
+from artifacts import artifact_store
 import json
 
-# Define color themes/templates
-TEMPLATES = {
-    "professional_blue": {
-        "name": "Professional Blue",
-        "title_color": RGBColor(0, 51, 102),
-        "text_color": RGBColor(51, 51, 51),
-        "bg_color": RGBColor(255, 255, 255),
-        "accent_color": RGBColor(0, 102, 204)
-    },
-    "modern_green": {
-        "name": "Modern Green",
-        "title_color": RGBColor(34, 139, 34),
-        "text_color": RGBColor(64, 64, 64),
-        "bg_color": RGBColor(255, 255, 255),
-        "accent_color": RGBColor(50, 205, 50)
-    },
-    "vibrant_orange": {
-        "name": "Vibrant Orange",
-        "title_color": RGBColor(230, 81, 0),
-        "text_color": RGBColor(51, 51, 51),
-        "bg_color": RGBColor(255, 255, 255),
-        "accent_color": RGBColor(255, 140, 0)
-    },
-    "elegant_purple": {
-        "name": "Elegant Purple",
-        "title_color": RGBColor(106, 27, 154),
-        "text_color": RGBColor(51, 51, 51),
-        "bg_color": RGBColor(255, 255, 255),
-        "accent_color": RGBColor(142, 36, 170)
-    },
-    "corporate_gray": {
-        "name": "Corporate Gray",
-        "title_color": RGBColor(64, 64, 64),
-        "text_color": RGBColor(96, 96, 96),
-        "bg_color": RGBColor(255, 255, 255),
-        "accent_color": RGBColor(128, 128, 128)
+# Ask the model for JSON-schema structured output (disable for backends without support)
+PPT_STRUCTURED_OUTPUT = os.environ.get("PPT_STRUCTURED_OUTPUT", "true").lower() in ("1", "true", "yes")
+# Follow-up requests allowed to regenerate slides that failed validation
+PPT_REPAIR_ATTEMPTS = int(os.environ.get("PPT_REPAIR_ATTEMPTS", "1"))
+# Render each slide while later slides are still being generated. This renders in a thread of the
+# server process, where python-pptx holds the GIL and delays the event loop, so /ppt and jobs
+# render whole decks in the rendering process pool unless this is enabled
+PPT_PROGRESSIVE_RENDER = os.environ.get("PPT_PROGRESSIVE_RENDER", "false").lower() in ("1", "true", "yes")
+# Template for requests that name none: "hash" derives it from the prompt and context, so identical
+# requests get identical decks; "random" picks one at random
+PPT_TEMPLATE_SELECTION = os.environ.get("PPT_TEMPLATE_SELECTION", "hash")
+# Keep rendered decks in the artifact store and serve an identical deck (same slides and template) from there
+PPT_REUSE_RENDERS = os.environ.get("PPT_REUSE_RENDERS", "true").lower() in ("1", "true", "yes")
+
+SLIDES_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "slide_deck",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "slides": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "title": {"type": "string"},
+                            "content": {"type": "array", "items": {"type": "string"}}
+                        },
+                        "required": ["title", "content"],
+                        "additionalProperties": False
+                    }
+                }
+            },
+            "required": ["slides"],
+            "additionalProperties": False
+        }
     }
 }
 
-def get_template(template_name=None):
-    """Get a template by name or return a random one"""
+SLIDES_ARRAY_START = re.compile(r'"slides"\s*:\s*\[')
+
+def template_seed(prompt: str, context: str | None) -> str:
+    """What the template of a request naming none is chosen by"""
+    return f"{prompt}\n{context or ''}"
+
+def resolve_template_name(template_name=None, seed: str | None = None) -> str:
+    """
+    Return the template name if it exists, otherwise pick a template.
+    
+    With a seed (see template_seed) and PPT_TEMPLATE_SELECTION=hash the pick
+    is derived from the seed, so identical requests get the same template;
+    otherwise it is random.
+    """
     if template_name and template_name in TEMPLATES:
-        return TEMPLATES[template_name]
-    return random.choice(list(TEMPLATES.values()))
+        return template_name
+    names = list(TEMPLATES)
+    if seed is not None and PPT_TEMPLATE_SELECTION == "hash":
+        digest = hashlib.sha256(seed.encode("utf-8")).digest()
+        return names[int.from_bytes(digest[:8], "big") % len(names)]
+    return random.choice(names)
 
 def create_fallback_slides(prompt: str, context: str):
     """Create fallback slides when AI generation fails"""
@@ -86,161 +115,471 @@ def create_fallback_slides(prompt: str, context: str):
         }
     ]
 
+class SlideStreamParser:
+    """
+    Incrementally extract slide objects from (possibly partial) JSON text.
+    
+    Text can be fed in chunks as it arrives. Each complete object in the
+    "slides" array is returned as soon as its closing brace is seen, so a
+    truncated completion or trailing garbage after the array still yields
+    every slide that was fully written.
+    """
+    
+    def __init__(self):
+        self._buffer = ""
+        self._pos = None  # Scan position once the slides array has been found
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start = 0
+        self.found_array = False
+        self.closed = False
+    
+    def feed(self, chunk: str) -> list[str]:
+        """Add text and return the raw JSON of any slide objects it completed"""
+        self._buffer += chunk
+        if self.closed:
+            return []
+        if self._pos is None:
+            match = SLIDES_ARRAY_START.search(self._buffer)
+            if match is None:
+                return []
+            self.found_array = True
+            self._pos = match.end()
+        
+        objects = []
+        buffer = self._buffer
+        for i in range(self._pos, len(buffer)):
+            ch = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._object_start = i
+                self._depth += 1
+            elif ch == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    objects.append(buffer[self._object_start:i + 1])
+            elif ch == "]" and self._depth == 0:
+                self.closed = True
+                break
+        self._pos = len(buffer)
+        return objects
+
+def validate_slide(raw: str | dict) -> dict | None:
+    """Validate one slide object, returning it as a plain dict or None if malformed"""
+    try:
+        data = json.loads(raw) if isinstance(raw, str) else raw
+        return Slide.model_validate(data).model_dump()
+    except (json.JSONDecodeError, ValidationError):
+        return None
+
+class SlideParseResult(NamedTuple):
+    """Slides recovered from a completion"""
+    slides: list[dict | None]  # None where a slide failed validation
+    failed: list[tuple[int, str]]  # (position, raw JSON) of each slide that failed validation
+    complete: bool  # False if the completion was cut off before the array closed
+
+def parse_slides(ai_content: str) -> SlideParseResult | None:
+    """
+    Parse a JSON slide completion, salvaging every well-formed slide.
+    
+    Returns:
+        SlideParseResult, or None if the text has no slides array at all
+    """
+    parser = SlideStreamParser()
+    raw_slides = parser.feed(ai_content)
+    if not parser.found_array:
+        return None
+    
+    slides = []
+    failed = []
+    for idx, raw in enumerate(raw_slides):
+        slide = validate_slide(raw)
+        slides.append(slide)
+        if slide is None:
+            failed.append((idx, raw))
+    return SlideParseResult(slides, failed, parser.closed)
+
+def parse_text_slides(ai_content: str):
+    """Parse "Slide N: Title" style plain text into slides"""
+    lines = ai_content.split('\n')
+    slides = []
+    current_slide = None
+    
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+            
+        if line.startswith('Slide') and ':' in line:
+            if current_slide:
+                slides.append(current_slide)
+            current_slide = {
+                "title": line.split(':', 1)[1].strip(),
+                "content": []
+            }
+        elif current_slide and (line.startswith('-') or line.startswith('•')):
+            current_slide["content"].append(line.lstrip('-•').strip())
+        elif current_slide and line:
+            current_slide["content"].append(line)
+    
+    if current_slide:
+        slides.append(current_slide)
+    
+    if len(slides) < 2:
+        return None
+    
+    return slides
+
 def parse_ai_slides(ai_content: str):
     """Parse AI-generated content into structured slides with validation"""
+    parsed = parse_slides(ai_content)
+    if parsed is None:
+        return parse_text_slides(ai_content)
+    
+    slides = [slide for slide in parsed.slides if slide is not None]
+    if len(slides) < 2:
+        return None
+    
+    return slides
+
+async def repair_slides(
+    prompt: str,
+    context: str,
+    parsed: SlideParseResult,
+    cache_mode: str = "prefer",
+    priority: str = "standard"
+) -> SlideParseResult:
+    """
+    Re-ask the model for only the slides that failed validation.
+    
+    Returns:
+        A new parse result with repaired slides filled in and any slides
+        that are still malformed left in failed
+    """
+    slides = list(parsed.slides)
+    titles = [slide["title"] for slide in slides if slide is not None]
+    broken = "\n".join(f"- {raw[:300]}" for _, raw in parsed.failed)
+    repair_prompt = (
+        f"{prompt}\n\n"
+        f"The presentation already has slides titled: {json.dumps(titles)}.\n"
+        f"These {len(parsed.failed)} slides were malformed:\n{broken}\n\n"
+        f"Return exactly {len(parsed.failed)} corrected slides, in the same order, "
+        "each with a title and 3-5 bullet points."
+    )
+    
+    result = await generate_cached(
+        endpoint="ppt-repair",
+        prompt=repair_prompt,
+        system_message=PPT_SYSTEM_MESSAGE,
+        max_completion_tokens=1024 * len(parsed.failed),
+        context=context,
+        cache_mode=cache_mode,
+        response_format=SLIDES_RESPONSE_FORMAT if PPT_STRUCTURED_OUTPUT else None,
+        priority=priority,
+        route="ppt"
+    )
+    repaired = parse_slides(result.content)
+    replacements = iter(repaired.slides if repaired else [])
+    
+    still_failed = []
+    for idx, raw in parsed.failed:
+        slides[idx] = next(replacements, None)
+        if slides[idx] is None:
+            still_failed.append((idx, raw))
+    return SlideParseResult(slides, still_failed, parsed.complete)
+
+async def find_render(key: str) -> bytes | None:
+    """A stored deck with this render key, if render reuse is enabled"""
+    if not PPT_REUSE_RENDERS:
+        return None
     try:
-        slides_data = json.loads(ai_content)
-        slides = slides_data.get("slides", [])
-        
-        if not slides or len(slides) < 2:
-            return None
-        
-        for slide in slides:
-            if not slide.get("title") or not isinstance(slide.get("content"), list):
-                return None
+        found = await asyncio.to_thread(artifact_store.find_render, key)
+    except Exception as e:
+        print(f"Render lookup error: {e}")
+        return None
+    return found[1] if found is not None else None
+
+async def store_render(data: bytes, template_name: str, key: str):
+    """Keep a rendered deck for reuse; failing to store it never fails the request"""
+    if not PPT_REUSE_RENDERS:
+        return
+    try:
+        await asyncio.to_thread(artifact_store.put, data, template=template_name, render_key=key)
+    except Exception as e:
+        print(f"Render store error: {e}")
+
+async def reused_deck_events(content: str, template_name: str) -> AsyncIterator[dict] | None:
+    """
+    Events for a cached slide completion whose deck was already rendered and stored.
+    
+    Returns:
+        The same events as presentation_events, or None if the slides are not
+        all valid or no identical deck is stored
+    """
+    parsed = parse_slides(content)
+    if parsed is None or parsed.failed or len(parsed.slides) < 2:
+        return None
+    slides = [(slide, idx == 0) for idx, slide in enumerate(parsed.slides)]
+    data = await find_render(render_key(slides, template_name))
+    if data is None:
+        return None
+    
+    async def events():
+        for idx, (slide, _) in enumerate(slides):
+            yield {"event": "slide", "index": idx + 1, "title": slide["title"]}
+        record_deck(False)
+        record_render(True)
+        yield {"event": "done", "data": data, "slides": len(slides), "fallback": False}
+    
+    return events()
+
+async def replay(content: str) -> AsyncIterator[dict]:
+    yield {"delta": content}
+
+def presentation_filename() -> str:
+    """Download filename for a newly generated presentation"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"presentation_{timestamp}.pptx"
+
+async def stream_presentation(
+    prompt: str,
+    context: str,
+    template_name: str | None = None,
+    cache_mode: str = "prefer",
+    priority: str = "standard"
+) -> AsyncIterator[dict]:
+    """
+    Generate a presentation, rendering each slide as soon as the model finishes it.
+    
+    The slide generation stream is parsed incrementally, so python-pptx work
+    overlaps with generation instead of following it. When the slides come
+    from the response cache and an identical deck is already stored, the
+    stored deck is served without rendering.
+    
+    Args:
+        prompt: User's prompt for the presentation
+        context: Additional context
+        template_name: Optional template name (chosen by resolve_template_name if None)
+        cache_mode: Response cache control for the slide generation call
+        priority: Upstream scheduler lane for the model calls
         
-        return slides
-    except json.JSONDecodeError:
-        lines = ai_content.split('\n')
-        slides = []
-        current_slide = None
+    Returns:
+        An iterator yielding {"event": "slide", "index": n, "title": ...} as each
+        slide is rendered, then {"event": "done", "data": bytes, "slides": n,
+        "fallback": bool} with the finished deck
         
-        for line in lines:
-            line = line.strip()
-            if not line:
+    Raises:
+        CacheMissError: If cache_mode is "only" and the slides are not cached
+        SchedulerRejected: If the upstream scheduler refuses the generation
+    """
+    chunks, cache_status = await stream_cached(
+        endpoint="ppt",
+        prompt=prompt,
+        system_message=PPT_SYSTEM_MESSAGE,
+        max_completion_tokens=get_route("ppt").max_completion_tokens,
+        context=context,
+        cache_mode=cache_mode,
+        response_format=SLIDES_RESPONSE_FORMAT if PPT_STRUCTURED_OUTPUT else None,
+        priority=priority,
+        route="ppt"
+    )
+    template_name = resolve_template_name(template_name, template_seed(prompt, context))
+    if cache_status in ("HIT", "SIMILAR") and PPT_REUSE_RENDERS:
+        # A cached completion gives the same slides as before, so the deck may already be stored
+        content = "".join([chunk["delta"] async for chunk in chunks if "delta" in chunk])
+        reused = await reused_deck_events(content, template_name)
+        if reused is not None:
+            return reused
+        chunks = replay(content)
+    return presentation_events(chunks, prompt, context, template_name, cache_mode, priority)
+
+async def presentation_events(
+    chunks: AsyncIterator[dict],
+    prompt: str,
+    context: str,
+    template_name: str,
+    cache_mode: str = "prefer",
+    priority: str = "standard"
+) -> AsyncIterator[dict]:
+    """Render slides from a generation stream as they complete (see stream_presentation)"""
+    deck = await asyncio.to_thread(DeckBuilder, template_name)
+    parser = SlideStreamParser()
+    slides = []
+    failed = []
+    text = []
+    parse_time = 0.0
+    render_time = 0.0
+    
+    async def add_slide(slide: dict, title_slide: bool, position: int | None = None):
+        nonlocal render_time
+        start = time.perf_counter()
+        await asyncio.to_thread(deck.add_slide, slide, title_slide, position)
+        render_time += time.perf_counter() - start
+    
+    try:
+        async for chunk in chunks:
+            if "delta" not in chunk:
                 continue
-                
-            if line.startswith('Slide') and ':' in line:
-                if current_slide:
-                    slides.append(current_slide)
-                current_slide = {
-                    "title": line.split(':', 1)[1].strip(),
-                    "content": []
-                }
-            elif current_slide and (line.startswith('-') or line.startswith('•')):
-                current_slide["content"].append(line.lstrip('-•').strip())
-            elif current_slide and line:
-                current_slide["content"].append(line)
-        
-        if current_slide:
-            slides.append(current_slide)
-        
-        if len(slides) < 2:
-            return None
-        
-        return slides
+            text.append(chunk["delta"])
+            start = time.perf_counter()
+            completed = [(raw, validate_slide(raw)) for raw in parser.feed(chunk["delta"])]
+            parse_time += time.perf_counter() - start
+            for raw, slide in completed:
+                slides.append(slide)
+                if slide is None:
+                    failed.append((len(slides) - 1, raw))
+                    continue
+                await add_slide(slide, len(slides) == 1)
+                yield {"event": "slide", "index": len(deck), "title": slide["title"]}
+    except SchedulerRejected:
+        raise
+    except Exception as e:
+        if isinstance(e, DeadlineExceeded) and len(deck) == 0:
+            raise
+        # Keep whatever slides were completed before the stream failed
+        print(f"AI generation error: {e}")
+    
+    if not parser.found_array:
+        start = time.perf_counter()
+        text_slides = parse_text_slides("".join(text)) or []
+        parse_time += time.perf_counter() - start
+        for slide in text_slides:
+            await add_slide(slide, len(deck) == 0)
+            yield {"event": "slide", "index": len(deck), "title": slide["title"]}
+    
+    parsed = SlideParseResult(slides, failed, parser.closed)
+    for _ in range(PPT_REPAIR_ATTEMPTS):
+        if not parsed.failed:
+            break
+        try:
+            repaired = await repair_slides(prompt, context, parsed, cache_mode, priority)
+        except Exception as e:
+            print(f"Slide repair error: {e}")
+            break
+        # Insert repaired slides at their original positions, in order
+        for idx, _ in parsed.failed:
+            slide = repaired.slides[idx]
+            if slide is None:
+                continue
+            position = sum(1 for earlier in repaired.slides[:idx] if earlier is not None)
+            await add_slide(slide, idx == 0, position)
+            yield {"event": "slide", "index": position + 1, "title": slide["title"]}
+        parsed = repaired
+    
+    fallback = len(deck) < 2
+    if fallback:
+        deck = await asyncio.to_thread(DeckBuilder, template_name)
+        for idx, slide in enumerate(create_fallback_slides(prompt, context)):
+            await add_slide(slide, idx == 0)
+    
+    observe_phase("parse", parse_time, "ppt")
+    observe_phase("render", render_time, "ppt")
+    with timed("save", "ppt"):
+        data = await asyncio.to_thread(deck.save)
+    record_deck(fallback)
+    record_render(False)
+    await store_render(data, template_name, deck.key())
+    yield {"event": "done", "data": data, "slides": len(deck), "fallback": fallback}
 
-def create_presentation(prompt: str, context: str, template_name: str | None = None) -> str:
+async def create_presentation(
+    prompt: str,
+    context: str,
+    template_name: str | None = None,
+    cache_mode: str = "prefer",
+    progress_callback: Callable[[float, str], None] | None = None,
+    priority: str = "standard"
+) -> bytes:
     """
     Generate a PowerPoint presentation from prompt and context.
     
     Args:
         prompt: User's prompt for the presentation
         context: Additional context
-        template_name: Optional template name (or random if None)
+        template_name: Optional template name (chosen by resolve_template_name if None)
+        cache_mode: Response cache control for the slide generation call
+        progress_callback: Optional callback receiving (fraction, message) as work progresses
+        priority: Upstream scheduler lane for the model calls
         
     Returns:
-        Path to the generated .pptx file
+        The generated .pptx file contents
     """
-    system_message = """You are an expert presentation designer. Create a structured PowerPoint presentation.
-    Return your response as a JSON object with this exact structure:
-    {
-        "slides": [
-            {
-                "title": "Slide Title",
-                "content": ["Bullet point 1", "Bullet point 2", "Bullet point 3"]
-            }
-        ]
-    }
+    def report(progress: float, message: str):
+        if progress_callback is not None:
+            progress_callback(progress, message)
     
-    Rules:
-    - Create 5-8 slides total
-    - First slide should be a title slide with the main topic
-    - Each content slide should have 3-5 bullet points
-    - Keep bullet points concise (max 10-15 words each)
-    - Last slide should be a conclusion or summary
-    - Use clear, professional language
-    """
+    report(0.1, "Generating slide content")
     
-    full_prompt = f"{prompt}\n\nContext: {context}"
+    if PPT_PROGRESSIVE_RENDER:
+        events = await stream_presentation(prompt, context, template_name, cache_mode, priority)
+        rendered = 0
+        async for event in events:
+            if event["event"] == "slide":
+                rendered += 1
+                report(min(0.1 + 0.1 * rendered, 0.9), f"{rendered} slides ready")
+            elif event["event"] == "done":
+                return event["data"]
     
     slides_data = None
     
     try:
-        ai_response = generate_content(
-            prompt=full_prompt,
-            system_message=system_message,
-            max_completion_tokens=4096
+        result = await generate_cached(
+            endpoint="ppt",
+            prompt=prompt,
+            system_message=PPT_SYSTEM_MESSAGE,
+            max_completion_tokens=get_route("ppt").max_completion_tokens,
+            context=context,
+            cache_mode=cache_mode,
+            response_format=SLIDES_RESPONSE_FORMAT if PPT_STRUCTURED_OUTPUT else None,
+            priority=priority,
+            route="ppt"
         )
-        slides_data = parse_ai_slides(ai_response)
+        with timed("parse", "ppt"):
+            parsed = parse_slides(result.content)
+            if parsed is None:
+                slides_data = parse_text_slides(result.content)
+        if parsed is not None:
+            for _ in range(PPT_REPAIR_ATTEMPTS):
+                if not parsed.failed:
+                    break
+                report(0.4, f"Regenerating {len(parsed.failed)} malformed slides")
+                try:
+                    parsed = await repair_slides(prompt, context, parsed, cache_mode, priority)
+                except Exception as e:
+                    # Keep the slides that parsed rather than falling back to placeholders
+                    print(f"Slide repair error: {e}")
+                    break
+            slides_data = [slide for slide in parsed.slides if slide is not None]
+    except (CacheMissError, SchedulerRejected, DeadlineExceeded, TokenBudgetExceeded):
+        raise
     except Exception as e:
         print(f"AI generation error: {e}")
         slides_data = None
     
-    if not slides_data or len(slides_data) < 2:
+    fallback = not slides_data or len(slides_data) < 2
+    if fallback:
         slides_data = create_fallback_slides(prompt, context)
+    record_deck(fallback)
     
-    template = get_template(template_name)
-    
-    prs = Presentation()
-    prs.slide_width = Inches(10)
-    prs.slide_height = Inches(7.5)
-    
-    for idx, slide_data in enumerate(slides_data):
-        if idx == 0:
-            slide = prs.slides.add_slide(prs.slide_layouts[6])
-            
-            title_box = slide.shapes.add_textbox(
-                Inches(1), Inches(2.5), Inches(8), Inches(1.5)
-            )
-            title_frame = title_box.text_frame
-            title_frame.text = slide_data.get("title", "Presentation")
-            title_para = title_frame.paragraphs[0]
-            title_para.font.size = Pt(44)
-            title_para.font.bold = True
-            title_para.font.color.rgb = template["title_color"]
-            title_para.alignment = PP_ALIGN.CENTER
-            
-            if slide_data.get("content"):
-                subtitle_box = slide.shapes.add_textbox(
-                    Inches(1), Inches(4.5), Inches(8), Inches(1)
-                )
-                subtitle_frame = subtitle_box.text_frame
-                subtitle_frame.text = " | ".join(slide_data["content"][:2])
-                subtitle_para = subtitle_frame.paragraphs[0]
-                subtitle_para.font.size = Pt(20)
-                subtitle_para.font.color.rgb = template["text_color"]
-                subtitle_para.alignment = PP_ALIGN.CENTER
-        else:
-            slide = prs.slides.add_slide(prs.slide_layouts[6])
-            
-            title_box = slide.shapes.add_textbox(
-                Inches(0.5), Inches(0.5), Inches(9), Inches(0.8)
-            )
-            title_frame = title_box.text_frame
-            title_frame.text = slide_data.get("title", f"Slide {idx + 1}")
-            title_para = title_frame.paragraphs[0]
-            title_para.font.size = Pt(32)
-            title_para.font.bold = True
-            title_para.font.color.rgb = template["title_color"]
-            
-            content_box = slide.shapes.add_textbox(
-                Inches(0.8), Inches(1.8), Inches(8.4), Inches(5)
-            )
-            content_frame = content_box.text_frame
-            content_frame.word_wrap = True
-            
-            for bullet in slide_data.get("content", []):
-                p = content_frame.add_paragraph()
-                p.text = bullet
-                p.level = 0
-                p.font.size = Pt(18)
-                p.font.color.rgb = template["text_color"]
-                p.space_before = Pt(12)
-    
-    os.makedirs("generated_ppts", exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"generated_ppts/presentation_{timestamp}.pptx"
+    template_name = resolve_template_name(template_name, template_seed(prompt, context))
+    key = render_key([(slide, idx == 0) for idx, slide in enumerate(slides_data)], template_name)
+    data = await find_render(key)
+    if data is not None:
+        # An identical deck was rendered before
+        record_render(True)
+        return data
     
-    prs.save(filename)
-    return filename
+    report(0.6, f"Rendering {len(slides_data)} slides")
+    data = await render_presentation_async(slides_data, template_name)
+    record_render(False)
+    await store_render(data, template_name, key)
+    return data
@@ -0,0 +1,391 @@
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import struct
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from metrics import observe_phase
+from shared_state import WORKERS
+
+# Number of rendering processes per worker (0 renders in a thread instead); by
+# default the cores are split between the workers, up to 4 each
+PPT_RENDER_WORKERS = int(os.environ.get(
+    "PPT_RENDER_WORKERS", str(min(4, max(1, (os.cpu_count() or 1) // WORKERS)))
+))
+
+# Bump when rendering output changes, so decks stored by an older renderer are not reused
+RENDERER_VERSION = 1
+# Timestamp of every file inside a rendered .pptx (the earliest a zip can hold)
+STABLE_ZIP_TIME = (1980, 1, 1, 0, 0, 0)
+
+# Define color themes/templates (colors are RGB hex strings)
+TEMPLATES = {
+    "professional_blue": {
+        "name": "Professional Blue",
+        "title_color": "003366",
+        "text_color": "333333",
+        "bg_color": "FFFFFF",
+        "accent_color": "0066CC"
+    },
+    "modern_green": {
+        "name": "Modern Green",
+        "title_color": "228B22",
+        "text_color": "404040",
+        "bg_color": "FFFFFF",
+        "accent_color": "32CD32"
+    },
+    "vibrant_orange": {
+        "name": "Vibrant Orange",
+        "title_color": "E65100",
+        "text_color": "333333",
+        "bg_color": "FFFFFF",
+        "accent_color": "FF8C00"
+    },
+    "elegant_purple": {
+        "name": "Elegant Purple",
+        "title_color": "6A1B9A",
+        "text_color": "333333",
+        "bg_color": "FFFFFF",
+        "accent_color": "8E24AA"
+    },
+    "corporate_gray": {
+        "name": "Corporate Gray",
+        "title_color": "404040",
+        "text_color": "606060",
+        "bg_color": "FFFFFF",
+        "accent_color": "808080"
+    }
+}
+
+# Layout indexes kept in each compiled template skeleton
+TITLE_LAYOUT = 0
+CONTENT_LAYOUT = 1
+
+def _style_placeholder(
+    placeholder,
+    box: tuple[float, float, float, float],
+    font_size: int,
+    color: str,
+    bold: bool = False,
+    align: str = "l",
+    space_before: int | None = None
+):
+    """Position a layout placeholder and set the text style slides inherit from it"""
+    from pptx.util import Inches
+    from pptx.oxml import parse_xml
+    from pptx.oxml.ns import nsdecls, qn
+    left, top, width, height = box
+    placeholder.left = Inches(left)
+    placeholder.top = Inches(top)
+    placeholder.width = Inches(width)
+    placeholder.height = Inches(height)
+    
+    spacing = f'<a:spcBef><a:spcPts val="{space_before * 100}"/></a:spcBef>' if space_before else ""
+    level_style = parse_xml(
+        f'<a:lvl1pPr {nsdecls("a")} marL="0" indent="0" algn="{align}">'
+        f'{spacing}<a:buNone/>'
+        f'<a:defRPr sz="{font_size * 100}" b="{1 if bold else 0}">'
+        f'<a:solidFill><a:srgbClr val="{color}"/></a:solidFill>'
+        f'</a:defRPr></a:lvl1pPr>'
+    )
+    text_body = placeholder.text_frame._txBody
+    list_style = text_body.find(qn("a:lstStyle"))
+    if list_style is None:
+        list_style = parse_xml(f'<a:lstStyle {nsdecls("a")}/>')
+        text_body.bodyPr.addnext(list_style)
+    list_style.clear()
+    list_style.append(level_style)
+
+def build_template_skeleton(template: dict) -> bytes:
+    """
+    Build a pre-styled, empty deck for a template.
+    
+    The skeleton has the slide size and background set on the master and
+    two themed layouts (title slide and title + content) whose placeholders
+    carry the template's positions, fonts and colors, so rendering a deck
+    only has to fill in text.
+    
+    Returns:
+        The skeleton .pptx file contents
+    """
+    from pptx import Presentation
+    from pptx.util import Inches
+    from pptx.dml.color import RGBColor
+    prs = Presentation()
+    prs.slide_width = Inches(10)
+    prs.slide_height = Inches(7.5)
+    
+    background = prs.slide_master.background.fill
+    background.solid()
+    background.fore_color.rgb = RGBColor.from_string(template["bg_color"])
+    
+    layouts = list(prs.slide_layouts)
+    for layout in layouts[CONTENT_LAYOUT + 1:]:
+        prs.slide_layouts.remove(layout)
+    
+    title_layout = layouts[TITLE_LAYOUT]
+    _style_placeholder(
+        title_layout.placeholders.get(idx=0), (1, 2.5, 8, 1.5),
+        44, template["title_color"], bold=True, align="ctr"
+    )
+    _style_placeholder(
+        title_layout.placeholders.get(idx=1), (1, 4.5, 8, 1),
+        20, template["text_color"], align="ctr"
+    )
+    
+    content_layout = layouts[CONTENT_LAYOUT]
+    _style_placeholder(
+        content_layout.placeholders.get(idx=0), (0.5, 0.5, 9, 0.8),
+        32, template["title_color"], bold=True
+    )
+    _style_placeholder(
+        content_layout.placeholders.get(idx=1), (0.8, 1.8, 8.4, 5),
+        18, template["text_color"], space_before=12
+    )
+    
+    buffer = BytesIO()
+    prs.save(buffer)
+    return buffer.getvalue()
+
+def stable_zip(data: bytes) -> bytes:
+    """
+    Set every timestamp in a zip file to STABLE_ZIP_TIME.
+    
+    python-pptx stamps each part with the current time, so otherwise the same
+    deck rendered twice differs in its bytes. The timestamps are patched in the
+    local and central directory headers (the CRCs don't cover them), which
+    avoids recompressing the parts; an unexpected layout is rewritten instead.
+    """
+    year, month, day, hour, minute, second = STABLE_ZIP_TIME
+    stamp = struct.pack("<HH", hour << 11 | minute << 5 | second // 2, (year - 1980) << 9 | month << 5 | day)
+    out = bytearray(data)
+    with zipfile.ZipFile(BytesIO(data)) as archive:
+        infos = archive.infolist()
+        offset = archive.start_dir
+    for info in infos:
+        if out[info.header_offset:info.header_offset + 4] != b"PK\x03\x04":
+            return _rewrite_zip(data)
+        out[info.header_offset + 10:info.header_offset + 14] = stamp
+    for _ in infos:
+        if out[offset:offset + 4] != b"PK\x01\x02":
+            return _rewrite_zip(data)
+        out[offset + 12:offset + 16] = stamp
+        name_length, extra_length, comment_length = struct.unpack_from("<HHH", out, offset + 28)
+        offset += 46 + name_length + extra_length + comment_length
+    return bytes(out)
+
+def _rewrite_zip(data: bytes) -> bytes:
+    """Copy a zip file's entries into a new one with fixed timestamps and attributes"""
+    buffer = BytesIO()
+    with zipfile.ZipFile(BytesIO(data)) as source, zipfile.ZipFile(buffer, "w") as target:
+        for info in source.infolist():
+            stable = zipfile.ZipInfo(info.filename, date_time=STABLE_ZIP_TIME)
+            stable.compress_type = info.compress_type
+            stable.external_attr = 0o600 << 16
+            target.writestr(stable, source.read(info))
+    return buffer.getvalue()
+
+def render_key(slides: list[tuple[dict, bool]], template_name: str) -> str:
+    """
+    Identity of a rendered deck, for reusing an identical earlier render.
+    
+    Args:
+        slides: (slide dict, is title slide) pairs in deck order
+        template_name: Key into TEMPLATES
+    """
+    payload = json.dumps(
+        {
+            "renderer": RENDERER_VERSION,
+            "template": template_name,
+            "colors": TEMPLATES[template_name],
+            "slides": [[slide, title_slide] for slide, title_slide in slides]
+        },
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+_skeletons: dict[str, bytes] = {}
+
+def compile_templates():
+    """Build the skeleton deck for every entry in TEMPLATES"""
+    for name, template in TEMPLATES.items():
+        _skeletons[name] = build_template_skeleton(template)
+
+def get_skeleton(template_name: str) -> bytes:
+    """Return the compiled skeleton for a template, building it on first use"""
+    if template_name not in _skeletons:
+        _skeletons[template_name] = build_template_skeleton(TEMPLATES[template_name])
+    return _skeletons[template_name]
+
+def _remove_placeholder(placeholder):
+    element = placeholder._element
+    element.getparent().remove(element)
+
+class DeckBuilder:
+    """
+    Builds a deck one slide at a time from a template's compiled skeleton.
+    
+    Used directly for progressive rendering, where slides are added as the
+    model produces them, and by render_presentation for whole decks.
+    """
+    
+    def __init__(self, template_name: str):
+        from pptx import Presentation
+        self.template_name = template_name
+        self.slides: list[tuple[dict, bool]] = []  # (slide dict, is title slide) in deck order
+        self._prs = Presentation(BytesIO(get_skeleton(template_name)))
+        self._title_layout = self._prs.slide_layouts[TITLE_LAYOUT]
+        self._content_layout = self._prs.slide_layouts[CONTENT_LAYOUT]
+    
+    def __len__(self) -> int:
+        return len(self._prs.slides)
+    
+    def add_slide(self, slide_data: dict, title_slide: bool = False, position: int | None = None):
+        """
+        Add a slide by filling a layout's placeholders.
+        
+        Args:
+            slide_data: Slide dict with "title" and "content" (list of bullets)
+            title_slide: Use the title slide layout instead of title + content
+            position: Insert at this index instead of appending
+        """
+        content = slide_data.get("content") or []
+        if title_slide:
+            slide = self._prs.slides.add_slide(self._title_layout)
+            slide.placeholders[0].text_frame.text = slide_data.get("title", "Presentation")
+            if content:
+                slide.placeholders[1].text_frame.text = " | ".join(content[:2])
+            else:
+                _remove_placeholder(slide.placeholders[1])
+        else:
+            slide = self._prs.slides.add_slide(self._content_layout)
+            slide.placeholders[0].text_frame.text = slide_data.get("title", f"Slide {len(self)}")
+            body = slide.placeholders[1]
+            if content:
+                body.text_frame.text = "\n".join(content)
+            else:
+                _remove_placeholder(body)
+        
+        if position is not None and position < len(self) - 1:
+            slide_ids = self._prs.slides._sldIdLst
+            slide_id = slide_ids[-1]
+            slide_ids.remove(slide_id)
+            slide_ids.insert(position, slide_id)
+            self.slides.insert(position, (slide_data, title_slide))
+        else:
+            self.slides.append((slide_data, title_slide))
+    
+    def key(self) -> str:
+        """render_key of the deck built so far"""
+        return render_key(self.slides, self.template_name)
+    
+    def save(self) -> bytes:
+        """Serialize the deck to .pptx bytes, identical for identical decks"""
+        buffer = BytesIO()
+        self._prs.save(buffer)
+        return stable_zip(buffer.getvalue())
+
+def render_presentation(slides_data: list[dict], template_name: str) -> bytes:
+    """
+    Render slides into a .pptx file in memory.
+    
+    Clones the template's compiled skeleton and fills its placeholders.
+    
+    Args:
+        slides_data: Slides as dicts with "title" and "content" (list of bullets)
+        template_name: Key into TEMPLATES
+        
+    Returns:
+        The .pptx file contents
+    """
+    data, _, _ = _render_timed(slides_data, template_name)
+    return data
+
+def _render_timed(slides_data: list[dict], template_name: str) -> tuple[bytes, float, float]:
+    """Render a deck, also returning the fill and save durations so the caller's process can record them"""
+    start = time.perf_counter()
+    deck = DeckBuilder(template_name)
+    for idx, slide_data in enumerate(slides_data):
+        deck.add_slide(slide_data, title_slide=(idx == 0))
+    filled = time.perf_counter()
+    data = deck.save()
+    return data, filled - start, time.perf_counter() - filled
+
+def _warm_worker():
+    """Process pool initializer: load python-pptx and compile template skeletons up front"""
+    compile_templates()
+
+def _ping() -> int:
+    return os.getpid()
+
+_render_pool: ProcessPoolExecutor | None = None
+
+def start_render_pool(workers: int = PPT_RENDER_WORKERS):
+    """Start the rendering process pool and spawn all of its workers (no-op when rendering in threads)"""
+    global _render_pool
+    if workers <= 0 or _render_pool is not None:
+        return
+    _render_pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_warm_worker
+    )
+    # Workers are spawned on demand; submit one task per worker so they start warm
+    for _ in range(workers):
+        _render_pool.submit(_ping)
+
+def get_render_pool() -> ProcessPoolExecutor | None:
+    """Return the rendering process pool, starting it on first use (None when rendering in threads)"""
+    if _render_pool is None:
+        start_render_pool()
+    return _render_pool
+
+def warm_renderer():
+    """Load python-pptx and compile the template skeletons in this process, then start the pool"""
+    compile_templates()
+    start_render_pool()
+
+def describe_renderer() -> dict:
+    """Whether the renderer has been initialized: compiled templates and running pool workers"""
+    return {
+        "templates_compiled": len(_skeletons),
+        "pool_workers": _render_pool._max_workers if _render_pool is not None else 0
+    }
+
+def shutdown_render_pool():
+    """Stop the rendering process pool"""
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=False, cancel_futures=True)
+        _render_pool = None
+
+async def render_presentation_async(slides_data: list[dict], template_name: str) -> bytes:
+    """
+    Render slides off the event loop.
+    
+    Uses the process pool (started on the first render) so rendering scales
+    with cores, or a worker thread when PPT_RENDER_WORKERS is 0.
+    
+    Args:
+        slides_data: Slides as plain dicts with "title" and "content"
+        template_name: Key into TEMPLATES
+        
+    Returns:
+        The .pptx file contents
+    """
+    pool = get_render_pool()
+    if pool is None:
+        data, render_time, save_time = await asyncio.to_thread(_render_timed, slides_data, template_name)
+    else:
+        loop = asyncio.get_running_loop()
+        data, render_time, save_time = await loop.run_in_executor(
+            pool, _render_timed, slides_data, template_name
+        )
+    observe_phase("render", render_time, "ppt")
+    observe_phase("save", save_time, "ppt")
+    return data
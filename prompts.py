@@ -0,0 +1,235 @@
+import hashlib
+import textwrap
+from functools import lru_cache
+from typing import NamedTuple
+
+try:
+    import tiktoken
+except ImportError:  # Optional: token counts fall back to an estimate of ~4 characters per token
+    tiktoken = None
+
+# Tokenizer used by the gpt-4o and gpt-5 model families
+TOKEN_ENCODING = "o200k_base"
+# Tokens the API adds around each chat message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+class PromptTemplate(NamedTuple):
+    """A registered system prompt: bump the version whenever the text changes meaning"""
+    name: str
+    version: int
+    text: str
+    fingerprint: str  # Short hash of the normalized text
+
+# Registry of system prompts by name
+PROMPTS: dict[str, PromptTemplate] = {}
+
+def normalize_template(text: str) -> str:
+    """Remove the indentation and trailing whitespace triple-quoted strings pick up from the source"""
+    first, _, rest = text.strip("\n").partition("\n")
+    lines = [first.strip()] + textwrap.dedent(rest).splitlines()
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+def register_prompt(name: str, version: int, text: str) -> str:
+    """Normalize a system prompt, add it to the registry and return its text"""
+    text = normalize_template(text)
+    fingerprint = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+    PROMPTS[name] = PromptTemplate(name, version, text, fingerprint)
+    return text
+
+BLOG_SYSTEM_MESSAGE = register_prompt("blog-post", 1, """You are an expert blog writer. Create engaging, well-structured blog posts 
+        with clear headings, compelling introductions, informative body content, and strong conclusions. 
+        Use a conversational yet professional tone. Include relevant examples and insights.""")
+
+WHITEPAPER_SYSTEM_MESSAGE = register_prompt("whitepaper", 1, """You are an expert technical writer specializing in whitepapers. 
+        Create comprehensive, well-researched whitepapers with executive summaries, problem statements, 
+        methodology, analysis, conclusions, and recommendations. Use formal, authoritative language 
+        with proper citations and data-driven insights. Structure the content with clear sections.""")
+
+FACEBOOK_SYSTEM_MESSAGE = register_prompt("facebook-post", 1, """You are a social media expert specializing in Facebook content. 
+        Create engaging, friendly Facebook posts that encourage interaction. Use emojis appropriately, 
+        include a hook to grab attention, tell a story or share value, and include a clear call-to-action. 
+        Keep it conversational and relatable. Suggest relevant hashtags at the end.""")
+
+LINKEDIN_SYSTEM_MESSAGE = register_prompt("linkedin-post", 1, """You are a professional content creator specializing in LinkedIn posts. 
+        Create engaging, professional LinkedIn content that provides value to a business audience. 
+        Use a professional yet personable tone, share insights or lessons, include relevant industry 
+        knowledge, and end with a thought-provoking question or call-to-action to encourage engagement. 
+        Use minimal emojis. Suggest relevant professional hashtags at the end.""")
+
+WHITEPAPER_OUTLINE_SYSTEM_MESSAGE = register_prompt("whitepaper-outline", 1, """You are an expert technical writer planning a whitepaper.
+    Return a JSON object with the whitepaper title and its sections in order:
+    {
+        "title": "Whitepaper Title",
+        "sections": [
+            {
+                "heading": "Executive Summary",
+                "key_points": ["Point the section must cover", "Another point"]
+            }
+        ]
+    }
+    
+    Rules:
+    - Use these sections in this order: Executive Summary, Problem Statement, Methodology,
+      Analysis, Recommendations (split Analysis into several sections if the topic needs it)
+    - Give each section 3-6 concise key points
+    """)
+
+WHITEPAPER_SECTION_SYSTEM_MESSAGE = register_prompt("whitepaper-section", 1, WHITEPAPER_SYSTEM_MESSAGE + "\n" + normalize_template("""
+        You are writing one section of a larger whitepaper from its outline. Write only the requested
+        section, without its heading, and stay consistent with the rest of the outline."""))
+
+CAMPAIGN_DRAFT_SYSTEM_MESSAGE = register_prompt("campaign-draft", 1, """You are a content strategist preparing a campaign brief that writers
+        will adapt for a blog, LinkedIn, Facebook and a presentation. Summarize the topic as concise
+        key points: a working headline, the target audience, 4-6 key messages with supporting facts
+        or examples, and the call-to-action. Use short bullet points and no channel-specific styling.""")
+
+CONTEXT_SUMMARY_SYSTEM_MESSAGE = register_prompt("context-summary", 1, """You condense reference material for a writer whose context
+        is too long to use in full. Summarize the context you are given, keeping the facts, figures,
+        names, quotes and arguments relevant to the writer's task and dropping the rest. Use short
+        bullet points and add nothing that is not in the context.""")
+
+PPT_SYSTEM_MESSAGE = register_prompt("ppt", 1, """You are an expert presentation designer. Create a structured PowerPoint presentation.
+    Return your response as a JSON object with this exact structure:
+    {
+        "slides": [
+            {
+                "title": "Slide Title",
+                "content": ["Bullet point 1", "Bullet point 2", "Bullet point 3"]
+            }
+        ]
+    }
+    
+    Rules:
+    - Create 5-8 slides total
+    - First slide should be a title slide with the main topic
+    - Each content slide should have 3-5 bullet points
+    - Keep bullet points concise (max 10-15 words each)
+    - Last slide should be a conclusion or summary
+    - Use clear, professional language
+    """)
+
+# Registry of generation settings per content type, shared by the endpoints and /batch
+CONTENT_TYPES = {
+    "blog-post": {
+        "label": "blog post",
+        "system_message": BLOG_SYSTEM_MESSAGE,
+        "max_completion_tokens": 8192,
+        "requires_context": False,
+        "priority": "standard"
+    },
+    "whitepaper": {
+        "label": "whitepaper",
+        "system_message": WHITEPAPER_SYSTEM_MESSAGE,
+        "max_completion_tokens": 8192,
+        "requires_context": False,
+        "priority": "standard"
+    },
+    "ppt": {
+        "label": "PowerPoint",
+        "system_message": PPT_SYSTEM_MESSAGE,
+        "max_completion_tokens": 4096,
+        "requires_context": True,
+        "priority": "standard"
+    },
+    "facebook-post": {
+        "label": "Facebook post",
+        "system_message": FACEBOOK_SYSTEM_MESSAGE,
+        "max_completion_tokens": 2048,
+        "requires_context": True,
+        "priority": "interactive"
+    },
+    "linkedin-post": {
+        "label": "LinkedIn post",
+        "system_message": LINKEDIN_SYSTEM_MESSAGE,
+        "max_completion_tokens": 2048,
+        "requires_context": True,
+        "priority": "interactive"
+    }
+}
+
+def get_content_type(content_type: str) -> dict:
+    """Look up the registry entry for a content type"""
+    if content_type not in CONTENT_TYPES:
+        raise ValueError(f"Unknown content type: {content_type}")
+    return CONTENT_TYPES[content_type]
+
+def build_messages(prompt: str, system_message: str, context: str | None = None) -> list[dict]:
+    """
+    Lay out the chat messages so the static part comes first.
+
+    The system message is followed by the context and then the instruction,
+    each in its own message, so requests sharing a system prompt (and
+    context) share a prefix the API can serve from its prompt cache.
+    """
+    messages = [{"role": "system", "content": system_message}]
+    if context:
+        messages.append({"role": "user", "content": f"Context:\n{context}"})
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+@lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception as e:
+        print(f"Token encoding unavailable, estimating token counts: {e}")
+        return None
+
+def count_tokens(text: str) -> int:
+    """Tokens in a text: exact with tiktoken installed, otherwise ~4 characters per token"""
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+@lru_cache(maxsize=256)
+def template_tokens(text: str) -> int:
+    """Token count of a system prompt, cached since the same few prompts are counted on every call"""
+    return count_tokens(text)
+
+def count_message_tokens(prompt: str, system_message: str, context: str | None = None) -> int:
+    """Prompt tokens of a request laid out by build_messages"""
+    messages = build_messages(prompt, system_message, context)
+    total = template_tokens(system_message) + MESSAGE_OVERHEAD_TOKENS
+    for message in messages[1:]:
+        total += count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+    return total
+
+def split_text(text: str, max_tokens: int) -> list[str]:
+    """
+    Split a text into pieces of about max_tokens tokens or fewer.
+
+    Pieces are cut at paragraph, line or word boundaries where possible,
+    sized from the text's average characters per token.
+    """
+    total = count_tokens(text)
+    if total <= max_tokens:
+        return [text]
+    max_chars = max(len(text) * max_tokens // total, 1)
+    pieces = []
+    start = 0
+    while start < len(text):
+        end = min(start + max_chars, len(text))
+        if end < len(text):
+            for separator in ("\n\n", "\n", " "):
+                cut = text.rfind(separator, start + max_chars // 2, end)
+                if cut != -1:
+                    end = cut + len(separator)
+                    break
+        pieces.append(text[start:end])
+        start = end
+    return pieces
+
+def describe_prompts() -> dict:
+    """Version, fingerprint and token count of every registered prompt"""
+    return {
+        name: {
+            "version": template.version,
+            "fingerprint": template.fingerprint,
+            "tokens": template_tokens(template.text),
+            "exact_tokens": _encoding() is not None
+        }
+        for name, template in PROMPTS.items()
+    }
@@ -0,0 +1,185 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable
+from metrics import Counter, METRICS
+
+# Default deadline for a request in seconds (0 means none; requests can set their own `timeout`)
+REQUEST_TIMEOUT = float(os.environ.get("REQUEST_TIMEOUT", "0"))
+# Total attempts for a model call with transient failures, and the backoff between them
+RETRY_ATTEMPTS = int(os.environ.get("RETRY_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.environ.get("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY", "8"))
+# Hedged requests for interactive calls: a second request is sent once the first is slower than
+# the HEDGE_QUANTILE latency, for at most HEDGE_MAX_RATIO of calls
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "true").lower() in ("1", "true", "yes")
+HEDGE_QUANTILE = float(os.environ.get("HEDGE_QUANTILE", "0.95"))
+HEDGE_MAX_RATIO = float(os.environ.get("HEDGE_MAX_RATIO", "0.1"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "20"))
+
+RETRIES = Counter("upstream_retries_total", "Model calls retried after a transient failure", ("endpoint",))
+HEDGES = Counter("upstream_hedges_total", "Hedged second requests, by whether they won", ("endpoint", "outcome"))
+DEADLINES_EXCEEDED = Counter("deadline_exceeded_total", "Model calls abandoned at the request deadline", ("endpoint",))
+METRICS.extend([RETRIES, HEDGES, DEADLINES_EXCEEDED])
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request runs out of its time budget"""
+
+# Absolute deadline (time.monotonic()) of the request being handled
+_deadline: ContextVar[float | None] = ContextVar("deadline", default=None)
+
+@contextmanager
+def deadline_scope(timeout: float | None = None):
+    """
+    Run the enclosed block under a deadline `timeout` seconds from now.
+
+    Falls back to REQUEST_TIMEOUT when timeout is None. A nested scope can
+    only shorten an outer deadline, never extend it. Tasks created inside
+    the block inherit the deadline.
+    """
+    timeout = timeout or REQUEST_TIMEOUT or None
+    current = _deadline.get()
+    deadline = current
+    if timeout is not None:
+        deadline = time.monotonic() + timeout
+        if current is not None:
+            deadline = min(deadline, current)
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def time_remaining() -> float | None:
+    """Seconds left before the current deadline, or None if there is none"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+async def with_deadline(awaitable: Awaitable, endpoint: str = "") -> Any:
+    """Await something, raising DeadlineExceeded if the current deadline passes first"""
+    remaining = time_remaining()
+    if remaining is None:
+        return await awaitable
+    if remaining <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        DEADLINES_EXCEEDED.inc(endpoint=endpoint)
+        raise DeadlineExceeded("Request deadline exceeded")
+    try:
+        return await asyncio.wait_for(awaitable, remaining)
+    except asyncio.TimeoutError:
+        DEADLINES_EXCEEDED.inc(endpoint=endpoint)
+        raise DeadlineExceeded("Request deadline exceeded") from None
+
+async def retry_async(
+    attempt: Callable[[], Awaitable[Any]],
+    retry_delay: Callable[[Exception], float | None],
+    endpoint: str = "",
+    attempts: int = RETRY_ATTEMPTS
+) -> Any:
+    """
+    Call attempt() until it succeeds, retrying transient failures.
+
+    Waits with exponential backoff and full jitter between attempts, and
+    gives up early rather than sleeping past the current deadline.
+
+    Args:
+        attempt: Makes one call
+        retry_delay: Returns the minimum wait before retrying an error (for
+            example from Retry-After), or None if the error is not transient
+        endpoint: Endpoint label for metrics
+        attempts: Total number of attempts
+    """
+    for number in range(attempts):
+        try:
+            return await attempt()
+        except Exception as e:
+            minimum = retry_delay(e)
+            if minimum is None or number == attempts - 1:
+                raise
+            delay = max(minimum, random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** number)))
+            remaining = time_remaining()
+            if remaining is not None and delay >= remaining:
+                raise
+            print(f"Retrying {endpoint or 'model'} call in {delay:.2f}s after: {e}")
+            RETRIES.inc(endpoint=endpoint)
+            await asyncio.sleep(delay)
+
+class LatencyTracker:
+    """Recent latencies per key, used to pick hedging delays"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: dict[str, deque[float]] = {}
+        self._calls = 0
+        self._hedges = 0
+
+    def record(self, key: str, seconds: float):
+        self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, key: str, q: float) -> float | None:
+        samples = self._samples.get(key)
+        if not samples or len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def hedge_delay(self, key: str) -> float | None:
+        """How long to wait before hedging a call, or None if it should not be hedged"""
+        self._calls += 1
+        if not HEDGE_ENABLED or self._hedges >= HEDGE_MAX_RATIO * self._calls:
+            return None
+        return self.quantile(key, HEDGE_QUANTILE)
+
+    def hedged(self):
+        self._hedges += 1
+
+latencies = LatencyTracker()
+
+async def hedged(
+    attempt: Callable[[], Awaitable[Any]],
+    delay: float | None,
+    endpoint: str = "",
+    discard: Callable[[Any], Awaitable[None]] | None = None
+) -> Any:
+    """
+    Run attempt(), starting a second copy if the first is still running after `delay`.
+
+    Returns whichever copy succeeds first and cancels the other. If both
+    finish, discard() is called on the unused result (e.g. to close a stream).
+    """
+    if delay is None:
+        return await attempt()
+
+    first = asyncio.create_task(attempt())
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return first.result()
+
+        latencies.hedged()
+        second = asyncio.create_task(attempt())
+        tasks.add(second)
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = next((task for task in done if task.exception() is None), None)
+            if winner is not None:
+                HEDGES.inc(endpoint=endpoint, outcome="won" if winner is second else "lost")
+                for task in done:
+                    if task is not winner and task.exception() is None and discard is not None:
+                        await discard(task.result())
+                return winner.result()
+        # Both copies failed: report the original call's error
+        return first.result()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
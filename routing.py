@@ -0,0 +1,224 @@
+import json
+import os
+import time
+from metrics import Counter, Gauge, Histogram, METRICS
+from openai_client import DEFAULT_MODEL, LIGHT_MODEL
+from prompts import CONTENT_TYPES
+
+# Optional JSON file with "routes" (per content type), "prices" and "context_windows" (per model) overrides
+ROUTES_FILE = os.environ.get("ROUTES_FILE")
+# Consecutive failures after which a route stops using its primary model for a while
+ROUTE_FAILOVER_ERRORS = int(os.environ.get("ROUTE_FAILOVER_ERRORS", "3"))
+ROUTE_COOLDOWN = float(os.environ.get("ROUTE_COOLDOWN", "30"))
+
+# USD per million (prompt, completion) tokens, used to estimate cost per route
+MODEL_PRICES = {
+    "gpt-5": (1.25, 10.0),
+    "gpt-5-mini": (0.25, 2.0),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6)
+}
+
+# Context window (prompt plus completion tokens) per model, checked before each call
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-5": 400000,
+    "gpt-5-mini": 400000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000
+}
+DEFAULT_CONTEXT_WINDOW = int(os.environ.get("DEFAULT_CONTEXT_WINDOW", "128000"))
+
+# Short-form content defaults to the lighter model; long-form to the default model
+SHORT_FORM = ("facebook-post", "linkedin-post", "campaign-variant")
+
+# Routes for generations that are not content types of their own, with their default completion budgets
+INTERNAL_ROUTES = {
+    "campaign-variant": 2048  # Channel variants written from a campaign's key points
+}
+
+ROUTE_CALLS = Counter("route_calls_total", "Model calls per route and model", ("route", "model", "outcome"))
+ROUTE_LATENCY = Histogram("route_latency_seconds", "Model call latency per route and model", ("route", "model"))
+ROUTE_TOKENS = Counter("route_tokens_total", "Tokens per route and model", ("route", "model", "type"))
+ROUTE_COST = Counter("route_cost_usd_total", "Estimated model cost in USD per route and model", ("route", "model"))
+ROUTE_FAILOVER = Gauge("route_failover_active", "1 while a route is using its fallback model", ("route",))
+METRICS.extend([ROUTE_CALLS, ROUTE_LATENCY, ROUTE_TOKENS, ROUTE_COST, ROUTE_FAILOVER])
+
+class ModelRoute:
+    """
+    Which model serves a content type, with what token budget, and its fallback.
+
+    The fallback model serves retries and hedged requests, and takes over all
+    calls for ROUTE_COOLDOWN seconds when the primary keeps failing or its
+    average latency exceeds slow_after.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        model: str,
+        fallback_model: str | None,
+        max_completion_tokens: int,
+        slow_after: float | None = None
+    ):
+        self.name = name
+        self.model = model
+        self.fallback_model = fallback_model if fallback_model and fallback_model != model else None
+        self.max_completion_tokens = max_completion_tokens
+        self.slow_after = slow_after or None
+        self._errors = 0
+        self._latency: float | None = None  # Moving average of the primary model's latency
+        self._failover_until = 0.0
+        self._stats: dict[str, dict] = {}
+
+    def context_window(self) -> tuple[int, str]:
+        """Smallest context window among the route's models, and the model it belongs to"""
+        return min((model_context_window(model), model) for model in (self.model, self.fallback_model) if model)
+
+    def failing_over(self) -> bool:
+        return self.fallback_model is not None and time.monotonic() < self._failover_until
+
+    def select_model(self, attempt: int = 0) -> str:
+        """Model for a call's nth attempt (retries and hedges go to the fallback)"""
+        if self.fallback_model is not None and (attempt > 0 or self.failing_over()):
+            return self.fallback_model
+        return self.model
+
+    def record_success(self, model: str, seconds: float, usage: dict | None):
+        """Record a completed call and the tokens it used"""
+        stats = self._model_stats(model)
+        stats["calls"] += 1
+        stats["latency_total"] += seconds
+        ROUTE_CALLS.inc(route=self.name, model=model, outcome="ok")
+        ROUTE_LATENCY.observe(seconds, route=self.name, model=model)
+        if usage:
+            prompt_tokens = usage.get("prompt_tokens") or 0
+            completion_tokens = usage.get("completion_tokens") or 0
+            cached_tokens = usage.get("cached_tokens") or 0
+            input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+            cost = (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+            stats["cached_tokens"] += cached_tokens
+            stats["cost_usd"] += cost
+            ROUTE_TOKENS.inc(prompt_tokens, route=self.name, model=model, type="prompt")
+            ROUTE_TOKENS.inc(completion_tokens, route=self.name, model=model, type="completion")
+            ROUTE_COST.inc(cost, route=self.name, model=model)
+
+        if model == self.model:
+            self._errors = 0
+            self._latency = seconds if self._latency is None else 0.8 * self._latency + 0.2 * seconds
+            if self.slow_after is not None and self._latency > self.slow_after:
+                self._fail_over(f"average latency {self._latency:.1f}s")
+
+    def record_failure(self, model: str):
+        """Record a failed call"""
+        self._model_stats(model)["errors"] += 1
+        ROUTE_CALLS.inc(route=self.name, model=model, outcome="error")
+        if model == self.model:
+            self._errors += 1
+            if self._errors >= ROUTE_FAILOVER_ERRORS:
+                self._fail_over(f"{self._errors} consecutive errors")
+
+    def _fail_over(self, reason: str):
+        if self.fallback_model is None or self.failing_over():
+            return
+        print(f"Route {self.name}: switching to {self.fallback_model} for {ROUTE_COOLDOWN:.0f}s ({reason})")
+        self._failover_until = time.monotonic() + ROUTE_COOLDOWN
+        # Start afresh when the primary is tried again after the cooldown
+        self._errors = 0
+        self._latency = None
+        ROUTE_FAILOVER.set(1, route=self.name)
+
+    def _model_stats(self, model: str) -> dict:
+        return self._stats.setdefault(model, {
+            "calls": 0, "errors": 0, "latency_total": 0.0,
+            "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "cost_usd": 0.0
+        })
+
+    def describe(self) -> dict:
+        """The route's configuration and per-model statistics"""
+        models = {}
+        for model, stats in self._stats.items():
+            calls = stats["calls"]
+            models[model] = {
+                "calls": calls,
+                "errors": stats["errors"],
+                "avg_latency_s": round(stats["latency_total"] / calls, 3) if calls else None,
+                "prompt_tokens": stats["prompt_tokens"],
+                "completion_tokens": stats["completion_tokens"],
+                "cached_tokens": stats["cached_tokens"],
+                "cost_usd": round(stats["cost_usd"], 6),
+                "cost_per_call_usd": round(stats["cost_usd"] / calls, 6) if calls else None
+            }
+        return {
+            "model": self.model,
+            "fallback_model": self.fallback_model,
+            "max_completion_tokens": self.max_completion_tokens,
+            "context_window": self.context_window()[0],
+            "slow_after": self.slow_after,
+            "failover_active": self.failing_over(),
+            "models": models
+        }
+
+def model_context_window(model: str) -> int:
+    """Context window of a model, or DEFAULT_CONTEXT_WINDOW for models not listed"""
+    return MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+
+def _env_prefix(content_type: str) -> str:
+    return "ROUTE_" + content_type.upper().replace("-", "_") + "_"
+
+def load_routes(path: str | None = ROUTES_FILE) -> dict[str, ModelRoute]:
+    """
+    Build the routing table from defaults, an optional config file and env vars.
+
+    Env vars take precedence over the file, e.g. ROUTE_FACEBOOK_POST_MODEL,
+    ROUTE_FACEBOOK_POST_FALLBACK_MODEL, ROUTE_FACEBOOK_POST_MAX_TOKENS and
+    ROUTE_FACEBOOK_POST_SLOW_AFTER.
+    """
+    config = {}
+    if path:
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+    for model, prices in config.get("prices", {}).items():
+        MODEL_PRICES[model] = tuple(prices)
+    MODEL_CONTEXT_WINDOWS.update(config.get("context_windows", {}))
+
+    budgets = {name: settings["max_completion_tokens"] for name, settings in CONTENT_TYPES.items()}
+    budgets.update(INTERNAL_ROUTES)
+
+    routes = {}
+    for content_type, max_completion_tokens in budgets.items():
+        short_form = content_type in SHORT_FORM
+        values = {
+            "model": LIGHT_MODEL if short_form else DEFAULT_MODEL,
+            "fallback_model": DEFAULT_MODEL if short_form else LIGHT_MODEL,
+            "max_completion_tokens": max_completion_tokens,
+            "slow_after": None
+        }
+        values.update(config.get("routes", {}).get(content_type, {}))
+
+        prefix = _env_prefix(content_type)
+        for key, env_name, convert in (
+            ("model", "MODEL", str),
+            ("fallback_model", "FALLBACK_MODEL", str),
+            ("max_completion_tokens", "MAX_TOKENS", int),
+            ("slow_after", "SLOW_AFTER", float)
+        ):
+            if prefix + env_name in os.environ:
+                values[key] = convert(os.environ[prefix + env_name])
+
+        routes[content_type] = ModelRoute(content_type, **values)
+    return routes
+
+ROUTES = load_routes()
+
+def get_route(content_type: str) -> ModelRoute:
+    """Look up the route for a content type"""
+    if content_type not in ROUTES:
+        raise ValueError(f"No route for content type: {content_type}")
+    return ROUTES[content_type]
+
+def update_failover_gauges():
+    """Refresh the failover gauge, which otherwise stays set after a cooldown ends"""
+    for route in ROUTES.values():
+        ROUTE_FAILOVER.set(1 if route.failing_over() else 0, route=route.name)
@@ -0,0 +1,328 @@
+import asyncio
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from metrics import Counter, Gauge, METRICS, observe_phase
+from prompts import count_message_tokens
+from shared_state import WORKERS, SHARED_STATE_SYNC_INTERVAL, SharedState, SharedTokenBucket, get_shared_state
+
+# Upstream scheduler configuration (0 disables a limit). Limits are for the whole
+# node: with several workers, RPM and TPM budgets are shared through the shared
+# state and concurrency and queue length are divided between the workers.
+UPSTREAM_CONCURRENCY = int(os.environ.get("UPSTREAM_CONCURRENCY", "32"))
+UPSTREAM_RPM = float(os.environ.get("UPSTREAM_RPM", "0"))
+UPSTREAM_TPM = float(os.environ.get("UPSTREAM_TPM", "0"))
+UPSTREAM_MAX_QUEUE = int(os.environ.get("UPSTREAM_MAX_QUEUE", "256"))
+UPSTREAM_MAX_WAIT = float(os.environ.get("UPSTREAM_MAX_WAIT", "30"))
+
+# Lanes in priority order: interactive short-form requests, long-form requests, then batch and job work
+LANES = ("interactive", "standard", "bulk")
+
+SCHEDULER_QUEUED = Gauge("scheduler_queued", "Model calls waiting for upstream capacity", ("lane",))
+SCHEDULER_REJECTED = Counter("scheduler_rejected_total", "Model calls rejected by backpressure", ("lane", "reason"))
+METRICS.extend([SCHEDULER_QUEUED, SCHEDULER_REJECTED])
+
+class SchedulerRejected(Exception):
+    """Raised when a model call is refused instead of queued"""
+
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class RateLimitExceeded(SchedulerRejected):
+    """The request/token rate limit would make the call wait longer than allowed"""
+
+    status_code = 429
+
+class UpstreamOverloaded(SchedulerRejected):
+    """Too many calls are already waiting for upstream capacity"""
+
+    status_code = 503
+
+def estimate_tokens(
+    prompt: str,
+    system_message: str,
+    max_completion_tokens: int,
+    context: str | None = None
+) -> int:
+    """Worst-case tokens for a call: its prompt tokens plus the completion budget"""
+    return count_message_tokens(prompt, system_message, context) + max_completion_tokens
+
+class TokenBucket:
+    """Continuously refilling budget of `rate` units per minute"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = rate
+        self.level = rate
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate / 60)
+        self._updated = now
+
+    def clamp(self, amount: float) -> float:
+        """Limit a request to the bucket size so oversized calls can still run"""
+        return min(amount, self.capacity)
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available"""
+        self._refill()
+        deficit = self.clamp(amount) - self.level
+        return max(deficit, 0) * 60 / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= self.clamp(amount)
+
+    def give_back(self, amount: float):
+        """Return (or, if negative, charge) units after the real cost is known"""
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+class _Waiter:
+    __slots__ = ("tokens", "future")
+
+    def __init__(self, tokens: int, future: asyncio.Future):
+        self.tokens = tokens
+        self.future = future
+
+class UpstreamScheduler:
+    """
+    Admission control in front of the model API.
+
+    Calls wait in one of several priority lanes until a concurrency slot and
+    enough request and token budget (per minute) are free; the highest
+    priority waiting call always goes first. Calls that would wait longer
+    than max_wait, or arrive when max_queue calls are already waiting, are
+    rejected with a retry hint instead of piling up.
+
+    With a shared state the request and token budgets, and pauses after an
+    upstream 429, are common to every worker process on the node. They are
+    read from a local copy that a background task syncs with the other
+    workers, so admission decisions never block the event loop on SQLite.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = UPSTREAM_CONCURRENCY,
+        rpm: float = UPSTREAM_RPM,
+        tpm: float = UPSTREAM_TPM,
+        max_queue: int = UPSTREAM_MAX_QUEUE,
+        max_wait: float = UPSTREAM_MAX_WAIT,
+        shared: SharedState | None = None
+    ):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.shared = shared
+        self._requests = self._bucket("upstream_rpm", rpm)
+        self._tokens = self._bucket("upstream_tpm", tpm)
+        self._lanes: dict[str, deque[_Waiter]] = {lane: deque() for lane in LANES}
+        self._active = 0
+        self._paused_until = 0.0
+        self._timer: asyncio.TimerHandle | None = None
+        # Local copy of the node-wide pause (wall clock), and a pause still to be written
+        self._shared_lock = threading.Lock()
+        self._shared_paused_until = 0.0
+        self._pause_to_write = 0.0
+        self._sync_task: asyncio.Task | None = None
+
+    def _bucket(self, name: str, rate: float) -> TokenBucket | SharedTokenBucket | None:
+        if rate <= 0:
+            return None
+        return SharedTokenBucket(self.shared, name, rate) if self.shared is not None else TokenBucket(rate)
+
+    def _pause_remaining(self) -> float:
+        paused = max(self._paused_until - time.monotonic(), 0)
+        if self.shared is not None:
+            paused = max(paused, self._shared_paused_until - time.time())
+        return paused
+
+    def _sync_shared(self, reserve: bool = True):
+        """Exchange budgets and pauses with the other workers (blocking, run in a thread)"""
+        for bucket in (self._requests, self._tokens):
+            if bucket is not None:
+                bucket.sync(reserve)
+        with self._shared_lock:
+            until, self._pause_to_write = self._pause_to_write, 0.0
+        if until:
+            self.shared.pause_until(until)
+        self._shared_paused_until = time.time() + self.shared.pause_remaining()
+
+    async def _sync_loop(self):
+        while True:
+            try:
+                await asyncio.to_thread(self._sync_shared)
+            except sqlite3.Error as e:
+                print(f"Shared scheduler state sync failed: {e}")
+            # Budget freed by other workers may let waiting calls through
+            self._dispatch()
+            await asyncio.sleep(SHARED_STATE_SYNC_INTERVAL)
+
+    async def stop(self):
+        """Stop syncing with the shared state, handing this worker's unused budget back"""
+        if self._sync_task is None:
+            return
+        self._sync_task.cancel()
+        self._sync_task = None
+        try:
+            await asyncio.to_thread(self._sync_shared, False)
+        except sqlite3.Error as e:
+            print(f"Shared scheduler state sync failed: {e}")
+
+    def _start_sync(self):
+        """Keep the shared state in sync while the app's event loop runs"""
+        loop = asyncio.get_running_loop()
+        if self._sync_task is None or self._sync_task.done() or self._sync_task.get_loop() is not loop:
+            self._sync_task = loop.create_task(self._sync_loop())
+
+    def queued(self) -> int:
+        return sum(len(lane) for lane in self._lanes.values())
+
+    def check(self, tokens: int, lane: str = "standard"):
+        """
+        Reject a call up front if it would not be admitted.
+
+        Raises:
+            UpstreamOverloaded: If the wait queue is full
+            RateLimitExceeded: If the estimated wait exceeds max_wait
+        """
+        if lane not in self._lanes:
+            raise ValueError(f"Unknown lane: {lane}")
+        if self.queued() >= self.max_queue:
+            SCHEDULER_REJECTED.inc(lane=lane, reason="queue_full")
+            raise UpstreamOverloaded("Too many requests are waiting for the model", self._retry_hint())
+
+        wait = self.estimated_wait(tokens, lane)
+        if wait > self.max_wait:
+            SCHEDULER_REJECTED.inc(lane=lane, reason="rate_limit")
+            raise RateLimitExceeded("Model rate limit reached", wait)
+
+    def estimated_wait(self, tokens: int, lane: str) -> float:
+        """Seconds until a call in this lane would get budget, counting calls queued ahead of it"""
+        ahead = [waiter for name in LANES[:LANES.index(lane) + 1] for waiter in self._lanes[name]]
+        wait = self._pause_remaining()
+        if self._requests is not None:
+            wait = max(wait, self._requests.wait_time(len(ahead) + 1))
+        if self._tokens is not None:
+            wait = max(wait, self._tokens.wait_time(sum(w.tokens for w in ahead) + tokens))
+        return wait
+
+    def pause(self, seconds: float):
+        """Stop dispatching for a while, e.g. after the API itself answered 429"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        if self.shared is not None:
+            # Written to the shared state by the next sync
+            with self._shared_lock:
+                self._pause_to_write = max(self._pause_to_write, time.time() + seconds)
+
+    @asynccontextmanager
+    async def slot(self, tokens: int, lane: str = "standard", endpoint: str = ""):
+        """
+        Hold upstream capacity for one model call.
+
+        Yields a callback to report the actual tokens used, so the token
+        budget reflects real usage rather than the estimate.
+        """
+        await self.acquire(tokens, lane, endpoint)
+        charged = self._tokens.clamp(tokens) if self._tokens is not None else 0
+
+        def settle(actual_tokens: int | None):
+            if self._tokens is not None and actual_tokens is not None:
+                self._tokens.give_back(charged - actual_tokens)
+
+        try:
+            yield settle
+        finally:
+            self.release()
+
+    async def acquire(self, tokens: int, lane: str = "standard", endpoint: str = ""):
+        """Wait for capacity (see check for when this raises instead)"""
+        if self.shared is not None:
+            self._start_sync()
+        self.check(tokens, lane)
+        start = time.perf_counter()
+        waiter = _Waiter(tokens, asyncio.get_running_loop().create_future())
+        self._lanes[lane].append(waiter)
+        SCHEDULER_QUEUED.set(len(self._lanes[lane]), lane=lane)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted just as the caller went away
+                self.release()
+            elif waiter in self._lanes[lane]:
+                self._lanes[lane].remove(waiter)
+                SCHEDULER_QUEUED.set(len(self._lanes[lane]), lane=lane)
+                self._dispatch()
+            raise
+        observe_phase("schedule", time.perf_counter() - start, endpoint)
+
+    def release(self):
+        self._active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Grant capacity to waiting calls in priority order"""
+        while self._active < self.concurrency or self.concurrency <= 0:
+            lane = next((name for name in LANES if self._lanes[name]), None)
+            if lane is None:
+                return
+            waiter = self._lanes[lane][0]
+            if waiter.future.cancelled():
+                self._lanes[lane].popleft()
+                continue
+
+            wait = self._pause_remaining()
+            if self._requests is not None:
+                wait = max(wait, self._requests.wait_time(1))
+            if self._tokens is not None:
+                wait = max(wait, self._tokens.wait_time(waiter.tokens))
+            if wait > 0:
+                self._schedule(wait)
+                return
+
+            self._lanes[lane].popleft()
+            SCHEDULER_QUEUED.set(len(self._lanes[lane]), lane=lane)
+            if self._requests is not None:
+                self._requests.take(1)
+            if self._tokens is not None:
+                self._tokens.take(waiter.tokens)
+            self._active += 1
+            waiter.future.set_result(None)
+
+    def _schedule(self, delay: float):
+        """Run dispatch again once the budget has refilled"""
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._wake)
+
+    def _wake(self):
+        self._timer = None
+        self._dispatch()
+
+    def _retry_hint(self) -> float:
+        return max(self.estimated_wait(0, LANES[-1]), 1.0)
+
+def retry_after_header(seconds: float) -> str:
+    """Format a Retry-After header value in whole seconds"""
+    return str(max(1, math.ceil(seconds)))
+
+def per_worker(limit: int) -> int:
+    """One worker's share of a node-wide limit (0 stays unlimited)"""
+    return math.ceil(limit / WORKERS) if limit > 0 else limit
+
+scheduler = UpstreamScheduler(
+    concurrency=per_worker(UPSTREAM_CONCURRENCY),
+    max_queue=per_worker(UPSTREAM_MAX_QUEUE),
+    shared=get_shared_state()
+)
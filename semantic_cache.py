@@ -0,0 +1,301 @@
+import os
+import re
+import threading
+import time
+import zlib
+from typing import NamedTuple
+from shared_state import connect
+
+# Optional, and only imported once the similarity cache is created (see load_numpy)
+np = None
+
+# Serve (or seed drafts from) earlier generations for similar prompts
+SEMANTIC_CACHE = os.environ.get("SEMANTIC_CACHE", "false").lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_DIR = os.environ.get("SEMANTIC_CACHE_DIR", "cache/semantic")
+# Similarity at which an earlier result is returned as is
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+# Similarity at which an earlier result is sent to the model as a draft to adapt (0 disables drafts)
+SEMANTIC_CACHE_DRAFT_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_DRAFT_THRESHOLD", "0.75"))
+SEMANTIC_CACHE_DIMENSIONS = int(os.environ.get("SEMANTIC_CACHE_DIMENSIONS", "1024"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))  # Per content type
+SEMANTIC_CACHE_TTL = float(os.environ.get("SEMANTIC_CACHE_TTL", "86400"))
+# Content types indexed; whitepaper sections are left out since prompts for different sections differ only slightly
+SEMANTIC_CACHE_ENDPOINTS = set(
+    os.environ.get(
+        "SEMANTIC_CACHE_ENDPOINTS",
+        "blog-post,whitepaper,facebook-post,linkedin-post,ppt,campaign-draft"
+    ).split(",")
+)
+
+WORD_PATTERN = re.compile(r"\w+")
+
+class SemanticMatch(NamedTuple):
+    """The most similar earlier generation for a request"""
+    content: str
+    similarity: float
+    created: float
+
+def semantic_text(prompt: str, context: str | None) -> str:
+    """Text a request is indexed and matched by"""
+    return f"{prompt}\n{context}" if context else prompt
+
+def draft_context(context: str | None, draft: str) -> str:
+    """Context with an earlier generation for a similar request, for the model to adapt"""
+    note = (
+        "Draft written for a similar earlier request (adapt it to this request rather than copying it):\n"
+        f"{draft}"
+    )
+    return f"{context}\n\n{note}" if context else note
+
+def embed(text: str, dimensions: int = SEMANTIC_CACHE_DIMENSIONS):
+    """
+    Hashed term-frequency vector of a text's words and their character trigrams.
+
+    Computed locally with no model call. Trigrams let inflections match
+    ("test", "tests", "testing"). Features are hashed into a fixed number of
+    buckets with sublinear counts; IDF weights are applied at search time
+    from the index's own document frequencies.
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    features = list(words)
+    for word in words:
+        padded = f" {word} "
+        features.extend(f"#{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for feature in features:
+        vector[zlib.crc32(feature.encode("utf-8")) % dimensions] += 1
+    np.log1p(vector, out=vector)
+    return vector
+
+class VectorIndex:
+    """
+    Vectors of one content type's earlier requests in a memory-mapped .npy file.
+
+    Rows are filled in order and reused oldest first once the index is full.
+    Which rows are in use, and their variants and ages, is kept in memory and
+    loaded from the entries table. Worker processes map the same file, so
+    rows written by one are visible to the others once they reload.
+    """
+
+    # Share of the index that may change before IDF weights are recomputed
+    REWEIGHT_FRACTION = 0.05
+
+    def __init__(self, path: str, dimensions: int, capacity: int):
+        vectors = None
+        if os.path.exists(path):
+            try:
+                vectors = np.load(path, mmap_mode="r+")
+            except (OSError, ValueError):
+                vectors = None
+            if vectors is not None and (vectors.shape != (capacity, dimensions) or vectors.dtype != np.float32):
+                vectors = None
+        # A new or resized file invalidates every stored row
+        self.rebuilt = vectors is None
+        if vectors is None:
+            vectors = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(capacity, dimensions))
+        self.vectors = vectors
+        self.valid = np.zeros(capacity, dtype=bool)
+        self.variants = np.zeros(capacity, dtype=np.int64)
+        self.created = np.zeros(capacity, dtype=np.float64)
+        self.df = np.zeros(dimensions, dtype=np.float64)
+        self.rows_used = 0  # Rows past this have never been written
+        self._weights = None
+        self._norms = np.ones(capacity, dtype=np.float32)
+        self._changes = 0
+
+    def load(self, rows: list[tuple[int, int, float]]):
+        """Mark stored rows as in use from (row, variant, created) tuples, replacing the current set"""
+        self.valid[:] = False
+        self.rows_used = 0
+        for row, variant, created in rows:
+            if 0 <= row < len(self.valid):
+                self.valid[row] = True
+                self.variants[row] = variant
+                self.created[row] = created
+                self.rows_used = max(self.rows_used, row + 1)
+        self.df = np.count_nonzero(self.vectors[self.valid], axis=0).astype(np.float64)
+        self._weights = None
+
+    def next_row(self) -> int:
+        """First free row, else the oldest one"""
+        free = np.flatnonzero(~self.valid)
+        return int(free[0]) if len(free) else int(np.argmin(self.created))
+
+    def put(self, row: int, vector, variant: int, created: float):
+        if self.valid[row]:
+            self.df -= self.vectors[row] > 0
+        self.vectors[row] = vector
+        self.vectors.flush()
+        self.valid[row] = True
+        self.variants[row] = variant
+        self.created[row] = created
+        self.rows_used = max(self.rows_used, row + 1)
+        self.df += vector > 0
+        if self._weights is not None:
+            # Keep the current weights until enough of the index has changed
+            self._norms[row] = max(np.linalg.norm(vector * self._weights), 1e-12)
+            self._changes += 1
+            if self._changes > len(self) * self.REWEIGHT_FRACTION:
+                self._weights = None
+
+    def search(self, vector, variant: int, min_created: float) -> tuple[int, float] | None:
+        """Row and cosine similarity (with IDF weights) of the best matching live row"""
+        used = self.rows_used
+        live = self.valid[:used] & (self.variants[:used] == variant) & (self.created[:used] >= min_created)
+        if not live.any():
+            return None
+        weights = self._weighting()
+        query = vector * weights
+        query_norm = np.linalg.norm(query)
+        if query_norm == 0:
+            return None
+        # One pass over the mapped rows is cheaper than copying out the live ones
+        scores = (self.vectors[:used] @ (query * weights)) / (self._norms[:used] * query_norm)
+        scores[~live] = -1
+        best = int(np.argmax(scores))
+        return best, min(float(scores[best]), 1.0)
+
+    def _weighting(self):
+        """IDF weights from the index's document frequencies, and the rows' weighted norms"""
+        if self._weights is None:
+            used = self.rows_used
+            weights = (np.log((len(self) + 1) / (self.df + 1)) + 1).astype(np.float32)
+            norms = np.sqrt(np.square(self.vectors[:used]) @ (weights * weights))
+            self._norms[:used] = np.maximum(norms, 1e-12)
+            self._weights = weights
+            self._changes = 0
+        return self._weights
+
+    def __len__(self) -> int:
+        return int(self.valid.sum())
+
+class SemanticCache:
+    """
+    Similarity index over earlier generations, with one vector index per content type.
+
+    Worker processes share the entries table and vector files; each reloads
+    its indexes when the table was changed by another process.
+    """
+
+    def __init__(
+        self,
+        directory: str = SEMANTIC_CACHE_DIR,
+        dimensions: int = SEMANTIC_CACHE_DIMENSIONS,
+        capacity: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        ttl: float = SEMANTIC_CACHE_TTL
+    ):
+        if not load_numpy():
+            raise RuntimeError("The similarity cache needs NumPy")
+        self.directory = directory
+        self.dimensions = dimensions
+        self.capacity = capacity
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+        self._conn = connect(os.path.join(directory, "entries.sqlite3"))
+        self._lock = threading.Lock()
+        self._indexes: dict[str, VectorIndex] = {}
+        with self._lock, self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS entries (
+                    name TEXT NOT NULL,
+                    row INTEGER NOT NULL,
+                    variant INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    content TEXT NOT NULL,
+                    PRIMARY KEY (name, row)
+                )"""
+            )
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _index(self, name: str) -> VectorIndex:
+        """Open a content type's index on first use (call with the lock held)"""
+        index = self._indexes.get(name)
+        if index is None:
+            filename = re.sub(r"[^\w-]", "_", name) + ".npy"
+            index = VectorIndex(os.path.join(self.directory, filename), self.dimensions, self.capacity)
+            with self._conn:
+                if index.rebuilt:
+                    self._conn.execute("DELETE FROM entries WHERE name = ?", (name,))
+                else:
+                    index.load(self._rows(name))
+            self._indexes[name] = index
+        return index
+
+    def _rows(self, name: str) -> list[tuple[int, int, float]]:
+        return self._conn.execute("SELECT row, variant, created FROM entries WHERE name = ?", (name,)).fetchall()
+
+    def _sync(self):
+        """Reload the open indexes if another process changed the entries (call with the lock held)"""
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._data_version = version
+            for name, index in self._indexes.items():
+                index.load(self._rows(name))
+
+    def search(self, name: str, text: str, variant: int) -> SemanticMatch | None:
+        """Find the most similar live entry of a content type and variant"""
+        vector = embed(text, self.dimensions)
+        with self._lock:
+            self._sync()
+            found = self._index(name).search(vector, variant, time.time() - self.ttl)
+            if found is None:
+                return None
+            row, similarity = found
+            content, created = self._conn.execute(
+                "SELECT content, created FROM entries WHERE name = ? AND row = ?", (name, row)
+            ).fetchone()
+        return SemanticMatch(content, similarity, created)
+
+    def add(self, name: str, text: str, variant: int, content: str):
+        """Index a generation, replacing the oldest entry when the index is full"""
+        vector = embed(text, self.dimensions)
+        if not vector.any():
+            return
+        now = time.time()
+        with self._lock:
+            index = self._index(name)
+            with self._conn:
+                # Hold the write lock while picking a row so two workers never take the same one
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._sync()
+                row = index.next_row()
+                index.put(row, vector, variant, now)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (name, row, variant, created, content) VALUES (?, ?, ?, ?, ?)",
+                    (name, row, variant, now, content)
+                )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {name: {"entries": len(index), "capacity": self.capacity} for name, index in self._indexes.items()}
+
+def load_numpy() -> bool:
+    """Import NumPy on first use, so the app starts without it unless the cache is enabled"""
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:  # Optional: the similarity cache is unavailable without NumPy
+            return False
+        np = numpy
+    return True
+
+def create_semantic_cache() -> SemanticCache | None:
+    """Create the similarity cache if it is enabled and NumPy is available"""
+    if not SEMANTIC_CACHE:
+        return None
+    if not load_numpy():
+        print("SEMANTIC_CACHE is enabled but NumPy is not installed; similarity cache disabled")
+        return None
+    return SemanticCache()
+
+_semantic_cache = create_semantic_cache()
+
+def get_semantic_cache() -> SemanticCache | None:
+    """Return the active similarity cache"""
+    return _semantic_cache
+
+def set_semantic_cache(cache: SemanticCache | None):
+    """Replace the active similarity cache (None disables it)"""
+    global _semantic_cache
+    _semantic_cache = cache
@@ -0,0 +1,205 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+def resolve_workers(value: str | None) -> int:
+    """Worker count from a setting: a number, or "auto" for one per CPU core"""
+    if not value:
+        return 1
+    if value == "auto":
+        return os.cpu_count() or 1
+    return max(1, int(value))
+
+# Worker processes serving the app on this node. Set by the launcher in main.py,
+# and read from the same variable gunicorn and uvicorn use for their worker count.
+WORKERS = resolve_workers(os.environ.get("WEB_CONCURRENCY"))
+SHARED_STATE_PATH = os.environ.get("SHARED_STATE_PATH", "cache/shared_state.sqlite3")
+# Seconds a SQLite write waits for another worker's transaction before failing
+SQLITE_BUSY_TIMEOUT = float(os.environ.get("SQLITE_BUSY_TIMEOUT", "5"))
+# Seconds between syncs of a worker's local copy of the shared rate limit budgets
+SHARED_STATE_SYNC_INTERVAL = float(os.environ.get("SHARED_STATE_SYNC_INTERVAL", "0.1"))
+
+# Identifies this process in claims it holds
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    Open a SQLite database that several worker processes can use at once.
+
+    WAL journaling lets readers proceed while another process writes, and the
+    busy timeout makes concurrent writers wait for each other instead of
+    failing with "database is locked".
+    """
+    conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+class SharedState:
+    """
+    Node-local state shared by all worker processes, kept in SQLite.
+
+    Holds rate limit budgets, the upstream pause after a 429, and claims on
+    in-flight generations, so limits and request coalescing hold for the
+    node as a whole rather than per worker.
+    """
+
+    def __init__(self, path: str = SHARED_STATE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = connect(path)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS budgets (
+                    name TEXT PRIMARY KEY,
+                    level REAL NOT NULL,
+                    updated REAL NOT NULL
+                )"""
+            )
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS flights (
+                    key TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires REAL NOT NULL
+                )"""
+            )
+
+    def reserve(self, name: str, rate: float, capacity: float, returned: float, fraction: float) -> float:
+        """
+        Return unused units to a per-minute budget and reserve a fraction of what is left.
+
+        Both happen in one transaction, so units reserved by one worker are
+        never handed to another. A new budget starts full; `returned` may be
+        negative to charge units used beyond a reservation.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute("SELECT level, updated FROM budgets WHERE name = ?", (name,)).fetchone()
+            level = capacity if row is None else min(capacity, row[0] + max(now - row[1], 0) * rate / 60)
+            level = min(capacity, level + returned)
+            reserved = max(level, 0.0) * fraction
+            self._conn.execute(
+                "INSERT OR REPLACE INTO budgets (name, level, updated) VALUES (?, ?, ?)",
+                (name, level - reserved, now)
+            )
+        return reserved
+
+    def pause_until(self, until: float):
+        """Hold back every worker's upstream calls until a wall-clock time"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO budgets (name, level, updated) VALUES ('pause', ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET level = MAX(level, excluded.level), updated = excluded.updated",
+                (until, time.time())
+            )
+
+    def pause_remaining(self) -> float:
+        """Seconds left of a pause set by any worker"""
+        with self._lock:
+            row = self._conn.execute("SELECT level FROM budgets WHERE name = 'pause'").fetchone()
+        return max(row[0] - time.time(), 0.0) if row else 0.0
+
+    def claim(self, key: str, ttl: float) -> bool:
+        """Claim a key for this worker unless another worker holds an unexpired claim"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("DELETE FROM flights WHERE key = ? AND expires < ?", (key, now))
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO flights (key, owner, expires) VALUES (?, ?, ?)",
+                (key, WORKER_ID, now + ttl)
+            )
+            return cursor.rowcount == 1
+
+    def renew(self, key: str, ttl: float):
+        """Extend this worker's claim on a key"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE flights SET expires = ? WHERE key = ? AND owner = ?",
+                (time.time() + ttl, key, WORKER_ID)
+            )
+
+    def release(self, key: str):
+        """Drop this worker's claim on a key"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM flights WHERE key = ? AND owner = ?", (key, WORKER_ID))
+
+class SharedTokenBucket:
+    """
+    TokenBucket (see scheduler.py) whose level lives in the shared state, so all workers draw on one budget.
+
+    Calls are admitted from a local allowance, so the event loop never waits
+    on SQLite. sync() (run off the loop every SHARED_STATE_SYNC_INTERVAL
+    seconds by the scheduler) returns what is left of the allowance and
+    reserves this worker's share of the node-wide level as the next one, so
+    the workers together can never overdraw the budget. A worker busy on its
+    own gets the full rate, since the others hand their shares back.
+    """
+
+    def __init__(self, state: SharedState, name: str, rate: float, workers: int = WORKERS):
+        self.state = state
+        self.name = name
+        self.rate = rate
+        self.capacity = rate
+        self.share = 1 / max(workers, 1)
+        self._lock = threading.Lock()
+        self._allowance = 0.0  # Units reserved for this worker and not yet used
+        self._synced = False
+
+    def clamp(self, amount: float) -> float:
+        """Limit a request to the largest allowance so oversized calls can still run"""
+        return min(amount, self.capacity * self.share)
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (at least until the next sync if the allowance is short)"""
+        with self._lock:
+            missing = self.clamp(amount) - self._allowance
+            synced = self._synced
+        if missing <= 0:
+            return 0.0
+        if not synced:
+            # Nothing reserved yet: the first sync is about to run
+            return SHARED_STATE_SYNC_INTERVAL
+        return max(missing * 60 / self.rate, SHARED_STATE_SYNC_INTERVAL)
+
+    def take(self, amount: float):
+        with self._lock:
+            self._allowance -= self.clamp(amount)
+
+    def give_back(self, amount: float):
+        """Return (or, if negative, charge) units after the real cost is known"""
+        with self._lock:
+            self._allowance += amount
+
+    def sync(self, reserve: bool = True):
+        """Exchange the unused allowance for a new one (blocking); with reserve=False only hand it back"""
+        with self._lock:
+            returned, self._allowance = self._allowance, 0.0
+        try:
+            reserved = self.state.reserve(
+                self.name, self.rate, self.capacity, returned, self.share if reserve else 0.0
+            )
+        except Exception:
+            with self._lock:
+                self._allowance += returned
+            raise
+        with self._lock:
+            self._allowance += reserved
+            self._synced = True
+
+_shared_state: SharedState | None = None
+
+def get_shared_state() -> SharedState | None:
+    """The node's shared state when running several workers, otherwise None"""
+    global _shared_state
+    if WORKERS <= 1:
+        return None
+    if _shared_state is None:
+        _shared_state = SharedState()
+    return _shared_state
@@ -0,0 +1,176 @@
+import asyncio
+import os
+from typing import Any, AsyncIterator, Awaitable, Callable
+from resilience import DeadlineExceeded, time_remaining
+from shared_state import SharedState
+
+# Cross-worker coalescing: how long a claim lasts without renewal, and how often waiting workers check for the result
+WORKER_FLIGHT_TTL = float(os.environ.get("WORKER_FLIGHT_TTL", "30"))
+WORKER_FLIGHT_POLL = float(os.environ.get("WORKER_FLIGHT_POLL", "0.25"))
+
+class StreamFlight:
+    """
+    A single upstream stream shared by any number of subscribers.
+
+    Chunks are buffered so subscribers that join late still receive the
+    stream from the beginning.
+    """
+
+    def __init__(self, source: AsyncIterator, on_complete: Callable[[list], Awaitable[None]] | None = None):
+        self.chunks: list = []
+        self.done = False
+        self.error: BaseException | None = None
+        self._on_complete = on_complete
+        self._cond = asyncio.Condition()
+        self.task = asyncio.create_task(self._run(source))
+
+    async def _run(self, source: AsyncIterator):
+        try:
+            async for chunk in source:
+                async with self._cond:
+                    self.chunks.append(chunk)
+                    self._cond.notify_all()
+            if self._on_complete is not None:
+                await self._on_complete(self.chunks)
+        except Exception as e:
+            self.error = e
+        finally:
+            async with self._cond:
+                self.done = True
+                self._cond.notify_all()
+
+    async def subscribe(self):
+        """Yield every chunk of the shared stream, re-raising any upstream error"""
+        index = 0
+        while True:
+            async with self._cond:
+                await self._cond.wait_for(lambda: index < len(self.chunks) or self.done)
+                new_chunks = self.chunks[index:]
+                index = len(self.chunks)
+                finished = self.done
+            for chunk in new_chunks:
+                yield chunk
+            if finished:
+                if self.error is not None:
+                    raise self.error
+                return
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls into one upstream call.
+
+    The first caller for a key starts the work; callers arriving while it is
+    still in flight wait for and share its result. The work runs in its own
+    task, so a caller disconnecting does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Task] = {}
+        self._streams: dict[str, StreamFlight] = {}
+
+    def in_flight(self) -> int:
+        """Number of distinct calls and streams currently in flight"""
+        return len(self._calls) + len(self._streams)
+
+    def is_streaming(self, key: str) -> bool:
+        """True if a stream for this key is already in flight"""
+        return key in self._streams
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """
+        Run fn once per key among concurrent callers.
+
+        Returns:
+            (result, shared) where shared is True if this caller joined a
+            call started by another request
+        """
+        task = self._calls.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.create_task(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._finish(self._calls, key, t))
+        return await asyncio.shield(task), shared
+
+    def stream(
+        self,
+        key: str,
+        factory: Callable[[], AsyncIterator],
+        on_complete: Callable[[list], Awaitable[None]] | None = None
+    ) -> tuple[AsyncIterator, bool]:
+        """
+        Share one upstream stream per key among concurrent subscribers.
+
+        Args:
+            key: Canonical request key
+            factory: Creates the upstream async iterator when no stream is in flight
+            on_complete: Called once with all chunks after the upstream stream succeeds
+
+        Returns:
+            (iterator, shared) where shared is True if this caller joined an
+            existing stream
+        """
+        flight = self._streams.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = StreamFlight(factory(), on_complete)
+            self._streams[key] = flight
+            flight.task.add_done_callback(lambda t: self._finish(self._streams, key, flight))
+        return flight.subscribe(), shared
+
+    @staticmethod
+    def _finish(registry: dict, key: str, value):
+        if registry.get(key) is value:
+            del registry[key]
+        if isinstance(value, asyncio.Task) and not value.cancelled():
+            # Mark the exception as retrieved even if every caller went away
+            value.exception()
+
+async def worker_flight(
+    state: SharedState,
+    key: str,
+    fn: Callable[[], Awaitable[Any]],
+    lookup: Callable[[], Awaitable[Any]]
+) -> tuple[Any, bool]:
+    """
+    Run fn once per key among the worker processes on this node.
+
+    The worker that claims the key runs fn, renewing its claim while fn runs.
+    The others poll lookup (e.g. the shared cache) until it returns the
+    result, and run fn themselves if the claim is released or expires first,
+    so a crashed worker only delays its waiters. A worker checks lookup once
+    more after claiming, so it never repeats a call just finished elsewhere.
+
+    Returns:
+        (result, shared) where shared is True if the result came from
+        another worker
+    """
+    while True:
+        if await asyncio.to_thread(state.claim, key, WORKER_FLIGHT_TTL):
+            break
+        remaining = time_remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded("Request deadline exceeded")
+        await asyncio.sleep(WORKER_FLIGHT_POLL if remaining is None else min(WORKER_FLIGHT_POLL, remaining))
+        result = await lookup()
+        if result is not None:
+            return result, True
+
+    async def renew():
+        while True:
+            await asyncio.sleep(WORKER_FLIGHT_TTL / 3)
+            await asyncio.to_thread(state.renew, key, WORKER_FLIGHT_TTL)
+
+    renewer = asyncio.create_task(renew())
+    try:
+        # The previous owner may have stored its result and released the key
+        # since the last lookup
+        result = await lookup()
+        if result is not None:
+            return result, True
+        return await fn(), False
+    finally:
+        renewer.cancel()
+        await asyncio.to_thread(state.release, key)
+
+flights = SingleFlight()
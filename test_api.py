@@ -28,10 +28,119 @@ def test_endpoint(endpoint, data):
     except requests.exceptions.RequestException as e:
         print(f"\nError: {e}")
 
+def test_stream_endpoint(endpoint, data):
+    """Test a streaming (SSE) endpoint and print events as they arrive"""
+    print(f"\n{'='*60}")
+    print(f"Testing stream: {endpoint}")
+    print(f"{'='*60}")
+    print(f"Request data: {json.dumps(data, indent=2)}")
+    
+    try:
+        with requests.post(f"{BASE_URL}{endpoint}", json=data, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            print(f"\nStatus Code: {response.status_code}")
+            print("-" * 60)
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    payload = json.loads(line[len("data: "):])
+                    if event == "delta":
+                        print(payload["content"], end="", flush=True)
+                    else:
+                        print(f"\n[{event}] {json.dumps(payload)}")
+            print("-" * 60)
+        
+    except requests.exceptions.Timeout:
+        print("\nError: Request timed out (content generation took too long)")
+    except requests.exceptions.RequestException as e:
+        print(f"\nError: {e}")
+
+def test_batch_endpoint(jobs):
+    """Test the batch endpoint and print each NDJSON result as it arrives"""
+    print(f"\n{'='*60}")
+    print("Testing: /batch")
+    print(f"{'='*60}")
+    print(f"Request data: {json.dumps(jobs, indent=2)}")
+    
+    try:
+        with requests.post(f"{BASE_URL}/batch", json={"jobs": jobs}, stream=True, timeout=120) as response:
+            response.raise_for_status()
+            print(f"\nStatus Code: {response.status_code}")
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    continue
+                result = json.loads(line)
+                result.pop("content_base64", None)
+                print("-" * 60)
+                print(json.dumps(result, indent=2))
+            print("-" * 60)
+        
+    except requests.exceptions.Timeout:
+        print("\nError: Request timed out (content generation took too long)")
+    except requests.exceptions.RequestException as e:
+        print(f"\nError: {e}")
+
+def test_metrics_endpoint():
+    """Fetch /metrics and print the non-histogram series"""
+    print(f"\n{'='*60}")
+    print("Testing: /metrics")
+    print(f"{'='*60}")
+    
+    try:
+        response = requests.get(f"{BASE_URL}/metrics", timeout=10)
+        response.raise_for_status()
+        print(f"\nStatus Code: {response.status_code}")
+        for line in response.text.splitlines():
+            if not line.startswith("#") and "_bucket" not in line:
+                print(line)
+        
+    except requests.exceptions.RequestException as e:
+        print(f"\nError: {e}")
+
+def test_ready_endpoint():
+    """Warm the server via /ready and print its readiness"""
+    print(f"\n{'='*60}")
+    print("Testing: /ready?warm=true")
+    print(f"{'='*60}")
+    
+    try:
+        response = requests.get(f"{BASE_URL}/ready", params={"warm": "true"}, timeout=60)
+        print(f"\nStatus Code: {response.status_code}")
+        print(json.dumps(response.json(), indent=2))
+        
+    except requests.exceptions.RequestException as e:
+        print(f"\nError: {e}")
+
+def test_size_limits():
+    """Check that oversized requests are refused before generation"""
+    print(f"\n{'='*60}")
+    print("Testing: request size limits")
+    print(f"{'='*60}")
+    
+    try:
+        response = requests.post(f"{BASE_URL}/blog-post", json={"prompt": "x" * 100000}, timeout=10)
+        print(f"\nPrompt over MAX_PROMPT_CHARS: {response.status_code} (expected 422)")
+        
+        response = requests.post(
+            f"{BASE_URL}/linkedin-post",
+            data=b"x" * (17 * 1024 * 1024),
+            headers={"Content-Type": "application/json"},
+            timeout=30
+        )
+        print(f"Body over MAX_REQUEST_BYTES: {response.status_code} (expected 413)")
+        
+    except requests.exceptions.RequestException as e:
+        print(f"\nError: {e}")
+
 def main():
     print("AI Content Generator API - Test Suite")
     print("=" * 60)
     
+    # Test 0: Readiness (warms the OpenAI client and the renderer)
+    test_ready_endpoint()
+    
     # Test 1: Blog Post
     test_endpoint("/blog-post", {
         "prompt": "Write a short blog post about the benefits of Python programming"
@@ -42,6 +151,12 @@ def main():
         "prompt": "Create a brief whitepaper on blockchain technology in supply chain"
     })
     
+    # Test 2b: Sectioned Whitepaper (outline, then sections in parallel)
+    test_endpoint("/whitepaper", {
+        "prompt": "Create a brief whitepaper on blockchain technology in supply chain",
+        "sectioned": True
+    })
+    
     # Test 3: PPT
     test_endpoint("/ppt", {
         "prompt": "Create a 5-slide presentation",
@@ -60,6 +175,31 @@ def main():
         "context": "Leadership lessons from managing remote teams"
     })
     
+    # Test 6: Streaming LinkedIn Post
+    test_stream_endpoint("/linkedin-post/stream", {
+        "prompt": "Share professional insights",
+        "context": "Leadership lessons from managing remote teams"
+    })
+    
+    # Test 6b: Campaign (one shared draft, three channel variants)
+    test_endpoint("/campaign", {
+        "prompt": "Announce a new product",
+        "context": "Smart fitness tracker with AI coaching"
+    })
+    
+    # Test 7: Batch
+    test_batch_endpoint([
+        {"id": "blog", "content_type": "blog-post", "prompt": "Benefits of unit testing"},
+        {"id": "linkedin", "content_type": "linkedin-post", "prompt": "Share a lesson", "context": "Code review culture"},
+        {"id": "invalid", "content_type": "facebook-post", "prompt": "Missing context"}
+    ])
+    
+    # Test 8: Metrics
+    test_metrics_endpoint()
+    
+    # Test 9: Request size limits
+    test_size_limits()
+    
     print("\n" + "=" * 60)
     print("All tests completed!")
     print("=" * 60)
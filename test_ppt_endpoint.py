@@ -1,5 +1,6 @@
 import requests
 import json
+import time
 
 BASE_URL = "http://localhost:5000"
 
@@ -27,13 +28,22 @@ def test_ppt_generation():
                 f.write(response.content)
             print(f"✓ Success! File saved as: {filename}")
             print(f"  File size: {len(response.content)} bytes")
+
+            # The deck is kept in the artifact store and can be downloaded again by ID
+            artifact_id = response.headers.get("X-Artifact-Id")
+            if artifact_id:
+                download = requests.get(f"{BASE_URL}/artifacts/{artifact_id}", timeout=10)
+                if download.status_code == 200 and download.content == response.content:
+                    print(f"✓ Re-downloaded artifact {artifact_id[:12]} without regenerating")
+                else:
+                    print(f"✗ Re-download failed: {download.status_code}")
         else:
             print(f"✗ Error: {response.text}")
     except requests.exceptions.Timeout:
         print("✗ Request timed out (generation took too long)")
     except Exception as e:
         print(f"✗ Error: {e}")
-    
+
     # Test 2: PPT with random template (no template specified)
     print("\n2. Testing with random template (no template specified)...")
     data = {
@@ -83,6 +93,38 @@ def test_ppt_generation():
     except Exception as e:
         print(f"✗ Error: {e}")
     
+    # Test 4: PPT via the job queue
+    print("\n4. Testing via the job queue (POST /jobs)...")
+    data = {
+        "content_type": "ppt",
+        "prompt": "Create a presentation about Cloud Computing",
+        "context": "Compare IaaS, PaaS and SaaS",
+        "template": "elegant_purple"
+    }
+    
+    try:
+        response = requests.post(f"{BASE_URL}/jobs", json=data, timeout=10)
+        print(f"Status Code: {response.status_code}")
+        job = response.json()
+        print(f"  Job ID: {job['id']}")
+        
+        while job["status"] in ("queued", "running"):
+            time.sleep(2)
+            job = requests.get(f"{BASE_URL}/jobs/{job['id']}", timeout=10).json()
+            print(f"  {job['status']} ({job['progress']:.0%}): {job['message']}")
+        
+        response = requests.get(f"{BASE_URL}/jobs/{job['id']}/result", timeout=10)
+        if response.status_code == 200:
+            filename = "test_presentation_4.pptx"
+            with open(filename, "wb") as f:
+                f.write(response.content)
+            print(f"✓ Success! File saved as: {filename}")
+            print(f"  File size: {len(response.content)} bytes")
+        else:
+            print(f"✗ Error: {response.text}")
+    except Exception as e:
+        print(f"✗ Error: {e}")
+    
     print("\n" + "=" * 60)
     print("Testing Complete!")
     print("=" * 60)
@@ -0,0 +1,225 @@
+import asyncio
+import json
+import os
+import time
+from typing import AsyncIterator, NamedTuple
+from pydantic import ValidationError
+from cache import generate_cached, combined_cache_status, GenerationResult
+from metrics import observe_phase
+from models import WhitepaperSection
+from prompts import WHITEPAPER_OUTLINE_SYSTEM_MESSAGE, WHITEPAPER_SECTION_SYSTEM_MESSAGE
+
+# Generate whitepapers as an outline plus parallel sections unless a request says otherwise
+WHITEPAPER_SECTIONED = os.environ.get("WHITEPAPER_SECTIONED", "false").lower() in ("1", "true", "yes")
+# Completion token budgets for the outline and for each section
+WHITEPAPER_OUTLINE_TOKENS = int(os.environ.get("WHITEPAPER_OUTLINE_TOKENS", "1024"))
+WHITEPAPER_SECTION_TOKENS = int(os.environ.get("WHITEPAPER_SECTION_TOKENS", "4096"))
+# Ask the model for JSON-schema structured output (disable for backends without support)
+WHITEPAPER_STRUCTURED_OUTPUT = os.environ.get("WHITEPAPER_STRUCTURED_OUTPUT", "true").lower() in ("1", "true", "yes")
+
+# Sections used when the outline cannot be parsed
+DEFAULT_SECTIONS = ("Executive Summary", "Problem Statement", "Methodology", "Analysis", "Recommendations")
+
+OUTLINE_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "whitepaper_outline",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "title": {"type": "string"},
+                "sections": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "heading": {"type": "string"},
+                            "key_points": {"type": "array", "items": {"type": "string"}}
+                        },
+                        "required": ["heading", "key_points"],
+                        "additionalProperties": False
+                    }
+                }
+            },
+            "required": ["title", "sections"],
+            "additionalProperties": False
+        }
+    }
+}
+
+class Outline(NamedTuple):
+    """Title and ordered sections of a whitepaper"""
+    title: str
+    sections: list[WhitepaperSection]
+
+def default_outline(prompt: str) -> Outline:
+    """Outline with the standard whitepaper sections, used when the model's outline is unusable"""
+    title = prompt[:100] if len(prompt) <= 100 else prompt[:97] + "..."
+    return Outline(title, [WhitepaperSection(heading=heading) for heading in DEFAULT_SECTIONS])
+
+def parse_outline(content: str, prompt: str) -> Outline:
+    """
+    Parse the model's outline, falling back to the standard sections.
+
+    Sections that fail validation are dropped; if none are left the
+    default outline is used.
+    """
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        start, end = content.find("{"), content.rfind("}")
+        try:
+            data = json.loads(content[start:end + 1]) if start != -1 and end > start else None
+        except json.JSONDecodeError:
+            data = None
+    if not isinstance(data, dict) or not isinstance(data.get("sections"), list):
+        print("Could not parse whitepaper outline, using default sections")
+        return default_outline(prompt)
+
+    sections = []
+    for raw in data["sections"]:
+        try:
+            sections.append(WhitepaperSection.model_validate(raw))
+        except ValidationError:
+            continue
+    if not sections:
+        return default_outline(prompt)
+    title = data.get("title") if isinstance(data.get("title"), str) and data["title"].strip() else None
+    return Outline(title or default_outline(prompt).title, sections)
+
+def section_prompt(prompt: str, outline: Outline, index: int) -> str:
+    """User message asking for one section, with the whole outline for consistency"""
+    lines = [prompt, "", f"Whitepaper title: {outline.title}", "Outline:"]
+    for number, section in enumerate(outline.sections, 1):
+        lines.append(f"{number}. {section.heading}")
+        lines.extend(f"   - {point}" for point in section.key_points)
+    section = outline.sections[index]
+    lines.append("")
+    lines.append(f'Write section {index + 1}, "{section.heading}".')
+    return "\n".join(lines)
+
+def stitch_sections(outline: Outline, contents: list[str]) -> str:
+    """Join section texts in outline order into one Markdown document"""
+    parts = [f"# {outline.title}"]
+    for section, content in zip(outline.sections, contents):
+        parts.append(f"## {section.heading}\n\n{content.strip()}")
+    return "\n\n".join(parts)
+
+async def generate_outline(
+    prompt: str,
+    cache_mode: str = "prefer",
+    priority: str = "standard"
+) -> tuple[Outline, GenerationResult]:
+    """Generate and parse the outline of a whitepaper"""
+    start = time.perf_counter()
+    result = await generate_cached(
+        endpoint="whitepaper-outline",
+        prompt=prompt,
+        system_message=WHITEPAPER_OUTLINE_SYSTEM_MESSAGE,
+        max_completion_tokens=WHITEPAPER_OUTLINE_TOKENS,
+        cache_mode=cache_mode,
+        response_format=OUTLINE_RESPONSE_FORMAT if WHITEPAPER_STRUCTURED_OUTPUT else None,
+        priority=priority,
+        route="whitepaper"
+    )
+    outline = parse_outline(result.content, prompt)
+    observe_phase("outline", time.perf_counter() - start, "whitepaper")
+    return outline, result
+
+async def stream_sectioned_whitepaper(
+    prompt: str,
+    cache_mode: str = "prefer",
+    priority: str = "standard"
+) -> AsyncIterator[dict]:
+    """
+    Generate a whitepaper outline, then write its sections concurrently.
+
+    The outline is generated before this returns, so cache misses and
+    scheduler rejections surface before any event is sent.
+
+    Args:
+        prompt: User's prompt for the whitepaper
+        cache_mode: Response cache mode for the outline and each section
+        priority: Upstream scheduler lane for the model calls
+
+    Returns:
+        An iterator yielding {"event": "outline", "title": ..., "sections": [...]},
+        then {"event": "section", "index": n, "heading": ..., "content": ...} as
+        each section completes (in any order), then {"event": "done",
+        "content": ..., "cache": ...} with the sections stitched in order
+
+    Raises:
+        CacheMissError: If cache_mode is "only" and the outline is not cached
+        SchedulerRejected: If the upstream scheduler refuses the outline call
+    """
+    outline, outline_result = await generate_outline(prompt, cache_mode, priority)
+    return section_events(prompt, outline, outline_result, cache_mode, priority)
+
+async def section_events(
+    prompt: str,
+    outline: Outline,
+    outline_result: GenerationResult,
+    cache_mode: str,
+    priority: str
+) -> AsyncIterator[dict]:
+    """Write every section of an outline in parallel (see stream_sectioned_whitepaper)"""
+    yield {"event": "outline", "title": outline.title, "sections": [section.heading for section in outline.sections]}
+
+    async def write_section(index: int) -> tuple[int, GenerationResult]:
+        result = await generate_cached(
+            endpoint="whitepaper-section",
+            prompt=section_prompt(prompt, outline, index),
+            system_message=WHITEPAPER_SECTION_SYSTEM_MESSAGE,
+            max_completion_tokens=WHITEPAPER_SECTION_TOKENS,
+            cache_mode=cache_mode,
+            priority=priority,
+            route="whitepaper"
+        )
+        return index, result
+
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(write_section(index)) for index in range(len(outline.sections))]
+    results: list[GenerationResult | None] = [None] * len(tasks)
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            index, result = await next_done
+            results[index] = result
+            yield {
+                "event": "section",
+                "index": index,
+                "heading": outline.sections[index].heading,
+                "content": result.content
+            }
+    finally:
+        # A failed section or a disconnected client stops the rest
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+    observe_phase("sections", time.perf_counter() - start, "whitepaper")
+
+    yield {
+        "event": "done",
+        "content": stitch_sections(outline, [result.content for result in results]),
+        "cache": combined_cache_status([outline_result, *results])
+    }
+
+async def generate_sectioned_whitepaper(
+    prompt: str,
+    cache_mode: str = "prefer",
+    priority: str = "standard"
+) -> GenerationResult:
+    """
+    Generate a whitepaper as an outline plus sections written in parallel.
+
+    Takes roughly the time of the outline plus the slowest section, and is
+    not limited to a single completion's token budget.
+
+    Returns:
+        GenerationResult with the stitched document and combined cache status
+    """
+    result = None
+    async for event in await stream_sectioned_whitepaper(prompt, cache_mode, priority):
+        if event["event"] == "done":
+            result = GenerationResult(event["content"], event["cache"])
+    return result